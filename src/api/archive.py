@@ -0,0 +1,251 @@
+import datetime
+import gzip
+import heapq
+import itertools
+import json
+import os
+from collections import deque, namedtuple
+from flask import current_app
+from api.models import db, HistorialInventario, ParticionHistorial
+from api.versions import registrar_cambio
+
+# Archivo de historial: los movimientos anteriores al horizonte se mueven a
+# ficheros NDJSON comprimidos con gzip, uno por mes y ejecución
+# (historial-2024-01.20250101T030000123456.ndjson.gz), y se borran de la
+# tabla. La tabla particiones_historial es el manifiesto: sólo se leen los
+# ficheros que aparecen en ella, así un fichero escrito por una ejecución
+# que falló antes del commit se ignora.
+TAMANO_LOTE = 1000
+
+CAMPOS = ("id", "articulo_id", "tipo_movimiento_id", "cantidad", "fecha_movimiento")
+
+FilaArchivada = namedtuple("FilaArchivada", CAMPOS)
+
+
+def directorio_archivo():
+    return current_app.config['ARCHIVO_HISTORIAL_DIR']
+
+
+def inicio_de_mes(fecha):
+    return datetime.datetime(fecha.year, fecha.month, 1)
+
+
+def _mes_siguiente(fecha):
+    return datetime.datetime(fecha.year + fecha.month // 12, fecha.month % 12 + 1, 1)
+
+
+def corte_para(horizonte_dias, ahora=None):
+    # Sólo se archivan meses completos anteriores al horizonte
+    ahora = ahora or datetime.datetime.now()
+    return inicio_de_mes(ahora - datetime.timedelta(days=horizonte_dias))
+
+
+def _escribir(ruta, filas):
+    # Las filas llegan por id; devuelve si también iban en orden de fecha
+    temporal = ruta + ".tmp"
+    por_fecha, anterior = True, None
+    with gzip.open(temporal, "wt", encoding="utf-8") as fichero:
+        for fila in filas:
+            datos = dict(zip(CAMPOS, fila))
+            fecha = datos["fecha_movimiento"]
+            por_fecha = por_fecha and (anterior is None or anterior <= fecha)
+            anterior = fecha
+            datos["fecha_movimiento"] = fecha.isoformat()
+            fichero.write(json.dumps(datos, ensure_ascii=False) + "\n")
+    os.replace(temporal, ruta)
+    return por_fecha
+
+
+def _archivar_mes(directorio, inicio, fin, marca):
+    rango = (HistorialInventario.fecha_movimiento >= inicio, HistorialInventario.fecha_movimiento < fin)
+    resumen = db.session.execute(
+        db.select(db.func.count(), db.func.min(HistorialInventario.id), db.func.max(HistorialInventario.id),
+                  db.func.sum(HistorialInventario.cantidad),
+                  db.func.min(HistorialInventario.fecha_movimiento), db.func.max(HistorialInventario.fecha_movimiento))
+        .where(*rango)
+    ).one()
+    filas, primer_id, ultimo_id, cantidad, desde, hasta = resumen
+    if not filas:
+        return None
+
+    # Los movimientos que lleguen mientras tanto tienen id mayor: no se
+    # escriben y tampoco se borran.
+    rango = rango + (HistorialInventario.id <= ultimo_id,)
+    nombre = f"historial-{inicio:%Y-%m}.{marca}.ndjson.gz"
+    consulta = db.select(*[getattr(HistorialInventario, campo) for campo in CAMPOS]).where(*rango)
+    resultado = db.session.execute(consulta.order_by(HistorialInventario.id).execution_options(yield_per=TAMANO_LOTE))
+    try:
+        por_fecha = _escribir(os.path.join(directorio, nombre), resultado)
+    finally:
+        resultado.close()
+
+    particion = ParticionHistorial(periodo=f"{inicio:%Y-%m}", fichero=nombre, filas=filas, cantidad=cantidad,
+                                   desde=desde, hasta=hasta, id_desde=primer_id, id_hasta=ultimo_id,
+                                   por_fecha=por_fecha)
+    db.session.add(particion)
+    # Los artículos servidos con ?expand=historial cambian
+    afectados = db.session.scalars(db.select(HistorialInventario.articulo_id).where(*rango).distinct()).all()
+    db.session.execute(db.delete(HistorialInventario).where(*rango))
+    registrar_cambio("articulos", *afectados)
+    db.session.commit()
+    return particion
+
+
+def archivar_historial(corte, directorio=None):
+    # Archiva mes a mes, con un commit por mes, los movimientos con
+    # fecha_movimiento < corte. Devuelve las particiones creadas.
+    directorio = directorio or directorio_archivo()
+    os.makedirs(directorio, exist_ok=True)
+    primera = db.session.execute(
+        db.select(db.func.min(HistorialInventario.fecha_movimiento))
+        .where(HistorialInventario.fecha_movimiento < corte)
+    ).scalar()
+    if primera is None:
+        return []
+    marca = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    creadas = []
+    inicio = inicio_de_mes(primera)
+    while inicio < corte:
+        fin = min(_mes_siguiente(inicio), corte)
+        particion = _archivar_mes(directorio, inicio, fin, marca)
+        if particion is not None:
+            creadas.append(particion)
+        inicio = fin
+    return creadas
+
+
+def _ingenua(fecha):
+    # Misma comparación que hace SQLite con las fechas guardadas sin zona
+    return fecha.replace(tzinfo=None) if fecha is not None else None
+
+
+def fin_del_archivo():
+    # Fecha del movimiento archivado más reciente (None si no hay archivo)
+    return db.session.execute(db.select(db.func.max(ParticionHistorial.hasta))).scalar()
+
+
+def alcanza_archivo(desde):
+    # ¿Un rango que empieza en `desde` incluye movimientos archivados?
+    fin = fin_del_archivo()
+    return fin is not None and (desde is None or _ingenua(desde) <= fin)
+
+
+def _particiones(desde=None, hasta=None):
+    consulta = db.select(ParticionHistorial).order_by(ParticionHistorial.desde, ParticionHistorial.fichero)
+    if desde is not None:
+        consulta = consulta.where(ParticionHistorial.hasta >= desde)
+    if hasta is not None:
+        consulta = consulta.where(ParticionHistorial.desde <= hasta)
+    return db.session.scalars(consulta).all()
+
+
+def _leer_fichero(fichero, desde=None, hasta=None, articulo_id=None, tipo_movimiento_id=None, incluir_desde=True):
+    with gzip.open(os.path.join(directorio_archivo(), fichero), "rt", encoding="utf-8") as entrada:
+        for linea in entrada:
+            datos = json.loads(linea)
+            if articulo_id is not None and datos["articulo_id"] != articulo_id:
+                continue
+            if tipo_movimiento_id is not None and datos["tipo_movimiento_id"] != tipo_movimiento_id:
+                continue
+            fecha = datetime.datetime.fromisoformat(datos["fecha_movimiento"])
+            if desde is not None and (fecha < desde or (fecha == desde and not incluir_desde)):
+                continue
+            if hasta is not None and fecha > hasta:
+                continue
+            datos["fecha_movimiento"] = fecha
+            yield FilaArchivada(**datos)
+
+
+def leer_archivo(desde=None, hasta=None, articulo_id=None, tipo_movimiento_id=None, incluir_desde=True):
+    # Recorre, en orden de fecha de partición, los movimientos archivados
+    # con desde <= fecha <= hasta (desde < fecha si incluir_desde=False).
+    desde, hasta = _ingenua(desde), _ingenua(hasta)
+    for particion in _particiones(desde, hasta):
+        yield from _leer_fichero(particion.fichero, desde, hasta, articulo_id, tipo_movimiento_id, incluir_desde)
+
+
+def _rango(particion, orden):
+    if orden.por_id:
+        return particion.id_desde, particion.id_hasta
+    return particion.desde, particion.hasta
+
+
+def _grupos(particiones, orden):
+    # Particiones en el orden de la lista, juntas cuando sus rangos se
+    # solapan (p. ej. dos ejecuciones sobre el mismo mes): sólo las de un
+    # mismo grupo hay que mezclarlas, y un grupo no se abre hasta que se
+    # han agotado los anteriores.
+    if orden.descendente:
+        particiones = sorted(particiones, key=lambda p: _rango(p, orden)[1], reverse=True)
+    else:
+        particiones = sorted(particiones, key=lambda p: _rango(p, orden)[0])
+    grupo, borde = [], None
+    for particion in particiones:
+        inicio, fin = _rango(particion, orden)
+        if grupo and (fin < borde if orden.descendente else inicio > borde):
+            yield grupo
+            grupo = []
+        if not grupo:
+            borde = inicio if orden.descendente else fin
+        grupo.append(particion)
+        borde = min(borde, inicio) if orden.descendente else max(borde, fin)
+    if grupo:
+        yield grupo
+
+
+def _clave_tramo(orden, clave):
+    # (valor, id) de un cursor o de una fila de la tabla, comparable con las
+    # filas archivadas
+    if clave is None:
+        return None
+    valor, ultimo_id = clave
+    return (ultimo_id, ultimo_id) if orden.por_id else (_ingenua(valor), ultimo_id)
+
+
+def _en_tramo(particion, orden, inicio, fin):
+    # ¿El rango del fichero llega al tramo de la lista entre inicio y fin?
+    primero, ultimo = _rango(particion, orden)
+    if orden.descendente:
+        primero, ultimo = ultimo, primero
+        return (inicio is None or ultimo <= inicio[0]) and (fin is None or primero >= fin[0])
+    return (inicio is None or ultimo >= inicio[0]) and (fin is None or primero <= fin[0])
+
+
+def pagina_archivada(orden, cursor_clave, limite, tope=None, desde=None, hasta=None, **filtros):
+    # Hasta limite + 1 filas archivadas en el orden de la lista, después del
+    # cursor (valor, id) y antes de `tope`, la clave de la fila limite + 1
+    # de la tabla cuando ésta ya llena la página: lo que venga detrás no
+    # entra. Sólo se abren los ficheros cuyo rango del manifiesto cae en ese
+    # tramo, y se leen en el orden en que se escribieron (por id, y por
+    # fecha si el manifiesto lo indica), parando al salir del tramo. En
+    # orden descendente se guardan sólo las últimas limite + 1 del tramo.
+    clave = lambda fila: (getattr(fila, orden.columna.key), fila.id)
+    desde, hasta = _ingenua(desde), _ingenua(hasta)
+    inicio, fin = _clave_tramo(orden, cursor_clave), _clave_tramo(orden, tope)
+    particiones = [p for p in _particiones(desde, hasta) if _en_tramo(p, orden, inicio, fin)]
+
+    def ascendentes(particion):
+        filas = _leer_fichero(particion.fichero, desde, hasta, **filtros)
+        if orden.por_id or particion.por_fecha:
+            return filas
+        # Fichero con movimientos fuera de orden de fecha
+        return iter(sorted(filas, key=clave))
+
+    def ordenadas(particion):
+        # Filas del tramo en orden ascendente: en la lista van detrás del
+        # cursor y delante del tope, que en orden descendente se invierten
+        menor, mayor = (fin, inicio) if orden.descendente else (inicio, fin)
+        filas = ascendentes(particion)
+        if menor is not None:
+            filas = itertools.dropwhile(lambda fila: clave(fila) <= menor, filas)
+        if mayor is not None:
+            filas = itertools.takewhile(lambda fila: clave(fila) < mayor, filas)
+        if orden.descendente:
+            return reversed(deque(filas, maxlen=limite + 1))
+        return filas
+
+    def recorrer():
+        for grupo in _grupos(particiones, orden):
+            yield from heapq.merge(*[ordenadas(p) for p in grupo], key=clave, reverse=orden.descendente)
+
+    return list(itertools.islice(recorrer(), limite + 1))
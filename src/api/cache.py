@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+
+class CacheReferencia:
+    # Caché LRU acotada y local al proceso para tablas pequeñas que casi no
+    # cambian. Se invalida explícitamente desde los handlers de escritura;
+    # otros procesos/workers no ven esa invalidación, por eso sólo se guardan
+    # datos de referencia y nunca stock.
+    def __init__(self, nombre, capacidad=1024):
+        self.nombre = nombre
+        self.capacidad = capacidad
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        # Última versión de la colección vista en la base de datos
+        # (sincronizar), para detectar escrituras de otros procesos
+        self.version = None
+
+    def obtener(self, clave, cargar):
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+            self.fallos += 1
+            generacion = self._generacion
+        valor = cargar()
+        if valor is not None:
+            self._guardar({clave: valor}, generacion)
+        return valor
+
+    def obtener_varios(self, claves, cargar_varios):
+        # Igual que obtener() pero resolviendo todos los fallos con una sola
+        # llamada a cargar_varios(claves_faltantes) -> {clave: valor}.
+        encontrados = {}
+        with self._lock:
+            for clave in claves:
+                if clave in self._datos:
+                    self._datos.move_to_end(clave)
+                    encontrados[clave] = self._datos[clave]
+            faltantes = [clave for clave in claves if clave not in encontrados]
+            self.aciertos += len(encontrados)
+            self.fallos += len(faltantes)
+            generacion = self._generacion
+        if faltantes:
+            cargados = cargar_varios(faltantes)
+            self._guardar(cargados, generacion)
+            encontrados.update(cargados)
+        return encontrados
+
+    def _guardar(self, valores, generacion):
+        with self._lock:
+            # Si hubo una invalidación mientras se cargaba, el valor puede
+            # estar desactualizado y no se guarda.
+            if generacion != self._generacion:
+                return
+            self._datos.update(valores)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def invalidar(self):
+        with self._lock:
+            self._datos.clear()
+            self._generacion += 1
+            self.invalidaciones += 1
+
+    def sincronizar(self, version):
+        with self._lock:
+            anterior, self.version = self.version, version
+        if anterior is not None and anterior != version:
+            self.invalidar()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "capacidad": self.capacidad,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "invalidaciones": self.invalidaciones
+            }
+
+
+cache_tipos_movimiento = CacheReferencia("tipos_movimiento")
+cache_categorias = CacheReferencia("categorias")
+cache_proveedores = CacheReferencia("proveedores")
+
+# Cuerpos de respuesta ya codificados (api/compression.py). Aquí sí hay
+# stock, pero la clave lleva la versión de la base de datos, así que una
+# entrada nunca se sirve después de una escritura en otro proceso.
+cache_respuestas = CacheReferencia("respuestas", capacidad=256)
+
+CACHES = (cache_tipos_movimiento, cache_categorias, cache_proveedores, cache_respuestas)
+
+# Cachés que se comparan con la versión de su colección (el mismo nombre)
+# en api/versions.py:sincronizar_caches
+REFERENCIAS = (cache_tipos_movimiento, cache_categorias, cache_proveedores)
+
+
+def invalidar_caches():
+    for cache in CACHES:
+        cache.invalidar()
+        cache.version = None
+
+
+def metricas_caches():
+    return {cache.nombre: cache.metricas() for cache in CACHES}
@@ -0,0 +1,103 @@
+import gzip
+from functools import wraps
+from flask import Response, current_app, g, request
+from flask_restful.representations.json import output_json
+from flask_restful.utils import unpack
+from api.cache import cache_respuestas
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional: sin brotli sólo se ofrece gzip
+    brotli = None
+
+# Compresión negociada con Accept-Encoding (br si está instalado brotli,
+# gzip si no) para las respuestas de texto de la API. Las respuestas en
+# streaming (exportaciones, SSE) se dejan como están para no retenerlas.
+TIPOS_COMPRIMIBLES = {"application/json", "application/x-ndjson", "text/csv", "text/html", "text/plain"}
+
+
+def codificaciones():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negociar():
+    # Codificación preferida por el cliente entre las disponibles, o None
+    if not current_app.config['COMPRESION']:
+        return None
+    return request.accept_encodings.best_match(codificaciones())
+
+
+def comprimir_cuerpo(cuerpo, codificacion):
+    if codificacion == "br":
+        return brotli.compress(cuerpo, quality=current_app.config['COMPRESION_NIVEL_BROTLI'])
+    # mtime=0: mismos bytes para el mismo cuerpo
+    return gzip.compress(cuerpo, compresslevel=current_app.config['COMPRESION_NIVEL_GZIP'], mtime=0)
+
+
+def _marcar(respuesta):
+    respuesta.vary.add("Accept-Encoding")
+    # Como hace nginx: el ETag de una respuesta comprimida pasa a ser débil.
+    # El 304 sigue funcionando porque condicional() compara en modo débil.
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(etag, weak=True)
+
+
+def registrar_compresion(app):
+    @app.after_request
+    def comprimir(respuesta):
+        if respuesta.mimetype not in TIPOS_COMPRIMIBLES or respuesta.is_streamed or respuesta.direct_passthrough:
+            return respuesta
+        if "Content-Encoding" in respuesta.headers:
+            # Ya comprimida (respuesta_en_cache)
+            _marcar(respuesta)
+            return respuesta
+        if respuesta.status_code != 200 or len(respuesta.get_data()) < app.config['COMPRESION_MINIMO_BYTES']:
+            return respuesta
+        respuesta.vary.add("Accept-Encoding")
+        codificacion = negociar()
+        if codificacion is None:
+            return respuesta
+        respuesta.set_data(comprimir_cuerpo(respuesta.get_data(), codificacion))
+        respuesta.headers["Content-Encoding"] = codificacion
+        _marcar(respuesta)
+        return respuesta
+
+
+def respuesta_en_cache(funcion):
+    # Para los GET de colecciones, debajo de @condicional: guarda el cuerpo
+    # JSON ya codificado y comprimido por (recurso y versión, parámetros,
+    # codificación). Un acierto no ejecuta el handler, ni serializa, ni
+    # comprime. Como la versión sale de la base de datos, una escritura en
+    # cualquier worker hace que la entrada deje de usarse; la LRU acotada
+    # descarta las versiones viejas.
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        representacion = g.get("representacion")
+        if representacion is None:
+            return funcion(*args, **kwargs)
+        codificacion = negociar()
+        clave = (request.path, representacion, tuple(sorted(request.args.items(multi=True))), codificacion)
+        fallo = {}
+
+        def cargar():
+            datos, codigo, cabeceras = unpack(funcion(*args, **kwargs))
+            respuesta = output_json(datos, codigo, cabeceras)
+            # Lo mismo que añade Api.make_response para application/json
+            respuesta.headers["Content-Type"] = "application/json"
+            if codigo != 200:
+                fallo["respuesta"] = respuesta
+                return None
+            cuerpo = respuesta.get_data()
+            if codificacion is not None and len(cuerpo) >= current_app.config['COMPRESION_MINIMO_BYTES']:
+                cuerpo = comprimir_cuerpo(cuerpo, codificacion)
+                respuesta.headers["Content-Encoding"] = codificacion
+            respuesta.headers.pop("Content-Length", None)
+            return cuerpo, list(respuesta.headers.items())
+
+        entrada = cache_respuestas.obtener(clave, cargar)
+        if entrada is None:
+            return fallo["respuesta"]
+        cuerpo, cabeceras = entrada
+        return Response(cuerpo, status=200, headers=cabeceras)
+    return envoltura
@@ -1,7 +1,79 @@
 import datetime
-from flask import Response, json
-from flask_restful import Resource, reqparse, abort, fields, marshal_with
+import io
+from concurrent.futures import TimeoutError as TiempoAgotado
+from flask import Response, current_app, g, json, request
+from sqlalchemy import Select
+from flask_restful import Resource, reqparse, abort, fields, inputs
 from api.models import db, Articulo, Categoria, Proveedor,TipoMovimiento,HistorialInventario  
+from api.pagination import resolver_orden, resolver_limite, aplicar_cursor, decodificar_cursor, cortar_pagina, cabeceras_paginacion, cabeceras_desplazamiento
+from api.export import exportar, FORMATOS
+from api.importer import importar_articulos, ErrorImportacion
+from api.archive import alcanza_archivo, leer_archivo, pagina_archivada
+from api.movements import registrar_lote, aplicar_delta, articulo_existe, obtener_tipo, TAMANO_MAXIMO_LOTE
+from api.versions import condicional, registrar_cambio
+from api.search import buscar_articulos, terminos
+from api.forecast import prevision_stock, VENTANA_DIAS, VENTANA_MAXIMA_DIAS, PLAZO_ENTREGA_DIAS, COBERTURA_DIAS
+from api.snapshots import registrar_snapshot, stock_a_fecha, MOTIVO_ALTA, MOTIVO_EDICION
+from api.serializers import serializar, serializar_con
+from api.fieldsets import campos_solicitados, columnas, expansiones_solicitadas
+from api.expansion import colecciones_expandidas, opciones_carga, cargar_historial, HISTORIAL_POR_DEFECTO, HISTORIAL_MAXIMO
+from api.group_commit import ColaLlena
+from api.rollups import sumar_movimientos, restar_movimientos, serie_movimientos, retroceder, contar_periodos, GRANULARIDADES, PERIODOS_POR_DEFECTO, MAXIMO_PERIODOS
+from api.compression import respuesta_en_cache
+from api.feed import anotar_stock, anotar_movimientos, flujo_eventos
+from api.cache import cache_categorias, cache_proveedores, cache_tipos_movimiento, metricas_caches
+
+# Parámetros comunes de las listas paginadas (keyset)
+paginacion_args = reqparse.RequestParser()
+paginacion_args.add_argument("limit", type=int, location="args")
+paginacion_args.add_argument("cursor", type=str, location="args")
+paginacion_args.add_argument("sort", type=str, location="args")
+
+
+def listar_paginado(consulta, args, columnas_orden, columna_id, por_defecto="id", archivadas=None):
+    orden = resolver_orden(args["sort"], columnas_orden, columna_id, por_defecto)
+    limite = resolver_limite(args["limit"])
+    if isinstance(consulta, Select):
+        # Con ?fields= puede faltar la columna de orden, necesaria para el cursor
+        seleccionadas = set(consulta.selected_columns.keys())
+        faltantes = [c for c in (orden.columna, orden.columna_id) if c.key not in seleccionadas]
+        if faltantes:
+            consulta = consulta.add_columns(*faltantes)
+    consulta = aplicar_cursor(consulta, orden, args["cursor"], limite)
+    if isinstance(consulta, Select):
+        # select() de columnas: filas ligeras sin identity map del ORM
+        filas = db.session.execute(consulta).all()
+    else:
+        filas = consulta.all()
+    if archivadas is not None:
+        # Filas de otra fuente (archivo) con el mismo orden: sólo las que van
+        # delante de la fila limite + 1 de la tabla, si la hay. Se mezclan y
+        # se vuelve a cortar a limite + 1
+        cursor = decodificar_cursor(orden, args["cursor"]) if args["cursor"] else None
+        clave = lambda fila: (getattr(fila, orden.columna.key), getattr(fila, orden.columna_id.key))
+        tope = clave(filas[limite]) if len(filas) > limite else None
+        filas = sorted(filas + archivadas(orden, cursor, limite, tope), key=clave, reverse=orden.descendente)[:limite + 1]
+    filas, siguiente = cortar_pagina(filas, orden, limite)
+    return filas, 200, cabeceras_paginacion(siguiente)
+
+
+# Las tablas de referencia se sirven desde la caché ya serializadas; la
+# clave de una lista son los argumentos ya interpretados.
+# Con la versión de condicional() en la clave, una entrada cargada por este
+# proceso nunca se sirve con el ETag de una escritura hecha en otro.
+def listar_en_cache(cache, consulta, args, columnas_orden, columna_id, campos):
+    def cargar():
+        filas, codigo, cabeceras = listar_paginado(consulta, args, columnas_orden, columna_id)
+        return [serializar(fila, campos) for fila in filas], codigo, cabeceras
+    return cache.obtener(("lista", g.get("representacion")) + tuple(sorted(args.items())), cargar)
+
+
+def obtener_en_cache(cache, modelo, item_id, campos):
+    def cargar():
+        item = modelo.query.filter_by(id=item_id).first()
+        return serializar(item, campos) if item else None
+    return cache.obtener(("id", item_id, g.get("representacion")), cargar)
+
 
 articulo_args = reqparse.RequestParser()
 articulo_args.add_argument("nombre", type=str, required=True, help="El nombre del artículo es obligatorio")
@@ -21,8 +93,56 @@ articulo_fields = {
     "precio": fields.Float
 }
 
+# ?expand=: relaciones que se pueden incluir en la respuesta. Se completa
+# más abajo, cuando ya están definidos los campos de cada recurso.
+articulo_expansiones = {}
+
+expansion_args = reqparse.RequestParser()
+expansion_args.add_argument("historial_limit", type=int, location="args", default=HISTORIAL_POR_DEFECTO)
+
+articulo_lista_args = paginacion_args.copy()
+articulo_lista_args.add_argument("categoria_id", type=int, location="args")
+articulo_lista_args.add_argument("proveedor_id", type=int, location="args")
+articulo_lista_args.add_argument("stock_min", type=int, location="args")
+articulo_lista_args.add_argument("stock_max", type=int, location="args")
+articulo_lista_args.add_argument("historial_limit", type=int, location="args", default=HISTORIAL_POR_DEFECTO)
+
+
+
+def consulta_expandida(expansiones):
+    # Con expansiones se cargan entidades (para las relaciones); sin ellas,
+    # sólo las columnas pedidas
+    if expansiones:
+        return Articulo.query.options(*opciones_carga(expansiones))
+    return db.select(*columnas(Articulo, campos_solicitados(articulo_fields)))
+
+def expandir_historial(articulos, expansiones, limite):
+    if "historial" not in expansiones:
+        return
+    if not 1 <= limite <= HISTORIAL_MAXIMO:
+        abort(400, message=f"historial_limit debe estar entre 1 y {HISTORIAL_MAXIMO}")
+    cargar_historial(articulos, limite)
+
+def filtrar_articulos(consulta, args):
+    if args["categoria_id"] is not None:
+        consulta = consulta.where(Articulo.categoria_id == args["categoria_id"])
+    if args["proveedor_id"] is not None:
+        consulta = consulta.where(Articulo.proveedor_id == args["proveedor_id"])
+    if args["stock_min"] is not None:
+        consulta = consulta.where(Articulo.stock >= args["stock_min"])
+    if args["stock_max"] is not None:
+        consulta = consulta.where(Articulo.stock <= args["stock_max"])
+    return consulta
+
+articulo_orden = {
+    "id": Articulo.id,
+    "nombre": Articulo.nombre,
+    "stock": Articulo.stock,
+    "precio": Articulo.precio
+}
+
 class ArticulosResource(Resource):
-    @marshal_with(articulo_fields)
+    @serializar_con(articulo_fields)
     def post(self):
         args = articulo_args.parse_args()
         nuevo_articulo = Articulo(  
@@ -34,23 +154,185 @@ class ArticulosResource(Resource):
             precio=args["precio"]
         )
         db.session.add(nuevo_articulo)
+        db.session.flush()
+        registrar_snapshot(nuevo_articulo.id, nuevo_articulo.stock, MOTIVO_ALTA)
+        anotar_stock([(nuevo_articulo.id, nuevo_articulo.stock, None)])
+        registrar_cambio("articulos", nuevo_articulo.id)
         db.session.commit()
         return nuevo_articulo, 201
     
-    @marshal_with(articulo_fields)
+    @condicional("articulos", adicionales=colecciones_expandidas)
+    @respuesta_en_cache
+    @serializar_con(articulo_fields, parciales=True, expansiones=articulo_expansiones)
+    def get(self):
+        args = articulo_lista_args.parse_args()
+        expansiones = expansiones_solicitadas(articulo_expansiones)
+        consulta = filtrar_articulos(consulta_expandida(expansiones), args)
+        filas, codigo, cabeceras = listar_paginado(consulta, args, articulo_orden, Articulo.id)
+        expandir_historial(filas, expansiones, args["historial_limit"])
+        return filas, codigo, cabeceras
+
+busqueda_args = reqparse.RequestParser()
+busqueda_args.add_argument("q", type=str, location="args", required=True, help="El texto a buscar es obligatorio")
+busqueda_args.add_argument("limit", type=int, location="args")
+busqueda_args.add_argument("offset", type=int, location="args", default=0)
+
+class ArticulosBusquedaResource(Resource):
+    @condicional("articulos")
+    @serializar_con(articulo_fields, parciales=True)
+    def get(self):
+        args = busqueda_args.parse_args()
+        palabras = terminos(args["q"])
+        if not palabras:
+            abort(400, message="El texto a buscar es obligatorio")
+        if args["offset"] < 0:
+            abort(400, message="El desplazamiento no puede ser negativo")
+        limite = resolver_limite(args["limit"])
+        consulta = db.select(*columnas(Articulo, campos_solicitados(articulo_fields)))
+        filas = buscar_articulos(consulta, palabras, limite, args["offset"])
+        hay_mas = len(filas) > limite
+        return filas[:limite], 200, cabeceras_desplazamiento(args["offset"] + limite if hay_mas else None)
+
+class ArticulosImportResource(Resource):
+    # CSV en el cuerpo (text/csv) o como fichero "archivo" en multipart;
+    # se lee en streaming. Ver api/importer.py para el formato.
+    def post(self):
+        if request.mimetype == "multipart/form-data":
+            archivo = request.files.get("archivo")
+            if archivo is None:
+                abort(400, message="Falta el fichero CSV (campo archivo)")
+            flujo = archivo.stream
+        else:
+            flujo = io.BufferedReader(request.stream)
+        lineas = io.TextIOWrapper(flujo, encoding="utf-8-sig", newline="")
+        try:
+            resumen = importar_articulos(lineas)
+        except ErrorImportacion as error:
+            # Con resumen: los bloques anteriores al error ya se confirmaron
+            if error.resumen is not None:
+                abort(400, message=str(error), resumen=error.resumen)
+            abort(400, message=str(error))
+        except UnicodeDecodeError:
+            abort(400, message="El fichero debe estar codificado en UTF-8")
+        return resumen, 207 if resumen["con_error"] else 200
+
+valoracion_args = reqparse.RequestParser()
+valoracion_args.add_argument("agrupar", type=str, location="args", default="")
+for argumento in ("categoria_id", "proveedor_id", "stock_min", "stock_max"):
+    valoracion_args.add_argument(argumento, type=int, location="args")
+
+# Dimensiones por las que se puede agrupar la valoración
+valoracion_grupos = {
+    "categoria": (Articulo.categoria_id, Categoria.categoria, Categoria),
+    "proveedor": (Articulo.proveedor_id, Proveedor.proveedor, Proveedor)
+}
+
+class ArticulosValoracionResource(Resource):
+    @condicional(("articulos", "categorias", "proveedores"))
+    def get(self):
+        args = valoracion_args.parse_args()
+        grupos = [grupo.strip() for grupo in args["agrupar"].split(",") if grupo.strip()]
+        for grupo in grupos:
+            if grupo not in valoracion_grupos:
+                abort(400, message=f"No se puede agrupar por {grupo}. Opciones: categoria, proveedor")
+
+        columnas = []
+        for grupo in grupos:
+            columna_id, columna_nombre, _ = valoracion_grupos[grupo]
+            columnas += [columna_id, columna_nombre]
+        consulta = db.select(
+            *columnas,
+            db.func.count(Articulo.id).label("articulos"),
+            db.func.coalesce(db.func.sum(Articulo.stock), 0).label("unidades"),
+            db.func.coalesce(db.func.sum(Articulo.stock * Articulo.precio), 0).label("valor")
+        ).select_from(Articulo)
+        for grupo in grupos:
+            columna_id, _, modelo = valoracion_grupos[grupo]
+            consulta = consulta.outerjoin(modelo, modelo.id == columna_id)
+        consulta = filtrar_articulos(consulta, args)
+        if grupos:
+            consulta = consulta.group_by(*columnas).order_by(*columnas[::2])
+
+        filas = db.session.execute(consulta).mappings().all()
+        return [{**fila, "valor": round(float(fila["valor"]), 2)} for fila in filas], 200
+
+prevision_args = reqparse.RequestParser()
+prevision_args.add_argument("ventana", type=int, location="args", default=VENTANA_DIAS)
+prevision_args.add_argument("plazo", type=int, location="args", default=PLAZO_ENTREGA_DIAS)
+prevision_args.add_argument("cobertura", type=int, location="args", default=COBERTURA_DIAS)
+prevision_args.add_argument("reponer", type=inputs.boolean, location="args", default=False)
+prevision_args.add_argument("limit", type=int, location="args")
+for argumento in ("categoria_id", "proveedor_id", "stock_min", "stock_max"):
+    prevision_args.add_argument(argumento, type=int, location="args")
+
+class ArticulosPrevisionResource(Resource):
+    # Sin ETag: depende de la fecha actual además de los datos
+    def get(self):
+        args = prevision_args.parse_args()
+        if not 1 <= args["ventana"] <= VENTANA_MAXIMA_DIAS:
+            abort(400, message=f"La ventana debe estar entre 1 y {VENTANA_MAXIMA_DIAS} días")
+        if args["plazo"] < 0 or args["cobertura"] < 0:
+            abort(400, message="El plazo y la cobertura no pueden ser negativos")
+        previsiones = prevision_stock(args["ventana"], args["plazo"], args["cobertura"],
+                                      filtrar=lambda consulta: filtrar_articulos(consulta, args))
+        if args["reponer"]:
+            previsiones = [prevision for prevision in previsiones if prevision["reponer"]]
+        # Primero los que se agotan antes; los que no tienen consumo, al final
+        previsiones.sort(key=lambda prevision: (prevision["dias_hasta_agotar"] is None, prevision["dias_hasta_agotar"] or 0))
+        if args["limit"] is not None:
+            previsiones = previsiones[:resolver_limite(args["limit"])]
+        return previsiones, 200
+
+cambios_args = reqparse.RequestParser()
+cambios_args.add_argument("Last-Event-ID", type=str, location="headers", dest="ultimo_id")
+# Para la primera conexión: EventSource sólo envía la cabecera al reconectar
+cambios_args.add_argument("last_event_id", type=str, location="args")
+
+class ArticulosCambiosResource(Resource):
+    # Server-Sent Events: un evento "stock" por cambio confirmado con
+    # {articulo_id, stock, movimiento_id}. La conexión se cierra tras
+    # FEED_DURACION_MAXIMA_S y el cliente se reconecta con Last-Event-ID.
     def get(self):
-        articulos = Articulo.query.all()  
-        return articulos
+        args = cambios_args.parse_args()
+        feed = current_app.extensions["feed_stock"]
+        if not feed.abrir():
+            abort(503, message="Demasiadas conexiones abiertas al feed, reintente más tarde")
+        ultimo_id = args["ultimo_id"] or args["last_event_id"]
+        desde = feed.posicion(ultimo_id)
+        flujo = flujo_eventos(feed, desde, current_app.config["FEED_LATIDO_S"],
+                               current_app.config["FEED_DURACION_MAXIMA_S"])
+        respuesta = Response(flujo, mimetype="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        # Al cerrar la respuesta, aunque el cliente se vaya antes del primer
+        # evento (entonces el generador ni siquiera empieza)
+        respuesta.call_on_close(feed.cerrar)
+        return respuesta
+
+exportar_args = reqparse.RequestParser()
+exportar_args.add_argument("formato", type=str, location="args", default="ndjson", choices=list(FORMATOS), help="Formato no soportado: {error_msg}")
+
+class ArticulosExportResource(Resource):
+    def get(self):
+        args = exportar_args.parse_args()
+        consulta = db.select(*[getattr(Articulo, campo) for campo in articulo_fields]).order_by(Articulo.id)
+        return exportar(consulta, args["formato"], "articulos")
 
 class ArticuloResource(Resource):
-    @marshal_with(articulo_fields)
+    @condicional("articulos", "articulo_id", adicionales=colecciones_expandidas)
+    @serializar_con(articulo_fields, parciales=True, expansiones=articulo_expansiones)
     def get(self, articulo_id):
-        articulo = Articulo.query.filter_by(id=articulo_id).first()  
+        expansiones = expansiones_solicitadas(articulo_expansiones)
+        consulta = consulta_expandida(expansiones)
+        if expansiones:
+            articulo = consulta.filter(Articulo.id == articulo_id).first()
+        else:
+            articulo = db.session.execute(consulta.where(Articulo.id == articulo_id)).first()
         if not articulo:
             abort(404, message="Artículo no encontrado")
+        expandir_historial([articulo], expansiones, expansion_args.parse_args()["historial_limit"])
         return articulo, 200
     
-    @marshal_with(articulo_fields)
+    @serializar_con(articulo_fields)
     def patch(self, articulo_id):
         args = articulo_args.parse_args()
         articulo = Articulo.query.filter_by(id=articulo_id).first()  
@@ -60,21 +342,47 @@ class ArticuloResource(Resource):
         articulo.descripcion = args["descripcion"]
         articulo.categoria_id = args["categoria_id"]
         articulo.proveedor_id = args["proveedor_id"]
+        if articulo.stock != args["stock"]:
+            registrar_snapshot(articulo_id, args["stock"], MOTIVO_EDICION)
+            anotar_stock([(articulo_id, args["stock"], None)])
         articulo.stock = args["stock"]
         articulo.precio = args["precio"]
+        registrar_cambio("articulos", articulo_id)
         db.session.commit()
         return articulo, 200
     
-    @marshal_with(articulo_fields)
+    @serializar_con(articulo_fields)
     def delete(self, articulo_id):
         articulo = Articulo.query.filter_by(id=articulo_id).first()  
         if not articulo:
             abort(404, message="Artículo no encontrado")
         db.session.delete(articulo)
+        registrar_cambio("articulos", articulo_id)
         db.session.commit()
         return {"message": "Artículo eliminado"}, 200
 
 
+stock_fecha_args = reqparse.RequestParser()
+stock_fecha_args.add_argument("fecha", type=inputs.datetime_from_iso8601, location="args", required=True, help="La fecha es obligatoria (ISO 8601)")
+
+class ArticuloStockResource(Resource):
+    def get(self, articulo_id):
+        args = stock_fecha_args.parse_args()
+        if not articulo_existe(articulo_id):
+            abort(404, message="Artículo no encontrado")
+        resultado = stock_a_fecha(articulo_id, args["fecha"])
+        if resultado is None:
+            abort(404, message="El artículo no existía en esa fecha")
+        snapshot = resultado["snapshot"]
+        return {
+            "articulo_id": articulo_id,
+            "fecha": args["fecha"].isoformat(),
+            "stock": resultado["stock"],
+            "snapshot": snapshot.isoformat() if snapshot else None,
+            "movimientos_aplicados": resultado["movimientos_aplicados"]
+        }, 200
+
+
 categoria_args = reqparse.RequestParser()
 categoria_args.add_argument("categoria", type=str, required=True, help="El nombre de la categoría es obligatorio")
 
@@ -86,44 +394,55 @@ categoria_fields = {
 
 
 class CategoriasResource(Resource):
-    @marshal_with(categoria_fields)
+    @serializar_con(categoria_fields)
     def post(self):
         args = categoria_args.parse_args()
         nueva_categoria = Categoria(categoria=args["categoria"])  
         db.session.add(nueva_categoria)
+        db.session.flush()
+        registrar_cambio("categorias", nueva_categoria.id)
         db.session.commit()
+        cache_categorias.invalidar()
         return nueva_categoria, 201
     
-    @marshal_with(categoria_fields)
+    @condicional("categorias")
+    @respuesta_en_cache
+    @serializar_con(categoria_fields, parciales=True)
     def get(self):
-        categorias = Categoria.query.all() 
-        return categorias
+        args = paginacion_args.parse_args()
+        columnas = {"id": Categoria.id, "categoria": Categoria.categoria}
+        return listar_en_cache(cache_categorias, Categoria.query, args, columnas, Categoria.id, categoria_fields)
 
 class CategoriaResource(Resource):
-    @marshal_with(categoria_fields)
+    @condicional("categorias", "categoria_id")
+    @serializar_con(categoria_fields, parciales=True)
     def get(self, categoria_id):
-        categoria = Categoria.query.filter_by(id=categoria_id).first()  
+        categoria = obtener_en_cache(cache_categorias, Categoria, categoria_id, categoria_fields)
         if not categoria:
             abort(404, message="Categoría no encontrada")
         return categoria, 200
     
-    @marshal_with(categoria_fields)
+    @serializar_con(categoria_fields)
     def patch(self, categoria_id):
         args = categoria_args.parse_args()
         categoria = Categoria.query.filter_by(id=categoria_id).first()  
         if not categoria:
             abort(404, message="Categoría no encontrada")
         categoria.categoria = args["categoria"]
+        registrar_cambio("categorias", categoria_id)
         db.session.commit()
+        cache_categorias.invalidar()
         return categoria, 200
     
-    @marshal_with(categoria_fields)
+    @serializar_con(categoria_fields)
     def delete(self, categoria_id):
         categoria = Categoria.query.filter_by(id=categoria_id).first()  
         if not categoria:
             abort(404, message="Categoría no encontrada")
         db.session.delete(categoria)
+        registrar_cambio("categorias", categoria_id)
         db.session.commit()
+        cache_categorias.invalidar()
         return {"message": "Categoría eliminada"}, 200
 
 
@@ -138,44 +457,55 @@ proveedor_fields = {
 
 
 class ProveedoresResource(Resource):
-    @marshal_with(proveedor_fields)
+    @serializar_con(proveedor_fields)
     def post(self):
         args = proveedor_args.parse_args()
         nuevo_proveedor = Proveedor(proveedor=args["proveedor"])  
         db.session.add(nuevo_proveedor)
+        db.session.flush()
+        registrar_cambio("proveedores", nuevo_proveedor.id)
         db.session.commit()
+        cache_proveedores.invalidar()
         return nuevo_proveedor, 201
     
-    @marshal_with(proveedor_fields)
+    @condicional("proveedores")
+    @respuesta_en_cache
+    @serializar_con(proveedor_fields, parciales=True)
     def get(self):
-        proveedores = Proveedor.query.all()  
-        return proveedores
+        args = paginacion_args.parse_args()
+        columnas = {"id": Proveedor.id, "proveedor": Proveedor.proveedor}
+        return listar_en_cache(cache_proveedores, Proveedor.query, args, columnas, Proveedor.id, proveedor_fields)
 
 class ProveedorResource(Resource):
-    @marshal_with(proveedor_fields)
+    @condicional("proveedores", "proveedor_id")
+    @serializar_con(proveedor_fields, parciales=True)
     def get(self, proveedor_id):
-        proveedor = Proveedor.query.filter_by(id=proveedor_id).first() 
+        proveedor = obtener_en_cache(cache_proveedores, Proveedor, proveedor_id, proveedor_fields)
         if not proveedor:
             abort(404, message="Proveedor no encontrado")
         return proveedor, 200
     
-    @marshal_with(proveedor_fields)
+    @serializar_con(proveedor_fields)
     def patch(self, proveedor_id):
         args = proveedor_args.parse_args()
         proveedor = Proveedor.query.filter_by(id=proveedor_id).first()  
         if not proveedor:
             abort(404, message="Proveedor no encontrado")
         proveedor.proveedor = args["proveedor"]
+        registrar_cambio("proveedores", proveedor_id)
         db.session.commit()
+        cache_proveedores.invalidar()
         return proveedor, 200
     
-    @marshal_with(proveedor_fields)
+    @serializar_con(proveedor_fields)
     def delete(self, proveedor_id):
         proveedor = Proveedor.query.filter_by(id=proveedor_id).first()  
         if not proveedor:
             abort(404, message="Proveedor no encontrado")
         db.session.delete(proveedor)
+        registrar_cambio("proveedores", proveedor_id)
         db.session.commit()
+        cache_proveedores.invalidar()
         return {"message": "Proveedor eliminado"}, 200
 
 
@@ -191,44 +521,56 @@ tipo_movimiento_fields = {
 
 
 class TiposMovimientoResource(Resource):
-    @marshal_with(tipo_movimiento_fields)
+    @serializar_con(tipo_movimiento_fields)
     def post(self):
         args = tipo_movimiento_args.parse_args()
         nuevo_tipo = TipoMovimiento(tipo=args["tipo"])
         db.session.add(nuevo_tipo)
+        db.session.flush()
+        registrar_cambio("tipos_movimiento", nuevo_tipo.id)
         db.session.commit()
+        cache_tipos_movimiento.invalidar()
         return nuevo_tipo, 201
     
-    @marshal_with(tipo_movimiento_fields)
+    @condicional("tipos_movimiento")
+    @respuesta_en_cache
+    @serializar_con(tipo_movimiento_fields, parciales=True)
     def get(self):
-        tipos = TipoMovimiento.query.all()
+        def cargar():
+            return [serializar(tipo, tipo_movimiento_fields) for tipo in TipoMovimiento.query.all()]
+        tipos = cache_tipos_movimiento.obtener(("lista", g.get("representacion")), cargar)
         return tipos
 
 class TipoMovimientoResource(Resource):
-    @marshal_with(tipo_movimiento_fields)
+    @condicional("tipos_movimiento", "tipo_id")
+    @serializar_con(tipo_movimiento_fields, parciales=True)
     def get(self, tipo_id):
-        tipo = TipoMovimiento.query.filter_by(id=tipo_id).first()
+        tipo = obtener_en_cache(cache_tipos_movimiento, TipoMovimiento, tipo_id, tipo_movimiento_fields)
         if not tipo:
             abort(404, message="Tipo de movimiento no encontrado")
         return tipo, 200
     
-    @marshal_with(tipo_movimiento_fields)
+    @serializar_con(tipo_movimiento_fields)
     def patch(self, tipo_id):
         args = tipo_movimiento_args.parse_args()
         tipo = TipoMovimiento.query.filter_by(id=tipo_id).first()
         if not tipo:
             abort(404, message="Tipo de movimiento no encontrado")
         tipo.tipo = args["tipo"]
+        registrar_cambio("tipos_movimiento", tipo_id)
         db.session.commit()
+        cache_tipos_movimiento.invalidar()
         return tipo, 200
     
-    @marshal_with(tipo_movimiento_fields)
+    @serializar_con(tipo_movimiento_fields)
     def delete(self, tipo_id):
         tipo = TipoMovimiento.query.filter_by(id=tipo_id).first()
         if not tipo:
             abort(404, message="Tipo de movimiento no encontrado")
         db.session.delete(tipo)
+        registrar_cambio("tipos_movimiento", tipo_id)
         db.session.commit()
+        cache_tipos_movimiento.invalidar()
         return {"message": "Tipo de movimiento eliminado"}, 200
     
 
@@ -247,22 +589,49 @@ historial_inventario_fields = {
     "fecha_movimiento": fields.DateTime  
 }
 
+articulo_expansiones.update({
+    "categoria": fields.Nested(categoria_fields, allow_null=True),
+    "proveedor": fields.Nested(proveedor_fields, allow_null=True),
+    "historial": fields.List(fields.Nested(historial_inventario_fields))
+})
+
+historial_lista_args = paginacion_args.copy()
+historial_lista_args.add_argument("articulo_id", type=int, location="args")
+historial_lista_args.add_argument("tipo_movimiento_id", type=int, location="args")
+historial_lista_args.add_argument("desde", type=inputs.datetime_from_iso8601, location="args")
+historial_lista_args.add_argument("hasta", type=inputs.datetime_from_iso8601, location="args")
+
+historial_orden = {
+    "id": HistorialInventario.id,
+    "fecha_movimiento": HistorialInventario.fecha_movimiento
+}
+
 
 class HistorialResource(Resource):
-    @marshal_with(historial_inventario_fields)  
+    @serializar_con(historial_inventario_fields)  
     def post(self):
         args = historial_inventario_args.parse_args()
+        if args["cantidad"] <= 0:
+            abort(400, message="La cantidad debe ser mayor que cero")
 
+        cola = current_app.extensions.get("cola_movimientos")
+        if cola is not None:
+            return self.post_en_cola(cola, args)
 
-        articulo = Articulo.query.filter_by(id=args["articulo_id"]).first()
-        tipo_movimiento = TipoMovimiento.query.filter_by(id=args["tipo_movimiento_id"]).first()
-
-
-        if not articulo:
-            abort(404, message="Artículo no encontrado")
+        tipo_movimiento = obtener_tipo(args["tipo_movimiento_id"])
         if not tipo_movimiento:
+            if not articulo_existe(args["articulo_id"]):
+                abort(404, message="Artículo no encontrado")
             abort(404, message="Tipo de movimiento no encontrado")
 
+        # Comprobación y actualización de stock en un solo UPDATE condicional
+        delta = tipo_movimiento["signo"] * args["cantidad"]
+        if not aplicar_delta(args["articulo_id"], delta):
+            db.session.rollback()
+            if not articulo_existe(args["articulo_id"]):
+                abort(404, message="Artículo no encontrado")
+            abort(400, message="No hay suficiente stock para realizar el egreso")
+
         nuevo_historial = HistorialInventario(
             articulo_id=args["articulo_id"],
             tipo_movimiento_id=args["tipo_movimiento_id"],
@@ -270,41 +639,151 @@ class HistorialResource(Resource):
             fecha_movimiento=datetime.datetime.now()  
         )
 
-
-        if tipo_movimiento.tipo == "Ingreso":
-            articulo.stock += args["cantidad"]  
-        elif tipo_movimiento.tipo == "Egreso":
-            if articulo.stock >= args["cantidad"]:
-                articulo.stock -= args["cantidad"]  
-            else:
-                abort(400, message="No hay suficiente stock para realizar el egreso")
-
-
         db.session.add(nuevo_historial)
+        db.session.flush()
+        sumar_movimientos([nuevo_historial])
+        anotar_movimientos({args["articulo_id"]: nuevo_historial.id})
+        registrar_cambio("articulos", args["articulo_id"])
         db.session.commit()
 
         return nuevo_historial, 201
 
-    @marshal_with(historial_inventario_fields)  
+    def post_en_cola(self, cola, args):
+        # Mismas respuestas que el camino síncrono, pero el commit lo hace el
+        # hilo de la cola junto con otros movimientos
+        try:
+            futuro = cola.encolar({campo: args[campo] for campo in ("articulo_id", "tipo_movimiento_id", "cantidad")})
+        except ColaLlena:
+            abort(503, message="Demasiados movimientos pendientes, reintente más tarde")
+        try:
+            resultado = futuro.result(timeout=current_app.config["GROUP_COMMIT_TIMEOUT"])
+        except TiempoAgotado:
+            # Si aún no ha salido de la cola se cancela y no se registrará;
+            # si ya está en un grupo, su commit está en curso y se espera
+            if futuro.cancel():
+                abort(503, message="El movimiento no se confirmó a tiempo y no se ha registrado, reintente más tarde")
+            resultado = futuro.result()
+        if resultado["estado"] != 201:
+            abort(resultado["estado"], message=resultado["mensaje"])
+        return resultado["historial"], 201
+
+    @serializar_con(historial_inventario_fields, parciales=True)
     def get(self):
-        historial = HistorialInventario.query.all()  
-        return historial
+        args = historial_lista_args.parse_args()
+        consulta = db.select(*columnas(HistorialInventario, campos_solicitados(historial_inventario_fields)))
+        if args["articulo_id"] is not None:
+            consulta = consulta.filter(HistorialInventario.articulo_id == args["articulo_id"])
+        if args["tipo_movimiento_id"] is not None:
+            consulta = consulta.filter(HistorialInventario.tipo_movimiento_id == args["tipo_movimiento_id"])
+        if args["desde"] is not None:
+            consulta = consulta.filter(HistorialInventario.fecha_movimiento >= args["desde"])
+        if args["hasta"] is not None:
+            consulta = consulta.filter(HistorialInventario.fecha_movimiento <= args["hasta"])
+
+        # El archivo se consulta si el rango de fechas pedido llega a él; los
+        # ficheros sólo se abren si además la página no se llena antes con
+        # filas de la tabla (ver pagina_archivada)
+        archivadas = None
+        if alcanza_archivo(args["desde"]):
+            filtros = {campo: args[campo] for campo in ("desde", "hasta", "articulo_id", "tipo_movimiento_id")}
+            archivadas = lambda orden, cursor, limite, tope: pagina_archivada(orden, cursor, limite, tope, **filtros)
+        return listar_paginado(consulta, args, historial_orden, HistorialInventario.id, archivadas=archivadas)
+
+class HistorialLoteResource(Resource):
+    def post(self):
+        movimientos = request.get_json(silent=True)
+        if isinstance(movimientos, dict):
+            movimientos = movimientos.get("movimientos")
+        if not isinstance(movimientos, list) or not movimientos:
+            abort(400, message="Se requiere una lista de movimientos")
+        if len(movimientos) > TAMANO_MAXIMO_LOTE:
+            abort(413, message=f"El lote no puede superar {TAMANO_MAXIMO_LOTE} movimientos")
+
+        resultados = registrar_lote(movimientos)
+        for resultado in resultados:
+            if "historial" in resultado:
+                resultado["historial"] = serializar(resultado["historial"], historial_inventario_fields)
+        db.session.commit()
+
+        rechazados = sum(1 for resultado in resultados if resultado["estado"] != 201)
+        respuesta = {
+            "aceptados": len(resultados) - rechazados,
+            "rechazados": rechazados,
+            "resultados": resultados
+        }
+        return respuesta, 207 if rechazados else 201
+
+historial_exportar_args = exportar_args.copy()
+historial_exportar_args.add_argument("desde", type=inputs.datetime_from_iso8601, location="args")
+historial_exportar_args.add_argument("hasta", type=inputs.datetime_from_iso8601, location="args")
+
+class HistorialExportResource(Resource):
+    def get(self):
+        args = historial_exportar_args.parse_args()
+        consulta = db.select(*[getattr(HistorialInventario, campo) for campo in historial_inventario_fields])
+        if args["desde"] is not None:
+            consulta = consulta.where(HistorialInventario.fecha_movimiento >= args["desde"])
+        if args["hasta"] is not None:
+            consulta = consulta.where(HistorialInventario.fecha_movimiento <= args["hasta"])
+        previas = None
+        if alcanza_archivo(args["desde"]):
+            previas = leer_archivo(desde=args["desde"], hasta=args["hasta"])
+        return exportar(consulta.order_by(HistorialInventario.id), args["formato"], "historial_inventario", previas)
+
+historial_resumen_args = reqparse.RequestParser()
+historial_resumen_args.add_argument("granularidad", type=str, location="args", default="dia", choices=GRANULARIDADES, help="Granularidad no soportada: {error_msg}")
+historial_resumen_args.add_argument("desde", type=inputs.date, location="args")
+historial_resumen_args.add_argument("hasta", type=inputs.date, location="args")
+historial_resumen_args.add_argument("articulo_id", type=int, location="args")
+historial_resumen_args.add_argument("tipo_movimiento_id", type=int, location="args")
+
+class HistorialResumenResource(Resource):
+    # Serie de movimientos por día, semana o mes leída de resumen_movimientos.
+    # Sin ETag: el rango por defecto depende de la fecha actual.
+    def get(self):
+        args = historial_resumen_args.parse_args()
+        granularidad = args["granularidad"]
+        hasta = args["hasta"].date() if args["hasta"] is not None else datetime.date.today()
+        if args["desde"] is not None:
+            desde = args["desde"].date()
+        else:
+            desde = retroceder(hasta, granularidad, PERIODOS_POR_DEFECTO[granularidad])
+        if desde > hasta:
+            abort(400, message="La fecha desde no puede ser posterior a hasta")
+        if contar_periodos(desde, hasta, granularidad) > MAXIMO_PERIODOS:
+            abort(400, message=f"El rango no puede superar {MAXIMO_PERIODOS} periodos")
+        if args["articulo_id"] is not None and not articulo_existe(args["articulo_id"]):
+            abort(404, message="Artículo no encontrado")
+        serie = serie_movimientos(desde, hasta, granularidad, args["articulo_id"], args["tipo_movimiento_id"])
+        return {"granularidad": granularidad, "desde": desde.isoformat(), "hasta": hasta.isoformat(), "serie": serie}, 200
 
 class HistorialDetalleResource(Resource):
-    @marshal_with(historial_inventario_fields) 
+    @serializar_con(historial_inventario_fields, parciales=True)
     def get(self, historial_id):
-        historial = HistorialInventario.query.filter_by(id=historial_id).first()
+        consulta = db.select(*columnas(HistorialInventario, campos_solicitados(historial_inventario_fields)))
+        historial = db.session.execute(consulta.where(HistorialInventario.id == historial_id)).first()
         if not historial:
             abort(404, message="Historial no encontrado")
         return historial, 200
     
-    @marshal_with(historial_inventario_fields) 
+    @serializar_con(historial_inventario_fields) 
     def delete(self, historial_id):
         historial = HistorialInventario.query.filter_by(id=historial_id).first()
         if not historial:
             abort(404, message="Registro de historial no encontrado")
         db.session.delete(historial)
+        restar_movimientos([historial])
+        # El artículo expandido con ?expand=historial cambia
+        registrar_cambio("articulos", historial.articulo_id)
         db.session.commit()
         return {"message": "Registro de historial eliminado"}, 200
 
 
+class MetricasResource(Resource):
+    def get(self):
+        cola = current_app.extensions.get("cola_movimientos")
+        return {
+            "cache": metricas_caches(),
+            "cola_movimientos": cola.metricas() if cola is not None else {"activa": False},
+            "feed_stock": current_app.extensions["feed_stock"].metricas()
+        }, 200
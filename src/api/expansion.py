@@ -0,0 +1,58 @@
+from flask import request
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from api.models import db, Articulo, HistorialInventario
+from api.fieldsets import PARAMETRO_EXPANSION
+
+# Relaciones de un artículo que se pueden incluir con ?expand=, cargadas en
+# un número fijo de consultas sea cual sea el tamaño de la página: categoria
+# y proveedor con joinedload en la misma consulta que los artículos, y los
+# últimos movimientos con una consulta más para todos los artículos.
+HISTORIAL_POR_DEFECTO = 10
+HISTORIAL_MAXIMO = 100
+
+# Colecciones cuya versión entra en el ETag cuando se expanden. Los cambios
+# de historial ya incrementan la versión del artículo.
+_COLECCIONES = {"categoria": "categorias", "proveedor": "proveedores"}
+
+_RELACIONES = {"categoria": Articulo.categoria, "proveedor": Articulo.proveedor}
+
+
+def colecciones_expandidas():
+    # Para condicional(): se lee el parámetro sin validarlo, de eso se
+    # encarga el handler
+    pedidas = {nombre.strip() for nombre in request.args.get(PARAMETRO_EXPANSION, "").split(",")}
+    return [coleccion for nombre, coleccion in _COLECCIONES.items() if nombre in pedidas]
+
+
+def opciones_carga(expansiones):
+    return [joinedload(relacion) for nombre, relacion in _RELACIONES.items() if nombre in expansiones]
+
+
+def cargar_historial(articulos, limite):
+    # selectinload(Articulo.historial) traería el historial completo de cada
+    # artículo. Aquí se numeran los movimientos de cada artículo de la
+    # página (row_number) y se cargan sólo los `limite` más recientes; se
+    # asignan a la relación como ya cargados, sin marcarla como modificada.
+    if not articulos:
+        return
+    posicion = db.func.row_number().over(
+        partition_by=HistorialInventario.articulo_id,
+        order_by=(HistorialInventario.fecha_movimiento.desc(), HistorialInventario.id.desc())
+    ).label("posicion")
+    recientes = (
+        db.select(HistorialInventario.id, posicion)
+        .where(HistorialInventario.articulo_id.in_([articulo.id for articulo in articulos]))
+        .subquery()
+    )
+    consulta = (
+        db.select(HistorialInventario)
+        .join(recientes, recientes.c.id == HistorialInventario.id)
+        .where(recientes.c.posicion <= limite)
+        .order_by(HistorialInventario.articulo_id, recientes.c.posicion)
+    )
+    por_articulo = {articulo.id: [] for articulo in articulos}
+    for historial in db.session.scalars(consulta):
+        por_articulo[historial.articulo_id].append(historial)
+    for articulo in articulos:
+        set_committed_value(articulo, "historial", por_articulo[articulo.id])
@@ -0,0 +1,84 @@
+import csv
+import datetime
+import io
+import json
+from flask import Response, stream_with_context
+from api.models import db
+
+# Filas por lote leídas del cursor del servidor; la memoria usada por la
+# exportación depende de este tamaño y no del tamaño de la tabla.
+TAMANO_LOTE = 1000
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+
+def _valor(valor):
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    return valor
+
+
+def _ndjson(lotes, columnas):
+    for lote in lotes:
+        yield "".join(
+            json.dumps(dict(zip(columnas, map(_valor, fila))), ensure_ascii=False) + "\n"
+            for fila in lote
+        )
+
+
+def _vaciar(buffer):
+    contenido = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return contenido
+
+
+def _csv(lotes, columnas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    yield _vaciar(buffer)
+    for lote in lotes:
+        escritor.writerows([_valor(v) for v in fila] for fila in lote)
+        yield _vaciar(buffer)
+
+
+def _en_lotes(filas):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) == TAMANO_LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def exportar(consulta, formato, nombre, previas=None):
+    # `consulta` es un select() de columnas; se recorre con yield_per
+    # (stream_results / cursor del lado del servidor) en lotes fijos.
+    # `previas` son filas (en el mismo orden de columnas) que se escriben
+    # antes, p. ej. las del archivo de historial.
+    columnas = [columna.key for columna in consulta.selected_columns]
+    generador = _csv if formato == "csv" else _ndjson
+
+    def lotes(resultado):
+        if previas is not None:
+            yield from _en_lotes(previas)
+        yield from resultado.partitions()
+
+    def generar():
+        resultado = db.session.execute(consulta.execution_options(yield_per=TAMANO_LOTE))
+        try:
+            yield from generador(lotes(resultado), columnas)
+        finally:
+            resultado.close()
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype=FORMATOS[formato],
+        headers={"Content-Disposition": f"attachment; filename={nombre}.{formato}"}
+    )
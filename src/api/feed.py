@@ -0,0 +1,252 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.models import db, Articulo, CambioStock
+
+# Feed de cambios de stock para Server-Sent Events. Los handlers de escritura
+# guardan cada cambio en la tabla cambios_stock dentro de su transacción
+# (anotar_stock / anotar_movimientos): un rollback lo descarta y el commit
+# lo hace visible a todos los procesos. Cada proceso lee la tabla por id
+# creciente desde un hilo (cada FEED_SONDEO_S, o en cuanto confirma él
+# mismo un cambio) y guarda los eventos en un buffer circular acotado.
+#
+# El id de cada evento es el de su fila, el mismo en todos los workers: un
+# cliente que se reconecta con Last-Event-ID, llegue al worker que llegue,
+# recibe lo que se perdió si sigue en el buffer, y si no, un evento
+# "reinicio" para que recargue la lista completa.
+CLAVE_SESION = "cambios_stock"
+RECONEXION_MS = 3000
+# Con PostgreSQL los ids se asignan al insertar y las transacciones pueden
+# confirmarse en otro orden: ante un hueco se espera como mucho esto a que
+# aparezca la fila que falta antes de darla por descartada (rollback).
+ESPERA_HUECO_S = 2
+
+logger = logging.getLogger("api.feed")
+
+
+class FeedStock:
+    def __init__(self, capacidad=10000, conexiones_maximas=None, fuente=None, sondeo=0.5):
+        self.capacidad = capacidad
+        # Cada conexión abierta ocupa un hilo del servidor; con un máximo,
+        # las que sobran se rechazan en lugar de dejar sin hilos al resto
+        # de peticiones
+        self.conexiones_maximas = conexiones_maximas
+        self.conexiones = 0
+        self.rechazadas = 0
+        # fuente(desde, limite): [(id, cambio)] de cambios_stock en orden de
+        # id, los posteriores a desde o, con desde=None, los últimos
+        self.fuente = fuente
+        self.sondeo = sondeo
+        self._eventos = deque(maxlen=capacidad)  # (id, datos en JSON)
+        self._ultimo = 0
+        self._hueco = None  # (id que falta, desde cuándo)
+        self._condicion = threading.Condition()
+        self._aviso = threading.Event()
+        self._hilo = None
+        self._detenido = False
+        self.publicados = 0
+
+    def _arrancar(self):
+        # Con la primera conexión: carga los últimos eventos y arranca el
+        # hilo que sigue leyendo la tabla. Los hilos no sobreviven al fork;
+        # cada worker crea su feed en tras_fork (api/warmup.py).
+        with self._condicion:
+            if self.fuente is None or self._hilo is not None or self._detenido:
+                return
+            self.publicar(self.fuente(None, self.capacidad), esperar_huecos=False)
+            self._hilo = threading.Thread(target=self._sondear, name="feed-stock", daemon=True)
+            self._hilo.start()
+
+    def _sondear(self):
+        while True:
+            self._aviso.wait(self.sondeo)
+            self._aviso.clear()
+            if self._detenido:
+                return
+            try:
+                self.publicar(self.fuente(self._ultimo, self.capacidad))
+            except Exception:
+                logger.exception("No se pudieron leer los cambios de stock")
+
+    def avisar(self):
+        # Un commit de este proceso: leer ya en lugar de esperar al sondeo
+        self._aviso.set()
+
+    def detener(self):
+        with self._condicion:
+            hilo, self._hilo = self._hilo, None
+            self._detenido = True
+        self._aviso.set()
+        if hilo is not None:
+            hilo.join()
+
+    def _hueco_vencido(self, falta):
+        ahora = time.monotonic()
+        if self._hueco is None or self._hueco[0] != falta:
+            self._hueco = (falta, ahora)
+        return ahora - self._hueco[1] >= ESPERA_HUECO_S
+
+    def publicar(self, eventos, esperar_huecos=True):
+        # eventos: [(id, cambio)] en orden. Se detiene en el primer hueco
+        # hasta que aparezca la fila o pase ESPERA_HUECO_S; el siguiente
+        # sondeo vuelve a leer desde el último publicado.
+        with self._condicion:
+            publicados = 0
+            for n, cambio in eventos:
+                if n <= self._ultimo:
+                    continue
+                if esperar_huecos and n != self._ultimo + 1 and not self._hueco_vencido(self._ultimo + 1):
+                    break
+                self._eventos.append((n, json.dumps(cambio, separators=(",", ":"))))
+                self._ultimo = n
+                publicados += 1
+            if publicados:
+                self.publicados += publicados
+                self._condicion.notify_all()
+
+    def abrir(self):
+        # Reserva una conexión; False si ya están todas ocupadas
+        self._arrancar()
+        with self._condicion:
+            if self.conexiones_maximas is not None and self.conexiones >= self.conexiones_maximas:
+                self.rechazadas += 1
+                return False
+            self.conexiones += 1
+            return True
+
+    def cerrar(self):
+        with self._condicion:
+            self.conexiones -= 1
+
+    def posicion(self, ultimo_id):
+        # Id desde el que seguir para un Last-Event-ID, o None si hay que
+        # reiniciar (id no válido o eventos ya fuera del buffer). Un id
+        # mayor que el último leído aquí lo leyó antes otro worker.
+        with self._condicion:
+            if not ultimo_id:
+                return self._ultimo
+            if not ultimo_id.isdigit():
+                return None
+            numero = int(ultimo_id)
+            if numero < self._ultimo and (not self._eventos or numero < self._eventos[0][0] - 1):
+                return None
+            return numero
+
+    def esperar(self, desde, espera):
+        # Eventos con id > desde; si no hay, bloquea hasta `espera` segundos.
+        # Devuelve [] si no llegó nada, o None si el cliente se quedó atrás y
+        # los eventos siguientes ya salieron del buffer.
+        with self._condicion:
+            if self._ultimo <= desde:
+                self._condicion.wait(espera)
+            if not self._eventos or self._ultimo <= desde:
+                return []
+            if desde < self._eventos[0][0] - 1:
+                return None
+            # Los ids pueden saltar (huecos), así que se busca desde el final
+            posteriores = []
+            for n, datos in reversed(self._eventos):
+                if n <= desde:
+                    break
+                posteriores.append((n, datos))
+            return posteriores[::-1]
+
+    def metricas(self):
+        with self._condicion:
+            return {"ultimo": str(self._ultimo), "en_buffer": len(self._eventos),
+                    "capacidad": self.capacidad, "publicados": self.publicados,
+                    "conexiones": self.conexiones, "conexiones_maximas": self.conexiones_maximas,
+                    "rechazadas": self.rechazadas}
+
+
+def fuente_cambios(app):
+    def leer(desde, limite):
+        with app.app_context():
+            consulta = db.select(CambioStock.id, CambioStock.articulo_id, CambioStock.stock, CambioStock.movimiento_id)
+            if desde is None:
+                filas = db.session.execute(consulta.order_by(CambioStock.id.desc()).limit(limite)).all()[::-1]
+            else:
+                filas = db.session.execute(consulta.where(CambioStock.id > desde).order_by(CambioStock.id).limit(limite)).all()
+        return [(fila.id, {"articulo_id": fila.articulo_id, "stock": fila.stock, "movimiento_id": fila.movimiento_id})
+                for fila in filas]
+    return leer
+
+
+def crear_feed(app):
+    return FeedStock(app.config['FEED_CAPACIDAD'], app.config['FEED_CONEXIONES_MAXIMAS'],
+                     fuente_cambios(app), app.config['FEED_SONDEO_S'])
+
+
+def formatear(n, datos, evento="stock"):
+    return f"id: {n}\nevent: {evento}\ndata: {datos}\n\n"
+
+
+def flujo_eventos(feed, desde, latido, duracion):
+    # Cuerpo de la respuesta SSE. `desde`: resultado de feed.posicion().
+    yield f"retry: {RECONEXION_MS}\n\n"
+    fin = time.monotonic() + duracion
+    while True:
+        if desde is None:
+            # El cliente debe recargar la lista; sigue desde el último evento
+            desde = feed.posicion(None)
+            yield formatear(desde, "{}", evento="reinicio")
+        restante = fin - time.monotonic()
+        if restante <= 0:
+            return
+        eventos = feed.esperar(desde, min(latido, restante))
+        if eventos is None:
+            desde = None
+        elif not eventos:
+            yield ": latido\n\n"
+        else:
+            yield "".join(formatear(n, datos) for n, datos in eventos)
+            desde = eventos[-1][0]
+
+
+def anotar_stock(cambios):
+    # cambios: [(articulo_id, stock, movimiento_id o None)]. Se escriben en
+    # la transacción en curso y cada FEED_CAPACIDAD cambios se purgan los
+    # que ya no caben en el buffer de ningún proceso.
+    if not cambios:
+        return
+    ids = db.session.scalars(
+        db.insert(CambioStock).returning(CambioStock.id),
+        [{"articulo_id": articulo_id, "stock": stock, "movimiento_id": movimiento_id}
+         for articulo_id, stock, movimiento_id in cambios]
+    ).all()
+    capacidad = current_app.config["FEED_CAPACIDAD"]
+    if max(ids) // capacidad != (min(ids) - 1) // capacidad:
+        db.session.execute(db.delete(CambioStock).where(CambioStock.id <= max(ids) - capacidad))
+    db.session.info[CLAVE_SESION] = True
+
+
+def anotar_movimientos(movimientos):
+    # movimientos: {articulo_id: id del último movimiento}. El stock se lee
+    # dentro de la transacción, después de los UPDATE, así es el que queda
+    # al confirmar y no el calculado antes de escribir.
+    if not movimientos:
+        return
+    stock = dict(db.session.execute(
+        db.select(Articulo.id, Articulo.stock).where(Articulo.id.in_(list(movimientos)))
+    ).all())
+    anotar_stock([(articulo_id, stock[articulo_id], movimiento_id)
+                  for articulo_id, movimiento_id in movimientos.items() if articulo_id in stock])
+
+
+@event.listens_for(Session, "after_commit")
+def _avisar(sesion):
+    if not sesion.info.pop(CLAVE_SESION, None) or not has_app_context():
+        return
+    feed = current_app.extensions.get("feed_stock")
+    if feed is not None:
+        feed.avisar()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar(sesion):
+    sesion.info.pop(CLAVE_SESION, None)
@@ -0,0 +1,69 @@
+from flask import request
+from flask_restful import abort
+
+# Campos parciales en las lecturas: ?fields=id,nombre,stock. La respuesta
+# sólo lleva esos campos y los handlers seleccionan sólo esas columnas.
+PARAMETRO = "fields"
+
+# (id del mapa, campos pedidos) -> submapa. Devolver siempre el mismo
+# objeto permite que el serializador compilado se reutilice.
+_submapas = {}
+
+
+def resolver_campos(valor, campos):
+    if not valor:
+        return campos
+    pedidos = [nombre.strip() for nombre in valor.split(",") if nombre.strip()]
+    desconocidos = [nombre for nombre in pedidos if nombre not in campos]
+    if desconocidos:
+        abort(400, message=f"Campos desconocidos: {', '.join(desconocidos)}. Opciones: {', '.join(campos)}")
+    if not pedidos:
+        return campos
+    clave = (id(campos), frozenset(pedidos))
+    guardado = _submapas.get(clave)
+    if guardado is None or guardado[0] is not campos:
+        # Se respeta el orden de declaración, no el de la petición
+        guardado = _submapas[clave] = (campos, {nombre: campo for nombre, campo in campos.items() if nombre in pedidos})
+    return guardado[1]
+
+
+def campos_solicitados(campos):
+    return resolver_campos(request.args.get(PARAMETRO), campos)
+
+
+def columnas(modelo, campos):
+    # Columnas a seleccionar para un mapa de campos; el id siempre se
+    # incluye porque lo usan la paginación y las comprobaciones de existencia.
+    nombres = ["id"] + [campo for campo in campos if campo != "id"]
+    return [getattr(modelo, nombre) for nombre in nombres]
+
+
+# Expansiones: ?expand=categoria,proveedor incluye esas relaciones en la
+# respuesta. `disponibles` es un dict nombre -> campo de flask_restful
+# (Nested, List...) que se añade al mapa de campos.
+PARAMETRO_EXPANSION = "expand"
+
+_con_expansiones = {}
+
+
+def expansiones_solicitadas(disponibles):
+    valor = request.args.get(PARAMETRO_EXPANSION)
+    if not valor:
+        return ()
+    pedidas = {nombre.strip() for nombre in valor.split(",") if nombre.strip()}
+    desconocidas = sorted(pedidas - set(disponibles))
+    if desconocidas:
+        abort(400, message=f"No se puede expandir: {', '.join(desconocidas)}. Opciones: {', '.join(disponibles)}")
+    return tuple(nombre for nombre in disponibles if nombre in pedidas)
+
+
+def con_expansiones(campos, nombres, disponibles):
+    # Mapa de campos más las expansiones pedidas; memoizado como los
+    # submapas para que el serializador compilado se reutilice
+    if not nombres:
+        return campos
+    clave = (id(campos), id(disponibles), nombres)
+    guardado = _con_expansiones.get(clave)
+    if guardado is None or guardado[0] is not campos:
+        guardado = _con_expansiones[clave] = (campos, {**campos, **{nombre: disponibles[nombre] for nombre in nombres}})
+    return guardado[1]
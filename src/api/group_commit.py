@@ -0,0 +1,180 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from api.models import db, HistorialInventario
+from api.movements import registrar_lote
+
+# Modo de ingesta opcional para POST /api/historial_inventario (ver
+# MOVIMIENTOS_GROUP_COMMIT en app.py). Cada petición deja su movimiento en una
+# cola y espera; un único hilo los agrupa (hasta tamano_grupo movimientos o
+# espera_maxima segundos desde el primero) y los registra con registrar_lote,
+# las mismas reglas que el endpoint de lotes, con un solo commit por grupo.
+# La respuesta de cada petición sólo se resuelve cuando su grupo se confirmó.
+# Una petición que se cansa de esperar cancela su futuro; el hilo descarta
+# los cancelados al formar el grupo, así un reintento del cliente no
+# registra el movimiento dos veces.
+
+_FIN = object()
+
+
+class ColaLlena(Exception):
+    pass
+
+
+def _a_dict(historial):
+    # El resultado sale del hilo del committer: se copian los valores antes
+    # del commit para no compartir objetos de su sesión con otros hilos.
+    return {columna.key: getattr(historial, columna.key) for columna in HistorialInventario.__table__.columns}
+
+
+class ColaMovimientos:
+    def __init__(self, app, tamano_grupo=200, espera_maxima=0.002, capacidad=10000):
+        self.app = app
+        self.tamano_grupo = tamano_grupo
+        self.espera_maxima = espera_maxima
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._pid = None
+        self._hilo = None
+        self._cola = None
+        self.grupos = 0
+        self.movimientos = 0
+        self.errores = 0
+        self.cancelados = 0
+        self.latencia_total = 0.0
+        self.latencia_maxima = 0.0
+        self.latencia_ultima = 0.0
+        self.espera_total = 0.0
+
+    def _arrancar(self):
+        # El hilo se crea con el primer movimiento y se vuelve a crear si el
+        # proceso es un fork: los hilos no sobreviven al fork.
+        with self._lock:
+            if self._pid == os.getpid() and self._hilo.is_alive():
+                return
+            self._pid = os.getpid()
+            self._cola = queue.Queue(maxsize=self.capacidad)
+            self._hilo = threading.Thread(target=self._ejecutar, name="cola-movimientos", daemon=True)
+            self._hilo.start()
+
+    def encolar(self, movimiento):
+        self._arrancar()
+        futuro = Future()
+        try:
+            self._cola.put_nowait((movimiento, futuro, time.perf_counter()))
+        except queue.Full:
+            raise ColaLlena()
+        return futuro
+
+    def detener(self, timeout=None):
+        # Confirma lo que quede en la cola y termina el hilo
+        with self._lock:
+            hilo, cola = self._hilo, self._cola
+            self._hilo = self._cola = self._pid = None
+        if hilo is not None and hilo.is_alive():
+            cola.put(_FIN)
+            hilo.join(timeout)
+
+    def _ejecutar(self):
+        cola = self._cola
+        while True:
+            primero = cola.get()
+            if primero is _FIN:
+                return
+            grupo = [primero]
+            limite = time.perf_counter() + self.espera_maxima
+            fin = False
+            while len(grupo) < self.tamano_grupo:
+                try:
+                    siguiente = cola.get(timeout=max(0, limite - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if siguiente is _FIN:
+                    fin = True
+                    break
+                grupo.append(siguiente)
+            self._confirmar(self._reclamar(grupo))
+            if fin:
+                return
+
+    def _reclamar(self, grupo):
+        # Desde aquí la petición ya no puede cancelar: espera al commit
+        vigentes = [item for item in grupo if item[1].set_running_or_notify_cancel()]
+        if len(vigentes) < len(grupo):
+            with self._lock:
+                self.cancelados += len(grupo) - len(vigentes)
+        return vigentes
+
+    def _confirmar(self, grupo):
+        if not grupo:
+            return
+        inicio = time.perf_counter()
+        try:
+            with self.app.app_context():
+                try:
+                    resultados = registrar_lote([movimiento for movimiento, _, _ in grupo])
+                    for resultado in resultados:
+                        if "historial" in resultado:
+                            resultado["historial"] = _a_dict(resultado["historial"])
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+        except Exception as error:
+            # Un movimiento problemático no debe hacer fallar a los demás:
+            # se reintentan uno a uno.
+            if len(grupo) > 1:
+                for item in grupo:
+                    self._confirmar([item])
+                return
+            with self._lock:
+                self.errores += 1
+            grupo[0][1].set_exception(error)
+            return
+
+        fin = time.perf_counter()
+        with self._lock:
+            latencia = fin - inicio
+            self.grupos += 1
+            self.movimientos += len(grupo)
+            self.latencia_total += latencia
+            self.latencia_ultima = latencia
+            self.latencia_maxima = max(self.latencia_maxima, latencia)
+            self.espera_total += sum(fin - encolado for _, _, encolado in grupo)
+        for (_, futuro, _), resultado in zip(grupo, resultados):
+            futuro.set_result(resultado)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "activa": True,
+                "profundidad": self._cola.qsize() if self._cola is not None else 0,
+                "capacidad": self.capacidad,
+                "tamano_grupo": self.tamano_grupo,
+                "espera_maxima_ms": self.espera_maxima * 1000,
+                "grupos": self.grupos,
+                "movimientos": self.movimientos,
+                "errores": self.errores,
+                "cancelados": self.cancelados,
+                "movimientos_por_grupo": self.movimientos / self.grupos if self.grupos else 0,
+                "flush_ms": {
+                    "ultimo": self.latencia_ultima * 1000,
+                    "medio": self.latencia_total / self.grupos * 1000 if self.grupos else 0,
+                    "maximo": self.latencia_maxima * 1000
+                },
+                "espera_media_ms": self.espera_total / self.movimientos * 1000 if self.movimientos else 0
+            }
+
+
+def crear_cola(app):
+    cola = ColaMovimientos(
+        app,
+        tamano_grupo=app.config['GROUP_COMMIT_TAMANO'],
+        espera_maxima=app.config['GROUP_COMMIT_ESPERA_MS'] / 1000,
+        capacidad=app.config['GROUP_COMMIT_CAPACIDAD']
+    )
+    atexit.register(cola.detener, 5)
+    return cola
@@ -0,0 +1,253 @@
+import csv
+import math
+from sqlalchemy import bindparam, tuple_
+from api.models import db, Articulo, Categoria, Proveedor, SnapshotStock
+from api.snapshots import MOTIVO_ALTA, MOTIVO_EDICION
+from api.versions import registrar_cambio
+from api.feed import anotar_stock
+
+# Importación masiva del catálogo desde CSV. Cabecera:
+#   [id,]nombre,descripcion,categoria,proveedor,stock,precio
+# categoria y proveedor son nombres. Una fila con id actualiza ese artículo;
+# sin id, se busca por (proveedor, nombre) y se actualiza o se crea. En una
+# actualización, stock vacío conserva el stock actual; las filas idénticas a
+# lo que ya hay se cuentan como sin_cambios y no se escriben.
+# Se procesa por bloques: una consulta por tabla referenciada y bloque, un
+# executemany para las altas y otro para las modificaciones, y un commit por
+# bloque, así la memoria no depende del tamaño del fichero. Si el fichero
+# se corta a medias (no es UTF-8), los bloques anteriores ya están
+# confirmados: el error lleva el resumen hasta confirmado_hasta.
+TAMANO_BLOQUE = 2000
+MAXIMO_ERRORES = 1000
+
+COLUMNAS_OBLIGATORIAS = ("nombre", "categoria", "proveedor", "precio")
+
+_articulos = Articulo.__table__
+_snapshots = SnapshotStock.__table__
+
+# Sentencias Core: executemany directo, sin el procesamiento por fila del ORM.
+# El RETURNING sin orden garantizado permite agrupar las filas en INSERTs de
+# varios VALUES; cada id se asocia a su alta por (proveedor_id, nombre).
+_insertar = _articulos.insert().returning(_articulos.c.id, _articulos.c.proveedor_id, _articulos.c.nombre)
+
+_actualizar_valores = (
+    _articulos.update()
+    .where(_articulos.c.id == bindparam("b_id"))
+    .values(categoria_id=bindparam("categoria_id"), proveedor_id=bindparam("proveedor_id"),
+            stock=bindparam("stock"), precio=bindparam("precio"))
+)
+# Sólo si cambia el texto: así no se dispara el trigger del índice de búsqueda
+_actualizar_todo = _actualizar_valores.values(nombre=bindparam("nombre"), descripcion=bindparam("descripcion"))
+
+CAMPOS_ARTICULO = ("nombre", "descripcion", "categoria_id", "proveedor_id", "stock", "precio")
+
+
+class ErrorImportacion(Exception):
+    def __init__(self, mensaje, resumen=None):
+        super().__init__(mensaje)
+        self.resumen = resumen
+
+
+def _texto(fila, campo):
+    valor = fila.get(campo)
+    if valor is None:
+        return ""
+    if "\0" in valor:
+        raise ErrorImportacion(f"{campo} contiene caracteres nulos")
+    return valor.strip()
+
+
+def _entero(valor, campo):
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorImportacion(f"{campo} debe ser un número entero")
+    if numero < 0:
+        raise ErrorImportacion(f"{campo} no puede ser negativo")
+    return numero
+
+
+def _validar(fila):
+    nombre = _texto(fila, "nombre")
+    if not nombre:
+        raise ErrorImportacion("El nombre del artículo es obligatorio")
+    if len(nombre) > 80:
+        raise ErrorImportacion("El nombre no puede superar 80 caracteres")
+    descripcion = _texto(fila, "descripcion") or None
+    if descripcion and len(descripcion) > 200:
+        raise ErrorImportacion("La descripción no puede superar 200 caracteres")
+    for campo in ("categoria", "proveedor", "precio"):
+        if not _texto(fila, campo):
+            raise ErrorImportacion(f"El campo {campo} es obligatorio")
+    try:
+        precio = float(_texto(fila, "precio"))
+    except ValueError:
+        raise ErrorImportacion("precio debe ser un número")
+    # float() acepta "nan", "inf" o "1e999"
+    if not math.isfinite(precio):
+        raise ErrorImportacion("precio debe ser un número finito")
+    if precio < 0:
+        raise ErrorImportacion("precio no puede ser negativo")
+    id_texto = _texto(fila, "id")
+    stock_texto = _texto(fila, "stock")
+    return {
+        "id": _entero(id_texto, "id") if id_texto else None,
+        "nombre": nombre,
+        "descripcion": descripcion,
+        "categoria": _texto(fila, "categoria"),
+        "proveedor": _texto(fila, "proveedor"),
+        "stock": _entero(stock_texto, "stock") if stock_texto else None,
+        "precio": precio
+    }
+
+
+def _nombres_a_ids(modelo, columna, nombres):
+    if not nombres:
+        return {}
+    return dict(db.session.execute(db.select(columna, modelo.id).where(columna.in_(nombres))).all())
+
+
+def _importar_bloque(bloque, resumen):
+    # bloque: [(numero_de_fila, fila_csv)]
+    validas = []
+    for numero, fila in bloque:
+        try:
+            validas.append((numero, _validar(fila)))
+        except ErrorImportacion as error:
+            _error(resumen, numero, str(error))
+
+    categorias = _nombres_a_ids(Categoria, Categoria.categoria, {datos["categoria"] for _, datos in validas})
+    proveedores = _nombres_a_ids(Proveedor, Proveedor.proveedor, {datos["proveedor"] for _, datos in validas})
+    resueltas = []
+    for numero, datos in validas:
+        if datos["categoria"] not in categorias:
+            _error(resumen, numero, f"Categoría no encontrada: {datos['categoria']}")
+        elif datos["proveedor"] not in proveedores:
+            _error(resumen, numero, f"Proveedor no encontrado: {datos['proveedor']}")
+        else:
+            datos["categoria_id"] = categorias[datos["categoria"]]
+            datos["proveedor_id"] = proveedores[datos["proveedor"]]
+            resueltas.append((numero, datos))
+
+    # Artículos existentes: por id o por (proveedor_id, nombre), en una consulta
+    ids = {datos["id"] for _, datos in resueltas if datos["id"] is not None}
+    claves = {(datos["proveedor_id"], datos["nombre"]) for _, datos in resueltas if datos["id"] is None}
+    condiciones = []
+    if ids:
+        condiciones.append(Articulo.id.in_(ids))
+    if claves:
+        condiciones.append(tuple_(Articulo.proveedor_id, Articulo.nombre).in_(claves))
+    por_id, por_clave = {}, {}
+    if condiciones:
+        existentes = db.session.execute(
+            db.select(Articulo.id, *[getattr(Articulo, campo) for campo in CAMPOS_ARTICULO]).where(db.or_(*condiciones))
+        ).all()
+        for existente in existentes:
+            por_id[existente.id] = existente
+            por_clave.setdefault((existente.proveedor_id, existente.nombre), []).append(existente)
+
+    altas, modificaciones, textos, snapshots = [], [], [], []
+    vistos = {}
+    for numero, datos in resueltas:
+        if datos["id"] is not None:
+            existente = por_id.get(datos["id"])
+            if existente is None:
+                _error(resumen, numero, f"Artículo no encontrado: {datos['id']}")
+                continue
+            clave = ("id", datos["id"])
+        else:
+            coincidencias = por_clave.get((datos["proveedor_id"], datos["nombre"]), [])
+            if len(coincidencias) > 1:
+                _error(resumen, numero, "Hay varios artículos con ese nombre para el proveedor; indique el id")
+                continue
+            existente = coincidencias[0] if coincidencias else None
+            clave = ("id", existente.id) if existente else ("nuevo", datos["proveedor_id"], datos["nombre"])
+        if clave in vistos:
+            _error(resumen, numero, f"Artículo repetido en el fichero (fila {vistos[clave]})")
+            continue
+        vistos[clave] = numero
+
+        valores = {campo: datos[campo] for campo in ("nombre", "descripcion", "categoria_id", "proveedor_id", "precio")}
+        if existente is None:
+            if datos["stock"] is None:
+                _error(resumen, numero, "El stock es obligatorio para un artículo nuevo")
+                continue
+            altas.append({**valores, "stock": datos["stock"]})
+        else:
+            stock = existente.stock if datos["stock"] is None else datos["stock"]
+            nuevos_valores = {**valores, "b_id": existente.id, "stock": stock}
+            if all(nuevos_valores[campo] == getattr(existente, campo) for campo in CAMPOS_ARTICULO):
+                resumen["sin_cambios"] += 1
+                continue
+            if stock != existente.stock:
+                snapshots.append({"articulo_id": existente.id, "stock": stock, "motivo": MOTIVO_EDICION})
+            if (datos["nombre"], datos["descripcion"]) != (existente.nombre, existente.descripcion):
+                textos.append(nuevos_valores)
+            else:
+                modificaciones.append(nuevos_valores)
+
+    afectados = [modificacion["b_id"] for modificacion in modificaciones + textos]
+    if altas:
+        nuevos = {(proveedor_id, nombre): articulo_id
+                  for articulo_id, proveedor_id, nombre in db.session.execute(_insertar, altas)}
+        afectados += nuevos.values()
+        snapshots += [{"articulo_id": nuevos[(alta["proveedor_id"], alta["nombre"])], "stock": alta["stock"], "motivo": MOTIVO_ALTA}
+                      for alta in altas]
+    if modificaciones:
+        db.session.execute(_actualizar_valores, modificaciones)
+    if textos:
+        db.session.execute(_actualizar_todo, textos)
+    if snapshots:
+        db.session.execute(_snapshots.insert(), snapshots)
+        anotar_stock([(snapshot["articulo_id"], snapshot["stock"], None) for snapshot in snapshots])
+    if afectados:
+        registrar_cambio("articulos", *afectados)
+    db.session.commit()
+    resumen["insertados"] += len(altas)
+    resumen["actualizados"] += len(modificaciones) + len(textos)
+    resumen["confirmado_hasta"] = bloque[-1][0]
+
+
+def _error(resumen, numero, mensaje):
+    resumen["con_error"] += 1
+    if len(resumen["errores"]) < MAXIMO_ERRORES:
+        resumen["errores"].append({"fila": numero, "mensaje": mensaje})
+
+
+def importar_articulos(lineas, tamano_bloque=TAMANO_BLOQUE):
+    # `lineas`: cualquier iterable de líneas de texto (fichero abierto,
+    # flujo de la petición...). Se lee de forma incremental.
+    lector = csv.DictReader(lineas)
+    cabecera = [columna.strip() for columna in (lector.fieldnames or [])]
+    faltan = [columna for columna in COLUMNAS_OBLIGATORIAS if columna not in cabecera]
+    if faltan:
+        raise ErrorImportacion(f"Faltan columnas en la cabecera: {', '.join(faltan)}")
+    lector.fieldnames = cabecera
+
+    resumen = {"filas": 0, "insertados": 0, "actualizados": 0, "sin_cambios": 0, "con_error": 0,
+               "confirmado_hasta": 1, "errores": []}
+    bloque = []
+    # La fila 1 es la cabecera
+    numero = 1
+    while True:
+        numero += 1
+        try:
+            fila = next(lector)
+        except StopIteration:
+            break
+        except csv.Error as error:
+            # Fila mal formada (p. ej. un campo de más de csv.field_size_limit()):
+            # el lector sigue en la línea siguiente
+            resumen["filas"] += 1
+            _error(resumen, numero, f"CSV no válido: {error}")
+            continue
+        except UnicodeDecodeError:
+            raise ErrorImportacion(f"El fichero debe estar codificado en UTF-8 (fila {numero})", resumen)
+        resumen["filas"] += 1
+        bloque.append((numero, fila))
+        if len(bloque) == tamano_bloque:
+            _importar_bloque(bloque, resumen)
+            bloque = []
+    if bloque:
+        _importar_bloque(bloque, resumen)
+    return resumen
@@ -0,0 +1,89 @@
+import logging
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# Métricas por petición: número de consultas y tiempo en base de datos (desde
+# los eventos del engine), tiempo de serialización y tiempo total del
+# handler. Se devuelven en la cabecera Server-Timing (visible en las
+# herramientas de desarrollo del navegador) y se registran en el log las
+# peticiones lentas y las sentencias repetidas muchas veces (posible N+1).
+logger = logging.getLogger("api.peticiones")
+
+
+def _estado():
+    if not has_request_context():
+        return None
+    return g.get("_instrumentacion")
+
+
+def registrar_tiempo(nombre, segundos):
+    estado = _estado()
+    if estado is not None:
+        estado["tiempos"][nombre] += segundos
+
+
+def _antes_de_consulta(conexion, cursor, sentencia, parametros, contexto, executemany):
+    # Una sola marca por conexión: una sentencia que falla no deja restos
+    # en la conexión del pool para las siguientes
+    conexion.info["_inicio_consulta"] = time.perf_counter()
+
+
+def _despues_de_consulta(conexion, cursor, sentencia, parametros, contexto, executemany):
+    inicio = conexion.info.pop("_inicio_consulta", None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    estado = _estado()
+    if estado is not None:
+        estado["consultas"] += 1
+        estado["tiempos"]["db"] += duracion
+        estado["sentencias"][sentencia] += 1
+
+
+def _error_de_consulta(contexto):
+    if contexto.connection is not None:
+        contexto.connection.info.pop("_inicio_consulta", None)
+
+
+def _cabecera(estado, total):
+    tiempos = estado["tiempos"]
+    return ", ".join([
+        f'db;dur={tiempos["db"] * 1000:.2f};desc="{estado["consultas"]} consultas"',
+        f'ser;dur={tiempos["serializacion"] * 1000:.2f};desc="serializacion"',
+        f'app;dur={total * 1000:.2f};desc="handler"'
+    ])
+
+
+def instrumentar(app, engine):
+    umbral_lenta = app.config['UMBRAL_PETICION_LENTA_MS']
+    umbral_repeticiones = app.config['UMBRAL_SENTENCIAS_REPETIDAS']
+
+    event.listen(engine, "before_cursor_execute", _antes_de_consulta)
+    event.listen(engine, "after_cursor_execute", _despues_de_consulta)
+    event.listen(engine, "handle_error", _error_de_consulta)
+
+    @app.before_request
+    def iniciar():
+        g._instrumentacion = {"inicio": time.perf_counter(), "consultas": 0, "tiempos": Counter(), "sentencias": Counter()}
+
+    @app.after_request
+    def terminar(respuesta):
+        estado = _estado()
+        if estado is None:
+            return respuesta
+        total = time.perf_counter() - estado["inicio"]
+        if app.config['SERVER_TIMING']:
+            respuesta.headers["Server-Timing"] = _cabecera(estado, total)
+
+        ruta = f"{request.method} {request.full_path.rstrip('?')}"
+        if umbral_lenta is not None and total * 1000 >= umbral_lenta:
+            logger.warning("Petición lenta: %s -> %s en %.1fms (%d consultas, %.1fms en base de datos, %.1fms serializando)",
+                           ruta, respuesta.status_code, total * 1000, estado["consultas"],
+                           estado["tiempos"]["db"] * 1000, estado["tiempos"]["serializacion"] * 1000)
+        if umbral_repeticiones is not None:
+            for sentencia, veces in estado["sentencias"].items():
+                if veces >= umbral_repeticiones:
+                    logger.warning("Posible N+1: %s ejecutó %d veces la misma sentencia: %s", ruta, veces, " ".join(sentencia.split()))
+        return respuesta
@@ -1,24 +1,26 @@
 import datetime
 from .extensions import db
-from flask_sqlalchemy import SQLAlchemy
-
-
-db = SQLAlchemy()
 
 class Articulo(db.Model):
     __tablename__ = 'articulos' 
+    # Búsqueda por (proveedor, nombre) al importar listas de precios
+    __table_args__ = (
+        db.Index('ix_articulos_proveedor_nombre', 'proveedor_id', 'nombre'),
+    )
     id = db.Column(db.Integer, primary_key=True, unique=True, nullable=False)
     nombre = db.Column(db.String(80), nullable=False)
     descripcion = db.Column(db.String(200))
-    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False)
-    proveedor_id = db.Column(db.Integer, db.ForeignKey('proveedores.id'), nullable=False)
-    stock = db.Column(db.Integer, nullable=False)
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False, index=True)
+    proveedor_id = db.Column(db.Integer, db.ForeignKey('proveedores.id'), nullable=False, index=True)
+    stock = db.Column(db.Integer, nullable=False, index=True)
     precio = db.Column(db.Float, nullable=False)
     
 
     categoria = db.relationship('Categoria', back_populates='articulos')
     proveedor = db.relationship('Proveedor', back_populates='articulos')
     historial = db.relationship('HistorialInventario', back_populates='articulo', cascade='all, delete-orphan')
+    snapshots = db.relationship('SnapshotStock', back_populates='articulo', cascade='all, delete-orphan')
+    resumen_movimientos = db.relationship('ResumenMovimientos', back_populates='articulo', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f"<Articulo (nombre={self.nombre}, precio={self.precio})>"
@@ -58,11 +60,16 @@ class TipoMovimiento(db.Model):
 
 class HistorialInventario(db.Model):
     __tablename__ = 'historial_inventario'
+    # (articulo_id, fecha_movimiento) cubre también las búsquedas sólo por
+    # articulo_id, incluido el borrado en cascada desde Articulo.historial.
+    __table_args__ = (
+        db.Index('ix_historial_inventario_articulo_fecha', 'articulo_id', 'fecha_movimiento'),
+    )
     id = db.Column(db.Integer, primary_key=True, unique=True, nullable=False)
     articulo_id = db.Column(db.Integer, db.ForeignKey('articulos.id'), nullable=False)  
-    tipo_movimiento_id = db.Column(db.Integer, db.ForeignKey('tipos_movimiento.id'), nullable=False)
+    tipo_movimiento_id = db.Column(db.Integer, db.ForeignKey('tipos_movimiento.id'), nullable=False, index=True)
     cantidad = db.Column(db.Integer, nullable=False)
-    fecha_movimiento = db.Column(db.DateTime, default=datetime.datetime.now, nullable=False) 
+    fecha_movimiento = db.Column(db.DateTime, default=datetime.datetime.now, nullable=False, index=True) 
 
 
     articulo = db.relationship('Articulo', back_populates='historial')
@@ -70,4 +77,92 @@ class HistorialInventario(db.Model):
 
     def __repr__(self):
 
-        return f"<HistorialInventario (articulo_id={self.articulo_id}, tipo_movimiento={self.tipo_movimiento.tipo}, cantidad={self.cantidad})>"
\ No newline at end of file
+        return f"<HistorialInventario (articulo_id={self.articulo_id}, tipo_movimiento={self.tipo_movimiento.tipo}, cantidad={self.cantidad})>"
+
+class SnapshotStock(db.Model):
+    __tablename__ = 'snapshots_stock'
+    # Stock de un artículo en una fecha, incluidos los movimientos con
+    # fecha_movimiento <= fecha. Sirve de punto de partida para consultar el
+    # stock a una fecha sin recorrer todo el historial.
+    __table_args__ = (
+        db.Index('ix_snapshots_stock_articulo_fecha', 'articulo_id', 'fecha'),
+    )
+    id = db.Column(db.Integer, primary_key=True, unique=True, nullable=False)
+    articulo_id = db.Column(db.Integer, db.ForeignKey('articulos.id'), nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.datetime.now, nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    motivo = db.Column(db.String(20), nullable=False)  # 'alta', 'edicion', 'periodico'
+
+
+    articulo = db.relationship('Articulo', back_populates='snapshots')
+
+    def __repr__(self):
+        return f"<SnapshotStock (articulo_id={self.articulo_id}, fecha={self.fecha}, stock={self.stock})>"
+
+class ResumenMovimientos(db.Model):
+    __tablename__ = 'resumen_movimientos'
+    # Unidades y número de movimientos por artículo, tipo y día, mantenidos
+    # en la misma transacción que cada alta o baja de historial (ver
+    # api/rollups.py). Los informes por periodo leen esto en lugar de
+    # recorrer historial_inventario. El índice por día sirve a las series
+    # de todos los artículos e incluye los totales para no leer la tabla.
+    __table_args__ = (
+        db.Index('ix_resumen_movimientos_dia', 'dia', 'tipo_movimiento_id', 'cantidad', 'movimientos'),
+    )
+    articulo_id = db.Column(db.Integer, db.ForeignKey('articulos.id'), primary_key=True)
+    tipo_movimiento_id = db.Column(db.Integer, db.ForeignKey('tipos_movimiento.id'), primary_key=True)
+    dia = db.Column(db.Date, primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False)
+    movimientos = db.Column(db.Integer, nullable=False)
+
+
+    articulo = db.relationship('Articulo', back_populates='resumen_movimientos')
+
+    def __repr__(self):
+        return f"<ResumenMovimientos (articulo_id={self.articulo_id}, dia={self.dia}, cantidad={self.cantidad})>"
+
+class ParticionHistorial(db.Model):
+    __tablename__ = 'particiones_historial'
+    # Manifiesto del archivo de historial (ver api/archive.py): un fichero
+    # gzip por mes y ejecución con sus totales, para no tener que abrirlo.
+    # Los rangos de fecha e id permiten saltar ficheros al paginar.
+    # por_fecha: las filas, escritas por id, también están en orden de fecha.
+    id = db.Column(db.Integer, primary_key=True, unique=True, nullable=False)
+    periodo = db.Column(db.String(7), nullable=False, index=True)  # 'AAAA-MM'
+    fichero = db.Column(db.String(120), unique=True, nullable=False)
+    filas = db.Column(db.Integer, nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    desde = db.Column(db.DateTime, nullable=False)
+    hasta = db.Column(db.DateTime, nullable=False)
+    id_desde = db.Column(db.Integer, nullable=False)
+    id_hasta = db.Column(db.Integer, nullable=False)
+    por_fecha = db.Column(db.Boolean, default=False, nullable=False)
+    creado = db.Column(db.DateTime, default=datetime.datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f"<ParticionHistorial (periodo={self.periodo}, filas={self.filas})>"
+
+class CambioStock(db.Model):
+    __tablename__ = 'cambios_stock'
+    # Cambios de stock confirmados, en orden de id: la fuente común del feed
+    # SSE de todos los procesos (ver api/feed.py). Sólo se guardan los
+    # últimos FEED_CAPACIDAD; AUTOINCREMENT para que SQLite no reutilice los
+    # ids de las filas purgadas.
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    articulo_id = db.Column(db.Integer, nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    movimiento_id = db.Column(db.Integer)
+
+    def __repr__(self):
+        return f"<CambioStock (id={self.id}, articulo_id={self.articulo_id}, stock={self.stock})>"
+
+class VersionRecurso(db.Model):
+    __tablename__ = 'versiones_recurso'
+    # 'articulos' para la colección completa, 'articulos/5' para un elemento
+    clave = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    actualizado = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<VersionRecurso (clave={self.clave}, version={self.version})>"
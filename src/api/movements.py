@@ -0,0 +1,199 @@
+import datetime
+from collections import defaultdict
+from sqlalchemy import bindparam
+from api.models import db, Articulo, TipoMovimiento, HistorialInventario
+from api.cache import cache_tipos_movimiento
+from api.versions import registrar_cambio
+from api.feed import anotar_movimientos
+from api.rollups import sumar_movimientos
+
+TAMANO_MAXIMO_LOTE = 5000
+
+CAMPOS_MOVIMIENTO = ("articulo_id", "tipo_movimiento_id", "cantidad")
+
+_articulos = Articulo.__table__
+_historial = HistorialInventario.__table__
+
+# Los movimientos de un lote van en un INSERT ... RETURNING ejecutado como
+# executemany, que SQLAlchemy agrupa en sentencias de varios VALUES; el
+# flush del ORM haría un INSERT por movimiento para obtener cada id. Como en
+# api/importer.py, el RETURNING no garantiza el orden y cada id se asocia
+# por sus valores; los movimientos iguales de un lote son intercambiables y
+# reciben sus ids en orden.
+_insertar_historial = _historial.insert().returning(
+    _historial.c.id, _historial.c.articulo_id, _historial.c.tipo_movimiento_id, _historial.c.cantidad
+)
+
+# UPDATE articulos SET stock = stock + :delta WHERE id = :articulo_id
+# ejecutado como executemany con un delta agregado por artículo.
+_actualizar_stock = (
+    _articulos.update()
+    .where(_articulos.c.id == bindparam("articulo_id"))
+    .values(stock=_articulos.c.stock + bindparam("delta"))
+)
+
+# Variante condicional: la comprobación de stock y la escritura ocurren en
+# la misma sentencia, así dos egresos concurrentes no pueden sobrevender.
+_actualizar_stock_condicional = _actualizar_stock.where(
+    _articulos.c.stock + bindparam("delta") >= 0
+)
+
+
+def signo_movimiento(tipo):
+    if tipo == "Ingreso":
+        return 1
+    if tipo == "Egreso":
+        return -1
+    return 0
+
+
+def _cargar_tipos(tipo_ids):
+    filas = db.session.execute(
+        db.select(TipoMovimiento.id, TipoMovimiento.tipo).where(TipoMovimiento.id.in_(tipo_ids))
+    )
+    return {id: {"id": id, "tipo": tipo, "signo": signo_movimiento(tipo)} for id, tipo in filas}
+
+
+def obtener_tipos(tipo_ids):
+    # {id: {"id", "tipo", "signo"}} servido desde la caché de referencia
+    return cache_tipos_movimiento.obtener_varios(tipo_ids, _cargar_tipos)
+
+
+def obtener_tipo(tipo_id):
+    return obtener_tipos([tipo_id]).get(tipo_id)
+
+
+def articulo_existe(articulo_id):
+    return db.session.execute(
+        db.select(Articulo.id).where(Articulo.id == articulo_id)
+    ).first() is not None
+
+
+def aplicar_delta(articulo_id, delta):
+    # Devuelve False si el artículo no existe o si el delta dejaría el
+    # stock en negativo; en ese caso no se modifica nada.
+    if delta == 0:
+        return articulo_existe(articulo_id)
+    resultado = db.session.execute(
+        _actualizar_stock_condicional, {"articulo_id": articulo_id, "delta": delta}
+    )
+    return resultado.rowcount == 1
+
+
+def _validar(item):
+    if not isinstance(item, dict):
+        return None, "El movimiento debe ser un objeto"
+    datos = {}
+    for campo in CAMPOS_MOVIMIENTO:
+        valor = item.get(campo)
+        if isinstance(valor, bool) or not isinstance(valor, int):
+            return None, f"El campo {campo} es obligatorio y debe ser entero"
+        datos[campo] = valor
+    if datos["cantidad"] <= 0:
+        return None, "La cantidad debe ser mayor que cero"
+    return datos, None
+
+
+def _error(indice, estado, mensaje):
+    return {"indice": indice, "estado": estado, "mensaje": mensaje}
+
+
+def _aplicar_uno_a_uno(articulo_ids, nuevos, tipos, deltas, resultados):
+    # El delta neto de estos artículos ya no cabe: se aplican sus movimientos
+    # de uno en uno y en orden, como en el modo síncrono, y sólo se rechazan
+    # los egresos que no caben. Actualiza deltas con lo aplicado y devuelve
+    # los índices rechazados.
+    rechazados = set()
+    for articulo_id in articulo_ids:
+        aplicado = 0
+        for indice, historial in nuevos:
+            if historial.articulo_id != articulo_id:
+                continue
+            delta = tipos[historial.tipo_movimiento_id]["signo"] * historial.cantidad
+            if aplicar_delta(articulo_id, delta):
+                aplicado += delta
+                continue
+            rechazados.add(indice)
+            if delta < 0 and articulo_existe(articulo_id):
+                resultados[indice] = _error(indice, 400, "No hay suficiente stock para realizar el egreso")
+            else:
+                resultados[indice] = _error(indice, 404, "Artículo no encontrado")
+        deltas[articulo_id] = aplicado
+    return rechazados
+
+
+def registrar_lote(items):
+    # Valida y aplica una lista de movimientos con una consulta IN por tabla
+    # referenciada, un UPDATE por artículo con el delta agregado y un INSERT
+    # para todos los movimientos. Deja la transacción sin confirmar para que
+    # el llamador haga un único commit. Devuelve un resultado por item, en
+    # el mismo orden; los historiales no quedan en la sesión.
+    resultados = [None] * len(items)
+    validos = []
+    for indice, item in enumerate(items):
+        datos, error = _validar(item)
+        if error:
+            resultados[indice] = _error(indice, 400, error)
+        else:
+            validos.append((indice, datos))
+
+    articulo_ids = {datos["articulo_id"] for _, datos in validos}
+    tipo_ids = {datos["tipo_movimiento_id"] for _, datos in validos}
+    stock = {}
+    if articulo_ids:
+        stock = dict(db.session.execute(
+            db.select(Articulo.id, Articulo.stock).where(Articulo.id.in_(articulo_ids))
+        ).all())
+    tipos = obtener_tipos(tipo_ids) if tipo_ids else {}
+
+    deltas = {}
+    nuevos = []
+    ahora = datetime.datetime.now()
+    for indice, datos in validos:
+        articulo_id = datos["articulo_id"]
+        cantidad = datos["cantidad"]
+        if articulo_id not in stock:
+            resultados[indice] = _error(indice, 404, "Artículo no encontrado")
+            continue
+        tipo = tipos.get(datos["tipo_movimiento_id"])
+        if tipo is None:
+            resultados[indice] = _error(indice, 404, "Tipo de movimiento no encontrado")
+            continue
+
+        delta = tipo["signo"] * cantidad
+        if stock[articulo_id] + delta < 0:
+            resultados[indice] = _error(indice, 400, "No hay suficiente stock para realizar el egreso")
+            continue
+        stock[articulo_id] += delta
+        deltas[articulo_id] = deltas.get(articulo_id, 0) + delta
+        nuevos.append((indice, HistorialInventario(fecha_movimiento=ahora, **datos)))
+
+    # Los ingresos netos no pueden dejar stock negativo y van en un único
+    # executemany; los egresos netos se aplican con la sentencia condicional
+    # por si otro proceso consumió stock después de la lectura.
+    ingresos = [{"articulo_id": a, "delta": d} for a, d in deltas.items() if d > 0]
+    if ingresos:
+        db.session.execute(_actualizar_stock, ingresos)
+    sin_stock = [a for a, d in deltas.items() if d < 0 and not aplicar_delta(a, d)]
+    if sin_stock:
+        rechazados = _aplicar_uno_a_uno(sin_stock, nuevos, tipos, deltas, resultados)
+        nuevos = [(indice, historial) for indice, historial in nuevos if indice not in rechazados]
+    afectados = [a for a, d in deltas.items() if d]
+    if afectados:
+        registrar_cambio("articulos", *afectados)
+    if nuevos:
+        filas = [{"articulo_id": historial.articulo_id, "tipo_movimiento_id": historial.tipo_movimiento_id,
+                  "cantidad": historial.cantidad, "fecha_movimiento": historial.fecha_movimiento}
+                 for _, historial in nuevos]
+        ids = defaultdict(list)
+        for historial_id, *valores in db.session.execute(_insertar_historial, filas):
+            ids[tuple(valores)].append(historial_id)
+        for lista in ids.values():
+            lista.sort(reverse=True)
+        for _, historial in nuevos:
+            historial.id = ids[(historial.articulo_id, historial.tipo_movimiento_id, historial.cantidad)].pop()
+        sumar_movimientos([historial for _, historial in nuevos])
+        anotar_movimientos({historial.articulo_id: historial.id for _, historial in nuevos})
+    for indice, historial in nuevos:
+        resultados[indice] = {"indice": indice, "estado": 201, "historial": historial}
+    return resultados
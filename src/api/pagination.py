@@ -0,0 +1,133 @@
+import base64
+import binascii
+import datetime
+import json
+import operator
+from urllib.parse import urlencode
+from flask import request
+from flask_restful import abort
+from sqlalchemy import and_, or_
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+
+class Orden:
+    # Orden de una lista paginada: columna de orden + id como desempate,
+    # de modo que (valor, id) identifica cada fila de forma única.
+    def __init__(self, nombre, columna, columna_id, descendente=False):
+        self.nombre = nombre
+        self.columna = columna
+        self.columna_id = columna_id
+        self.descendente = descendente
+
+    @property
+    def por_id(self):
+        return self.columna is self.columna_id
+
+    def order_by(self):
+        if self.por_id:
+            columnas = [self.columna]
+        else:
+            columnas = [self.columna, self.columna_id]
+        return [c.desc() if self.descendente else c.asc() for c in columnas]
+
+    def clave(self, fila):
+        valor = getattr(fila, self.columna.key)
+        if self.por_id:
+            return [valor]
+        return [_a_json(valor), getattr(fila, self.columna_id.key)]
+
+
+def resolver_orden(valor, columnas, columna_id, por_defecto="id"):
+    valor = valor or por_defecto
+    descendente = valor.startswith("-")
+    nombre = valor.lstrip("-")
+    if nombre not in columnas:
+        abort(400, message=f"Orden no válido: {valor}. Opciones: {', '.join(sorted(columnas))}")
+    return Orden(nombre, columnas[nombre], columna_id, descendente)
+
+
+def resolver_limite(limite):
+    if limite is None:
+        return LIMITE_POR_DEFECTO
+    if limite < 1 or limite > LIMITE_MAXIMO:
+        abort(400, message=f"El límite debe estar entre 1 y {LIMITE_MAXIMO}")
+    return limite
+
+
+def codificar_cursor(orden, clave):
+    datos = json.dumps({"o": orden.nombre, "d": orden.descendente, "k": clave}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(orden, cursor):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if datos["o"] != orden.nombre or datos["d"] != orden.descendente:
+            raise ValueError("orden distinto")
+        clave = datos["k"]
+        if len(clave) != (1 if orden.por_id else 2):
+            raise ValueError("clave incompleta")
+        if orden.por_id:
+            return None, clave[0]
+        return _de_json(orden.columna, clave[0]), clave[1]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        abort(400, message="Cursor inválido")
+
+
+def aplicar_cursor(consulta, orden, cursor, limite):
+    # Keyset: WHERE (col, id) > (:valor, :id) expandido a OR/AND para que
+    # el planificador pueda usar el índice de la columna de orden.
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(orden, cursor)
+        mayor = operator.lt if orden.descendente else operator.gt
+        if orden.por_id:
+            condicion = mayor(orden.columna_id, ultimo_id)
+        else:
+            condicion = or_(
+                mayor(orden.columna, valor),
+                and_(orden.columna == valor, mayor(orden.columna_id, ultimo_id)),
+            )
+        consulta = consulta.where(condicion)
+    # Se pide una fila de más para saber si existe una página siguiente.
+    return consulta.order_by(*orden.order_by()).limit(limite + 1)
+
+
+def cortar_pagina(filas, orden, limite):
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    return filas, codificar_cursor(orden, orden.clave(filas[-1]))
+
+
+def cabeceras_paginacion(siguiente):
+    if not siguiente:
+        return {}
+    parametros = request.args.to_dict()
+    parametros["cursor"] = siguiente
+    enlace = f"{request.base_url}?{urlencode(parametros)}"
+    return {"X-Next-Cursor": siguiente, "Link": f'<{enlace}>; rel="next"'}
+
+
+def cabeceras_desplazamiento(siguiente):
+    # Para listas ordenadas por relevancia, donde no hay clave de cursor
+    if siguiente is None:
+        return {}
+    parametros = request.args.to_dict()
+    parametros["offset"] = siguiente
+    enlace = f"{request.base_url}?{urlencode(parametros)}"
+    return {"X-Next-Offset": str(siguiente), "Link": f'<{enlace}>; rel="next"'}
+
+
+def _a_json(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _de_json(columna, valor):
+    if valor is not None and columna.type.python_type is datetime.datetime:
+        return datetime.datetime.fromisoformat(valor)
+    return valor
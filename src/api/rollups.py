@@ -0,0 +1,172 @@
+import datetime
+from collections import defaultdict
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from api.models import db, HistorialInventario, ResumenMovimientos
+
+# Resumen diario de movimientos (tabla resumen_movimientos). Cada alta o baja
+# de historial lo actualiza en su misma transacción (sumar_movimientos /
+# restar_movimientos), así un informe por periodo agrega días en lugar de
+# recorrer historial_inventario. reconstruir_resumen lo recalcula desde el
+# historial para rellenar bases existentes o reparar un rango.
+#
+# El archivo (api/archive.py) borra movimientos del historial pero no del
+# resumen: los informes siguen cubriendo los meses archivados.
+GRANULARIDADES = ("dia", "semana", "mes")
+PERIODOS_POR_DEFECTO = {"dia": 30, "semana": 12, "mes": 12}
+MAXIMO_PERIODOS = 1000
+
+CLAVE = ("articulo_id", "tipo_movimiento_id", "dia")
+
+_tabla = ResumenMovimientos.__table__
+
+_INSERT_CON_CONFLICTO = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert
+}
+
+_en_clave = [_tabla.c[campo] == bindparam(f"clave_{campo}") for campo in CLAVE]
+
+# Para las bajas y para los motores sin INSERT ... ON CONFLICT
+_incrementar = _tabla.update().where(*_en_clave).values(
+    cantidad=_tabla.c.cantidad + bindparam("delta_cantidad"),
+    movimientos=_tabla.c.movimientos + bindparam("delta_movimientos")
+)
+_borrar_vacias = _tabla.delete().where(*_en_clave, _tabla.c.movimientos <= 0)
+
+
+def _agregar(historiales):
+    totales = defaultdict(lambda: [0, 0])
+    for historial in historiales:
+        total = totales[(historial.articulo_id, historial.tipo_movimiento_id, historial.fecha_movimiento.date())]
+        total[0] += historial.cantidad
+        total[1] += 1
+    return [dict(zip(CLAVE, clave), cantidad=cantidad, movimientos=movimientos)
+            for clave, (cantidad, movimientos) in totales.items()]
+
+
+def _como_delta(fila, signo):
+    parametros = {f"clave_{campo}": fila[campo] for campo in CLAVE}
+    parametros.update(delta_cantidad=signo * fila["cantidad"], delta_movimientos=signo * fila["movimientos"])
+    return parametros
+
+
+def sumar_movimientos(historiales):
+    # Después del flush de los movimientos y antes del commit del llamador.
+    # Una fila por (artículo, tipo, día) aunque el lote traiga muchas.
+    filas = _agregar(historiales)
+    if not filas:
+        return
+    insert = _INSERT_CON_CONFLICTO.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        sentencia = insert(_tabla)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=list(CLAVE),
+            set_={"cantidad": _tabla.c.cantidad + sentencia.excluded.cantidad,
+                  "movimientos": _tabla.c.movimientos + sentencia.excluded.movimientos}
+        )
+        db.session.execute(sentencia, filas if len(filas) > 1 else filas[0])
+        return
+    for fila in filas:
+        if db.session.execute(_incrementar, _como_delta(fila, 1)).rowcount == 0:
+            db.session.execute(_tabla.insert(), fila)
+
+
+def restar_movimientos(historiales):
+    deltas = [_como_delta(fila, -1) for fila in _agregar(historiales)]
+    if not deltas:
+        return
+    db.session.execute(_incrementar, deltas)
+    db.session.execute(_borrar_vacias, deltas)
+
+
+def _inicio(fecha):
+    return datetime.datetime.combine(fecha, datetime.time.min)
+
+
+def reconstruir_resumen(desde=None, hasta=None):
+    # Recalcula los días [desde, hasta] con un INSERT ... SELECT agrupado.
+    # Sin desde empieza en el primer movimiento que queda en el historial,
+    # así no se pierde el resumen de los meses ya archivados. Devuelve el
+    # número de filas de resumen escritas; el commit es del llamador.
+    if desde is None:
+        primero = db.session.execute(db.select(db.func.min(HistorialInventario.fecha_movimiento))).scalar()
+        if primero is None:
+            return 0
+        desde = primero.date()
+    rango_resumen = [ResumenMovimientos.dia >= desde]
+    rango_historial = [HistorialInventario.fecha_movimiento >= _inicio(desde)]
+    if hasta is not None:
+        rango_resumen.append(ResumenMovimientos.dia <= hasta)
+        rango_historial.append(HistorialInventario.fecha_movimiento < _inicio(hasta + datetime.timedelta(days=1)))
+
+    dia = db.func.date(HistorialInventario.fecha_movimiento)
+    agregado = (
+        db.select(HistorialInventario.articulo_id, HistorialInventario.tipo_movimiento_id, dia,
+                  db.func.sum(HistorialInventario.cantidad), db.func.count())
+        .where(*rango_historial)
+        .group_by(HistorialInventario.articulo_id, HistorialInventario.tipo_movimiento_id, dia)
+    )
+    db.session.execute(db.delete(ResumenMovimientos).where(*rango_resumen))
+    resultado = db.session.execute(
+        _tabla.insert().from_select(list(CLAVE) + ["cantidad", "movimientos"], agregado)
+    )
+    return resultado.rowcount
+
+
+def inicio_periodo(dia, granularidad):
+    # Semanas de lunes a domingo (ISO) y meses naturales
+    if granularidad == "semana":
+        return dia - datetime.timedelta(days=dia.weekday())
+    if granularidad == "mes":
+        return dia.replace(day=1)
+    return dia
+
+
+def fin_periodo(dia, granularidad):
+    if granularidad == "semana":
+        return inicio_periodo(dia, granularidad) + datetime.timedelta(days=6)
+    if granularidad == "mes":
+        return datetime.date(dia.year + dia.month // 12, dia.month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return dia
+
+
+def retroceder(dia, granularidad, periodos):
+    # Inicio del periodo que queda `periodos - 1` periodos antes del de `dia`
+    inicio = inicio_periodo(dia, granularidad)
+    if granularidad == "mes":
+        meses = inicio.year * 12 + inicio.month - 1 - (periodos - 1)
+        return datetime.date(meses // 12, meses % 12 + 1, 1)
+    return inicio - datetime.timedelta(days=(periodos - 1) * (7 if granularidad == "semana" else 1))
+
+
+def contar_periodos(desde, hasta, granularidad):
+    if granularidad == "mes":
+        return (hasta.year - desde.year) * 12 + hasta.month - desde.month + 1
+    dias = (inicio_periodo(hasta, granularidad) - inicio_periodo(desde, granularidad)).days
+    return dias // (7 if granularidad == "semana" else 1) + 1
+
+
+def serie_movimientos(desde, hasta, granularidad="dia", articulo_id=None, tipo_movimiento_id=None):
+    # Unidades y número de movimientos por periodo y tipo. El rango se amplía
+    # a periodos completos; los periodos sin movimientos no aparecen. La
+    # base agrupa por día y aquí se suman los días de cada semana o mes.
+    desde, hasta = inicio_periodo(desde, granularidad), fin_periodo(hasta, granularidad)
+    consulta = (
+        db.select(ResumenMovimientos.dia, ResumenMovimientos.tipo_movimiento_id,
+                  db.func.sum(ResumenMovimientos.cantidad), db.func.sum(ResumenMovimientos.movimientos))
+        .where(ResumenMovimientos.dia >= desde, ResumenMovimientos.dia <= hasta)
+        .group_by(ResumenMovimientos.dia, ResumenMovimientos.tipo_movimiento_id)
+    )
+    if articulo_id is not None:
+        consulta = consulta.where(ResumenMovimientos.articulo_id == articulo_id)
+    if tipo_movimiento_id is not None:
+        consulta = consulta.where(ResumenMovimientos.tipo_movimiento_id == tipo_movimiento_id)
+
+    totales = defaultdict(lambda: [0, 0])
+    for dia, tipo_id, cantidad, movimientos in db.session.execute(consulta):
+        total = totales[(inicio_periodo(dia, granularidad), tipo_id)]
+        total[0] += cantidad
+        total[1] += movimientos
+    return [{"periodo": periodo.isoformat(), "tipo_movimiento_id": tipo_id, "cantidad": cantidad, "movimientos": movimientos}
+            for (periodo, tipo_id), (cantidad, movimientos) in sorted(totales.items())]
@@ -0,0 +1,25 @@
+from api.controllers import ArticuloResource, ArticuloStockResource, ArticulosResource, ArticulosExportResource, ArticulosImportResource, ArticulosValoracionResource, ArticulosPrevisionResource, ArticulosCambiosResource, ArticulosBusquedaResource, CategoriaResource, CategoriasResource, ProveedorResource, ProveedoresResource, TiposMovimientoResource, TipoMovimientoResource, HistorialDetalleResource, HistorialResource, HistorialExportResource, HistorialLoteResource, HistorialResumenResource, MetricasResource
+
+
+def registrar_rutas(api):
+    api.add_resource(ArticulosResource, '/api/articulos')
+    api.add_resource(ArticulosExportResource, '/api/articulos/exportar')
+    api.add_resource(ArticulosImportResource, '/api/articulos/importar')
+    api.add_resource(ArticulosValoracionResource, '/api/articulos/valoracion')
+    api.add_resource(ArticulosPrevisionResource, '/api/articulos/prevision')
+    api.add_resource(ArticulosCambiosResource, '/api/articulos/cambios')
+    api.add_resource(ArticulosBusquedaResource, '/api/articulos/buscar')
+    api.add_resource(ArticuloResource, '/api/articulos/<int:articulo_id>')
+    api.add_resource(ArticuloStockResource, '/api/articulos/<int:articulo_id>/stock')
+    api.add_resource(CategoriasResource, '/api/categorias')
+    api.add_resource(CategoriaResource, '/api/categorias/<int:categoria_id>')
+    api.add_resource(ProveedoresResource, '/api/proveedores')
+    api.add_resource(ProveedorResource, '/api/proveedores/<int:proveedor_id>')
+    api.add_resource(HistorialResource, '/api/historial_inventario')
+    api.add_resource(HistorialExportResource, '/api/historial_inventario/exportar')
+    api.add_resource(HistorialLoteResource, '/api/historial_inventario/lote')
+    api.add_resource(HistorialResumenResource, '/api/historial_inventario/resumen')
+    api.add_resource(HistorialDetalleResource, '/api/historial_inventario/<int:historial_id>')
+    api.add_resource(TiposMovimientoResource, '/api/tipos_movimiento')
+    api.add_resource(TipoMovimientoResource, '/api/tipos_movimiento/<int:tipo_id>')
+    api.add_resource(MetricasResource, '/api/metricas')
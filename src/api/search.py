@@ -0,0 +1,90 @@
+import re
+from sqlalchemy import DDL, event, literal_column, or_, table, column, text
+from api.models import db, Articulo
+
+# Índice de texto completo sobre nombre y descripción de los artículos.
+# En SQLite es una tabla FTS5 de contenido externo (no duplica los textos)
+# que mantienen sincronizada los triggers, así que cualquier escritura sobre
+# articulos (ORM o Core) la actualiza sin tocar los handlers. Los cambios de
+# stock no la tocan: el trigger de UPDATE sólo salta con nombre/descripción.
+TABLA_FTS = "articulos_fts"
+
+# nombre pesa más que descripción al ordenar por relevancia (bm25)
+PESO_NOMBRE = 10.0
+PESO_DESCRIPCION = 1.0
+
+_DDL_FTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        nombre, descripcion,
+        content='articulos', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON articulos BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, nombre, descripcion) VALUES (new.id, new.nombre, new.descripcion);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON articulos BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, nombre, descripcion) VALUES ('delete', old.id, old.nombre, old.descripcion);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF nombre, descripcion ON articulos BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, nombre, descripcion) VALUES ('delete', old.id, old.nombre, old.descripcion);
+        INSERT INTO {TABLA_FTS}(rowid, nombre, descripcion) VALUES (new.id, new.nombre, new.descripcion);
+    END""",
+]
+
+_DDL_BORRADO = [
+    f"DROP TRIGGER IF EXISTS {TABLA_FTS}_ai",
+    f"DROP TRIGGER IF EXISTS {TABLA_FTS}_ad",
+    f"DROP TRIGGER IF EXISTS {TABLA_FTS}_au",
+    f"DROP TABLE IF EXISTS {TABLA_FTS}",
+]
+
+for sentencia in _DDL_FTS:
+    event.listen(Articulo.__table__, "after_create", DDL(sentencia).execute_if(dialect="sqlite"))
+for sentencia in _DDL_BORRADO:
+    event.listen(Articulo.__table__, "before_drop", DDL(sentencia).execute_if(dialect="sqlite"))
+
+
+def crear_indice_busqueda(conexion):
+    # Para bases creadas antes de existir el índice (create_all no vuelve a
+    # lanzar after_create sobre una tabla existente): crea lo que falte y
+    # reconstruye el índice desde articulos.
+    if conexion.dialect.name != "sqlite":
+        return
+    for sentencia in _DDL_FTS:
+        conexion.execute(text(sentencia))
+    conexion.execute(text(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')"))
+
+
+_fts = table(TABLA_FTS, column("rowid"))
+_columna_fts = literal_column(TABLA_FTS)
+
+
+def terminos(texto):
+    return re.findall(r"\w+", texto or "")
+
+
+def _expresion_fts(palabras):
+    # Cada palabra entre comillas (sin operadores FTS5 del usuario) y como
+    # prefijo: "lap asu" encuentra "Laptop ASUS". Espacio = AND.
+    return " ".join(f'"{palabra}"*' for palabra in palabras)
+
+
+def buscar_articulos(consulta, palabras, limite, desplazamiento):
+    # consulta: select de columnas de Articulo; devuelve limite + 1 filas
+    # para saber si hay otra página.
+    if db.session.get_bind().dialect.name == "sqlite":
+        consulta = (
+            consulta.join(_fts, _fts.c.rowid == Articulo.id)
+            .where(_columna_fts.match(_expresion_fts(palabras)))
+            .order_by(db.func.bm25(_columna_fts, PESO_NOMBRE, PESO_DESCRIPCION), Articulo.id)
+        )
+    else:
+        # Sin FTS5: LIKE por prefijo de palabra no es posible con índice, se
+        # busca por subcadena y sin ranking.
+        for palabra in palabras:
+            consulta = consulta.where(or_(
+                Articulo.nombre.icontains(palabra, autoescape=True),
+                Articulo.descripcion.icontains(palabra, autoescape=True)
+            ))
+        consulta = consulta.order_by(Articulo.id)
+    return db.session.execute(consulta.limit(limite + 1).offset(desplazamiento)).all()
@@ -0,0 +1,117 @@
+import datetime
+from sqlalchemy import exists, false, literal, or_
+from api.models import db, Articulo, HistorialInventario, SnapshotStock
+from api.movements import obtener_tipos
+from api.archive import alcanza_archivo, leer_archivo
+
+# Un snapshot guarda el stock de un artículo en una fecha. El stock a una
+# fecha D se calcula desde el snapshot más cercano, aplicando sólo los
+# movimientos entre ambas fechas, así el coste no depende de la longitud
+# del historial sino de la frecuencia de los snapshots (ver crear_snapshots.py).
+MOTIVO_ALTA = "alta"
+MOTIVO_EDICION = "edicion"
+MOTIVO_PERIODICO = "periodico"
+
+
+def registrar_snapshot(articulo_id, stock, motivo):
+    # Para cambios de stock que no son movimientos (alta y edición del
+    # artículo): sin ellos el historial no bastaría para reconstruirlo.
+    db.session.add(SnapshotStock(articulo_id=articulo_id, stock=stock, motivo=motivo))
+
+
+def _bloquear_movimientos():
+    # Hasta el commit del llamador no se confirma ningún movimiento nuevo
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Los movimientos actualizan el stock antes de insertar en el
+        # historial: bloquear sólo el historial dejaría pasar a uno que ya
+        # tiene la fecha y el UPDATE hechos. Se bloquean las dos tablas en
+        # el mismo orden que los movimientos, esperando a los que están a
+        # medias; SHARE ROW EXCLUSIVE además excluye otro crear_snapshots.
+        db.session.execute(db.text("LOCK TABLE articulos, historial_inventario IN SHARE ROW EXCLUSIVE MODE"))
+    else:
+        # En SQLite la primera escritura toma el bloqueo de escritura de la
+        # base; un UPDATE sin filas basta
+        db.session.execute(db.update(SnapshotStock).where(false()).values(stock=SnapshotStock.stock))
+
+
+def crear_snapshots(ahora=None, todos=False):
+    # Un snapshot para cada artículo con movimientos posteriores a su último
+    # snapshot (o para todos con todos=True), en una sola sentencia
+    # INSERT ... SELECT para que todos lean el stock en el mismo instante.
+    # La hora se toma con el bloqueo ya tomado: un movimiento confirmado
+    # entre la hora y el SELECT entraría en el stock con fecha posterior al
+    # snapshot y se contaría dos veces al calcular el stock a una fecha.
+    _bloquear_movimientos()
+    ahora = ahora or datetime.datetime.now()
+    consulta = db.select(Articulo.id, literal(ahora, db.DateTime), Articulo.stock, literal(MOTIVO_PERIODICO))
+    if not todos:
+        ultimo = (
+            db.select(db.func.max(SnapshotStock.fecha))
+            .where(SnapshotStock.articulo_id == Articulo.id)
+            .scalar_subquery()
+        )
+        consulta = consulta.where(exists().where(
+            HistorialInventario.articulo_id == Articulo.id,
+            or_(ultimo.is_(None), HistorialInventario.fecha_movimiento > ultimo)
+        ))
+    resultado = db.session.execute(
+        db.insert(SnapshotStock).from_select(["articulo_id", "fecha", "stock", "motivo"], consulta)
+    )
+    return resultado.rowcount
+
+
+def _delta_movimientos(articulo_id, desde, hasta):
+    # Suma con signo de los movimientos con desde < fecha <= hasta
+    consulta = (
+        db.select(HistorialInventario.tipo_movimiento_id,
+                  db.func.sum(HistorialInventario.cantidad), db.func.count())
+        .where(HistorialInventario.articulo_id == articulo_id)
+        .group_by(HistorialInventario.tipo_movimiento_id)
+    )
+    if desde is not None:
+        consulta = consulta.where(HistorialInventario.fecha_movimiento > desde)
+    if hasta is not None:
+        consulta = consulta.where(HistorialInventario.fecha_movimiento <= hasta)
+    filas = db.session.execute(consulta).all()
+    if alcanza_archivo(desde):
+        # Parte del rango está en el archivo de historial
+        archivadas = {}
+        for fila in leer_archivo(desde, hasta, articulo_id=articulo_id, incluir_desde=False):
+            cantidad, total = archivadas.get(fila.tipo_movimiento_id, (0, 0))
+            archivadas[fila.tipo_movimiento_id] = (cantidad + fila.cantidad, total + 1)
+        filas += [(tipo_id, cantidad, total) for tipo_id, (cantidad, total) in archivadas.items()]
+    tipos = obtener_tipos(list({tipo_id for tipo_id, _, _ in filas}))
+    delta = sum(tipos[tipo_id]["signo"] * cantidad for tipo_id, cantidad, _ in filas if tipo_id in tipos)
+    return delta, sum(total for _, _, total in filas)
+
+
+def _snapshot(articulo_id, condicion, orden):
+    return db.session.execute(
+        db.select(SnapshotStock.fecha, SnapshotStock.stock, SnapshotStock.motivo)
+        .where(SnapshotStock.articulo_id == articulo_id, condicion)
+        .order_by(*orden)
+        .limit(1)
+    ).first()
+
+
+def stock_a_fecha(articulo_id, fecha):
+    # Devuelve None si el artículo aún no existía en esa fecha
+    anterior = _snapshot(articulo_id, SnapshotStock.fecha <= fecha,
+                         (SnapshotStock.fecha.desc(), SnapshotStock.id.desc()))
+    if anterior is not None:
+        delta, movimientos = _delta_movimientos(articulo_id, anterior.fecha, fecha)
+        return {"stock": anterior.stock + delta, "snapshot": anterior.fecha, "movimientos_aplicados": movimientos}
+
+    # Sin snapshot anterior (artículos previos a los snapshots) se parte del
+    # siguiente, o del stock actual, y se deshacen los movimientos.
+    siguiente = _snapshot(articulo_id, SnapshotStock.fecha > fecha,
+                          (SnapshotStock.fecha.asc(), SnapshotStock.id.asc()))
+    if siguiente is None:
+        stock = db.session.execute(db.select(Articulo.stock).where(Articulo.id == articulo_id)).scalar()
+        hasta = None
+    elif siguiente.motivo == MOTIVO_ALTA:
+        return None
+    else:
+        stock, hasta = siguiente.stock, siguiente.fecha
+    delta, movimientos = _delta_movimientos(articulo_id, fecha, hasta)
+    return {"stock": stock - delta, "snapshot": hasta, "movimientos_aplicados": movimientos}
@@ -0,0 +1,164 @@
+import datetime
+import hashlib
+import time
+from functools import wraps
+from flask import Response, g, request
+from flask_restful.utils import unpack
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.http import http_date, quote_etag
+from api.models import db, VersionRecurso
+from api.cache import REFERENCIAS
+
+# Los contadores viven en la base de datos y no en memoria para que todos
+# los workers vean el mismo valor: un ETag nunca puede dar un 304 falso
+# porque otro proceso haya escrito.
+_INSERT_CON_CONFLICTO = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert
+}
+
+
+# La versión de una colección no es una fila sino FRAGMENTOS: cada escritura
+# incrementa sólo uno (el de su primer elemento) y la versión es la suma. Con
+# una sola fila, todas las transacciones que tocan la colección (cada
+# movimiento cambia un artículo) esperarían en PostgreSQL por el bloqueo de
+# esa fila hasta el commit de la anterior.
+FRAGMENTOS = 16
+
+
+def clave_item(coleccion, item_id):
+    return f"{coleccion}/{item_id}"
+
+
+def claves_fragmentos(coleccion):
+    return [f"{coleccion}#{n}" for n in range(FRAGMENTOS)]
+
+
+def _fragmento(coleccion, item_ids):
+    return f"{coleccion}#{item_ids[0] % FRAGMENTOS if item_ids else 0}"
+
+
+def registrar_cambio(coleccion, *item_ids):
+    # Incrementa la versión de la colección y de cada elemento indicado
+    # dentro de la transacción en curso; se confirma con el mismo commit que
+    # el cambio, justo antes de él para retener el bloqueo lo mínimo. Las
+    # claves van ordenadas para que dos transacciones bloqueen las filas en
+    # el mismo orden.
+    item_ids = sorted(dict.fromkeys(item_ids))
+    claves = [_fragmento(coleccion, item_ids)] + [clave_item(coleccion, item_id) for item_id in item_ids]
+    ahora = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    insert = _INSERT_CON_CONFLICTO.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        # executemany de una sentencia fija (compilada una vez y cacheada)
+        # en lugar de un VALUES múltiple distinto para cada número de claves
+        sentencia = insert(VersionRecurso.__table__)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[VersionRecurso.clave],
+            set_={"version": VersionRecurso.version + 1, "actualizado": sentencia.excluded.actualizado}
+        )
+        filas = [{"clave": clave, "version": 1, "actualizado": ahora} for clave in claves]
+        db.session.execute(sentencia, filas if len(filas) > 1 else filas[0])
+        return
+    existentes = set(db.session.scalars(db.select(VersionRecurso.clave).where(VersionRecurso.clave.in_(claves))))
+    db.session.execute(
+        db.update(VersionRecurso).where(VersionRecurso.clave.in_(existentes))
+        .values(version=VersionRecurso.version + 1, actualizado=ahora)
+    )
+    db.session.add_all([VersionRecurso(clave=clave, version=1, actualizado=ahora) for clave in claves if clave not in existentes])
+
+
+def _filas_de(clave):
+    # Claves de VersionRecurso que forman la versión de `clave`: la suya si
+    # es un elemento, los fragmentos si es una colección
+    return [clave] if "/" in clave else claves_fragmentos(clave)
+
+
+def obtener_versiones(claves):
+    # Versión combinada de varias claves en una sola consulta: la
+    # concatenación de versiones y la última fecha de modificación.
+    filas = dict((fila.clave, fila) for fila in db.session.execute(
+        db.select(VersionRecurso.clave, VersionRecurso.version, VersionRecurso.actualizado)
+        .where(VersionRecurso.clave.in_([fila for clave in claves for fila in _filas_de(clave)]))
+    ))
+    version = ".".join(str(sum(filas[fila].version for fila in _filas_de(clave) if fila in filas)) for clave in claves)
+    fechas = [fila.actualizado for fila in filas.values()]
+    return version, max(fechas) if fechas else None
+
+
+def obtener_version(clave):
+    return obtener_versiones([clave])
+
+
+def sincronizar_caches(caches=REFERENCIAS):
+    # Las cachés de referencia sólo se invalidan en el proceso que escribe;
+    # el resto de workers se entera aquí comparando la versión de cada
+    # colección con la última que vio.
+    versiones = obtener_versiones([cache.nombre for cache in caches])[0].split(".")
+    for cache, version in zip(caches, versiones):
+        cache.sincronizar(int(version))
+
+
+def registrar_sincronizacion(app):
+    intervalo = app.config['CACHE_SINCRONIZACION_S']
+    siguiente = [0.0]
+
+    @app.before_request
+    def sincronizar():
+        # Como mucho una consulta por intervalo y proceso
+        ahora = time.monotonic()
+        if ahora >= siguiente[0]:
+            siguiente[0] = ahora + intervalo
+            sincronizar_caches()
+
+
+def _etag(clave, version):
+    # La representación depende también de los parámetros de la petición
+    # (filtros, página, orden...), así que forman parte del ETag.
+    parametros = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    resumen = hashlib.sha1(f"{clave}:{version}:{parametros}".encode()).hexdigest()[:20]
+    return f"{version}-{resumen}"
+
+
+def _no_modificado(etag, actualizado):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and actualizado:
+        return actualizado.replace(microsecond=0, tzinfo=datetime.timezone.utc) <= request.if_modified_since
+    return False
+
+
+def condicional(coleccion, parametro=None, adicionales=None):
+    # Decorador para GET: consulta sólo la versión y responde 304 antes de
+    # cargar o serializar filas si el cliente ya tiene esa representación.
+    # `coleccion` puede ser una tupla si la respuesta combina varias, y
+    # `adicionales` una función que devuelve más colecciones según la
+    # petición (p. ej. las relaciones pedidas con ?expand=).
+    colecciones = coleccion if isinstance(coleccion, tuple) else (coleccion,)
+
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if parametro is None:
+                claves = list(colecciones)
+            else:
+                claves = [clave_item(colecciones[0], kwargs[parametro])] + list(colecciones[1:])
+            if adicionales is not None:
+                claves += [clave for clave in adicionales() if clave not in claves]
+            clave = ",".join(claves)
+            version, actualizado = obtener_versiones(claves)
+            etag = _etag(clave, version)
+            cabeceras = {"ETag": quote_etag(etag), "Cache-Control": "no-cache"}
+            if actualizado:
+                cabeceras["Last-Modified"] = http_date(actualizado.replace(tzinfo=datetime.timezone.utc))
+            if _no_modificado(etag, actualizado):
+                return Response(status=304, headers=cabeceras)
+            # Para respuesta_en_cache (api/compression.py)
+            g.representacion = f"{clave}:{version}"
+            resultado = funcion(*args, **kwargs)
+            if isinstance(resultado, Response):
+                resultado.headers.update(cabeceras)
+                return resultado
+            datos, codigo, extra = unpack(resultado)
+            return datos, codigo, {**extra, **cabeceras}
+        return envoltura
+    return decorador
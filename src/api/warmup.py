@@ -0,0 +1,53 @@
+from sqlalchemy.orm import configure_mappers
+from api.models import db
+from api.versions import sincronizar_caches
+from api.feed import crear_feed
+
+# Arranque de servidor.py con varios workers. La aplicación se carga y se
+# calienta una vez en el proceso maestro antes del fork: mappers
+# configurados, sentencias compiladas en la caché del engine, serializadores
+# compilados y cachés de referencia llenas. Los workers heredan todo eso (copy
+# on write) y la primera petición de cada uno no paga la configuración.
+RUTAS_CALENTAMIENTO = (
+    "/api/categorias",
+    "/api/proveedores",
+    "/api/tipos_movimiento",
+    "/api/tipos_movimiento/1",
+    "/api/articulos?limit=1",
+    "/api/articulos?fields=id,nombre,stock&limit=1",
+    "/api/articulos?expand=categoria,proveedor,historial&limit=1",
+    "/api/articulos/1",
+    "/api/articulos/1?expand=categoria,proveedor,historial",
+    "/api/articulos/buscar?q=a&limit=1",
+    "/api/historial_inventario?limit=1",
+    "/api/historial_inventario/1",
+)
+
+
+def calentar(app, rutas=RUTAS_CALENTAMIENTO):
+    # Peticiones GET de solo lectura: compilan lo mismo que compilará el
+    # tráfico real. Un 404 (base vacía) también sirve.
+    configure_mappers()
+    with app.app_context():
+        sincronizar_caches()
+        cliente = app.test_client()
+        estados = {ruta: cliente.get(ruta).status_code for ruta in rutas}
+    return estados
+
+
+def tras_fork(app):
+    # En cada worker nuevo: las conexiones del pool no se comparten entre
+    # procesos (close=False: no cerrar las que use el padre), y el feed SSE
+    # necesita su propio hilo de lectura.
+    with app.app_context():
+        db.engine.dispose(close=False)
+    app.extensions['feed_stock'] = crear_feed(app)
+
+
+def al_salir(app, timeout=None):
+    # Parada ordenada de un worker: confirmar los movimientos encolados y
+    # parar el hilo del feed
+    cola = app.extensions.get('cola_movimientos')
+    if cola is not None:
+        cola.detener(timeout)
+    app.extensions['feed_stock'].detener()
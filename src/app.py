@@ -1,35 +1,148 @@
+import os
+from collections.abc import Mapping
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_restful import Api, Resource, reqparse, fields, marshal_with
-from api.models import db, Articulo, Categoria, Proveedor,TipoMovimiento,HistorialInventario 
-from api.controllers import ArticuloResource, ArticulosResource, CategoriaResource, CategoriasResource, ProveedorResource, ProveedoresResource, TiposMovimientoResource, TipoMovimientoResource, HistorialDetalleResource, HistorialResource
-
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
-api = Api(app)
-
-with app.app_context():
-    db.create_all()
-
-
-# --- Rutas ---
-api.add_resource(ArticulosResource, '/api/articulos')
-api.add_resource(ArticuloResource, '/api/articulos/<int:articulo_id>')
-api.add_resource(CategoriasResource, '/api/categorias')
-api.add_resource(CategoriaResource, '/api/categorias/<int:categoria_id>')
-api.add_resource(ProveedoresResource, '/api/proveedores')
-api.add_resource(ProveedorResource, '/api/proveedores/<int:proveedor_id>')
-api.add_resource(HistorialResource, '/api/historial_inventario')
-api.add_resource(HistorialDetalleResource, '/api/historial_inventario/<int:historial_id>')
-api.add_resource(TiposMovimientoResource, '/api/tipos_movimiento')
-api.add_resource(TipoMovimientoResource, '/api/tipos_movimiento/<int:tipo_movimiento_id>')
-
-@app.route('/')
-def hello():
-    return "<p>Hello, World!</p>"
+from flask_restful import Api
+from sqlalchemy import event
+from api.models import db
+from api.routes import registrar_rutas
+from api.cache import invalidar_caches
+from api.group_commit import crear_cola
+from api.instrumentation import instrumentar
+from api.feed import crear_feed
+from api.compression import registrar_compresion
+from api.versions import registrar_sincronizacion
+
+# Valores por defecto; se pueden sobrescribir con variables de entorno
+# FLASK_* (p. ej. FLASK_SQLALCHEMY_DATABASE_URI, FLASK_DB_POOL_SIZE=20) o
+# con el parámetro config de create_app.
+CONFIG_POR_DEFECTO = {
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///database.db',
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'SQLALCHEMY_ENGINE_OPTIONS': {},
+    # Pool de conexiones (no aplica a SQLite en memoria, que usa una sola)
+    'DB_POOL_SIZE': None,
+    'DB_MAX_OVERFLOW': None,
+    'DB_POOL_PRE_PING': True,
+    'DB_POOL_RECYCLE': 1800,
+    # PRAGMAs aplicados a cada conexión SQLite nueva. WAL permite lectores
+    # concurrentes con un escritor; NORMAL sólo sincroniza en checkpoints.
+    'SQLITE_PRAGMAS': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+    },
+    # Group commit de movimientos: POST /api/historial_inventario encola el
+    # movimiento y un hilo confirma los pendientes en grupos de hasta
+    # GROUP_COMMIT_TAMANO, esperando como mucho GROUP_COMMIT_ESPERA_MS. Con
+    # False cada petición hace su propio commit.
+    'MOVIMIENTOS_GROUP_COMMIT': False,
+    'GROUP_COMMIT_TAMANO': 200,
+    'GROUP_COMMIT_ESPERA_MS': 2,
+    'GROUP_COMMIT_CAPACIDAD': 10000,
+    'GROUP_COMMIT_TIMEOUT': 30,
+    # Instrumentación por petición (api/instrumentation.py). None desactiva
+    # el aviso correspondiente en el log.
+    'SERVER_TIMING': True,
+    'UMBRAL_PETICION_LENTA_MS': 500,
+    'UMBRAL_SENTENCIAS_REPETIDAS': 10,
+    # Archivo de historial (archivar_historial.py): meses anteriores al
+    # horizonte, en ficheros gzip bajo ARCHIVO_HISTORIAL_DIR (por defecto
+    # instance/archivo_historial).
+    'ARCHIVO_HISTORIAL_DIR': None,
+    'ARCHIVO_HORIZONTE_DIAS': 365,
+    # Feed de cambios de stock por SSE (GET /api/articulos/cambios): eventos
+    # guardados para reanudar con Last-Event-ID, segundos entre latidos,
+    # duración máxima de una conexión (el navegador se reconecta solo) y
+    # cada cuánto lee cada proceso los cambios confirmados por los demás.
+    # FEED_CONEXIONES_MAXIMAS limita las conexiones abiertas por proceso
+    # (None: sin límite); servidor.py reserva un hilo para cada una.
+    'FEED_CAPACIDAD': 10000,
+    'FEED_LATIDO_S': 15,
+    'FEED_DURACION_MAXIMA_S': 300,
+    'FEED_SONDEO_S': 0.5,
+    'FEED_CONEXIONES_MAXIMAS': None,
+    # Compresión de respuestas (api/compression.py): br si está instalado
+    # brotli, si no gzip. Por debajo del mínimo no compensa.
+    'COMPRESION': True,
+    'COMPRESION_MINIMO_BYTES': 1024,
+    'COMPRESION_NIVEL_GZIP': 6,
+    'COMPRESION_NIVEL_BROTLI': 5,
+    # Con varios procesos: cada cuántos segundos comprueba cada uno si otro
+    # cambió categorías, proveedores o tipos de movimiento, para vaciar sus
+    # cachés de referencia (api/versions.py). servidor.py lo activa; con un
+    # solo proceso no hace falta.
+    'CACHE_SINCRONIZACION_S': None,
+}
+
+
+def _opciones_motor(config):
+    opciones = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    en_memoria = uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') == 'sqlite:')
+    opciones.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+    if config['DB_POOL_RECYCLE'] is not None:
+        opciones.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    if not en_memoria:
+        if config['DB_POOL_SIZE'] is not None:
+            opciones.setdefault('pool_size', config['DB_POOL_SIZE'])
+        if config['DB_MAX_OVERFLOW'] is not None:
+            opciones.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    return opciones
+
+
+def _registrar_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def aplicar_pragmas(conexion, registro):
+        cursor = conexion.cursor()
+        for nombre, valor in pragmas.items():
+            cursor.execute(f'PRAGMA {nombre}={valor}')
+        cursor.close()
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(CONFIG_POR_DEFECTO)
+    app.config.from_prefixed_env()
+    if isinstance(config, Mapping):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _opciones_motor(app.config)
+    if app.config['ARCHIVO_HISTORIAL_DIR'] is None:
+        app.config['ARCHIVO_HISTORIAL_DIR'] = os.path.join(app.instance_path, 'archivo_historial')
+
+    # El esquema no se crea aquí: ver create_db.py
+    db.init_app(app)
+    with app.app_context():
+        _registrar_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        instrumentar(app, db.engine)
+
+    # Las cachés de referencia son del proceso, no de la aplicación
+    invalidar_caches()
+
+    if app.config['CACHE_SINCRONIZACION_S'] is not None:
+        registrar_sincronizacion(app)
+    registrar_compresion(app)
+    app.extensions['feed_stock'] = crear_feed(app)
+
+    if app.config['MOVIMIENTOS_GROUP_COMMIT']:
+        app.extensions['cola_movimientos'] = crear_cola(app)
+
+    api = Api(app)
+
+    # --- Rutas ---
+    registrar_rutas(api)
+
+    @app.route('/')
+    def hello():
+        return "<p>Hello, World!</p>"
+
+    return app
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Servidor de desarrollo; en producción: python servidor.py
+    create_app().run(debug=True)
@@ -0,0 +1,18 @@
+import argparse
+from app import create_app
+from api.archive import archivar_historial, corte_para
+
+# Mueve los movimientos de los meses anteriores al horizonte a ficheros
+# gzip mensuales (ver api/archive.py). Pensado para ejecutarse desde cron.
+parser = argparse.ArgumentParser(description="Archiva el historial de inventario antiguo")
+parser.add_argument("--horizonte-dias", type=int, help="antigüedad mínima a archivar (por defecto ARCHIVO_HORIZONTE_DIAS)")
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    corte = corte_para(args.horizonte_dias if args.horizonte_dias is not None else app.config['ARCHIVO_HORIZONTE_DIAS'])
+    particiones = archivar_historial(corte)
+    for particion in particiones:
+        print(f"{particion.periodo}: {particion.filas} movimientos -> {particion.fichero}")
+    print(f"Archivados {sum(p.filas for p in particiones)} movimientos anteriores a {corte:%Y-%m-%d}")
@@ -0,0 +1,356 @@
+# Benchmark de carga de la API: siembra una base SQLite en disco con volúmenes
+# configurables, levanta la aplicación en un servidor WSGI local y recorre
+# todas las rutas registradas con clientes concurrentes. Informa throughput y
+# latencias p50/p95/p99 por endpoint y las compara con una línea base.
+#
+#   python benchmarks/bench_endpoints.py                      # comparar
+#   python benchmarks/bench_endpoints.py --guardar-baseline   # regenerar
+#
+# Sale con código 1 si algún endpoint falla, empeora más que la tolerancia o
+# no tiene línea base.
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento, HistorialInventario
+from app import create_app
+from api.snapshots import crear_snapshots
+from api.rollups import reconstruir_resumen
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_endpoints.json")
+LOTE_SIEMBRA = 10000
+
+
+class Volumenes:
+    def __init__(self, articulos, categorias, proveedores, historial):
+        self.articulos = articulos
+        self.categorias = categorias
+        self.proveedores = proveedores
+        self.historial = historial
+        # Elementos reservados para los escenarios que borran
+        self.reservados = 2000
+
+
+def sembrar(volumenes):
+    random.seed(1234)
+    ahora = datetime.datetime.now()
+    total_categorias = volumenes.categorias + volumenes.reservados
+    total_proveedores = volumenes.proveedores + volumenes.reservados
+    total_articulos = volumenes.articulos + volumenes.reservados
+    db.session.execute(db.insert(Categoria), [{"categoria": f"Categoria {i}"} for i in range(1, total_categorias + 1)])
+    db.session.execute(db.insert(Proveedor), [{"proveedor": f"Proveedor {i}"} for i in range(1, total_proveedores + 1)])
+    db.session.execute(db.insert(TipoMovimiento), [{"tipo": "Ingreso"}, {"tipo": "Egreso"}] +
+                       [{"tipo": f"Ajuste {i}"} for i in range(volumenes.reservados)])
+    for inicio in range(1, total_articulos + 1, LOTE_SIEMBRA):
+        db.session.execute(db.insert(Articulo), [
+            {"nombre": f"Articulo {i}", "descripcion": f"Descripción del artículo {i}",
+             "categoria_id": random.randint(1, volumenes.categorias),
+             "proveedor_id": random.randint(1, volumenes.proveedores),
+             "stock": random.randint(0, 500), "precio": round(random.uniform(1, 2000), 2)}
+            for i in range(inicio, min(inicio + LOTE_SIEMBRA, total_articulos + 1))
+        ])
+    total_historial = volumenes.historial + volumenes.reservados
+    for inicio in range(0, total_historial, LOTE_SIEMBRA):
+        db.session.execute(db.insert(HistorialInventario), [
+            {"articulo_id": random.randint(1, volumenes.articulos), "tipo_movimiento_id": random.randint(1, 2),
+             "cantidad": random.randint(1, 20),
+             "fecha_movimiento": ahora - datetime.timedelta(minutes=total_historial - i)}
+            for i in range(inicio, min(inicio + LOTE_SIEMBRA, total_historial))
+        ])
+    # Un snapshot periódico a mitad del historial
+    crear_snapshots(ahora=ahora - datetime.timedelta(minutes=total_historial // 2), todos=True)
+    reconstruir_resumen()
+    db.session.commit()
+
+
+def escenarios(volumenes):
+    # Una entrada por regla de URL: lista de (método, variante, generador de
+    # ruta, generador de cuerpo, estados esperados, peticiones relativas).
+    # La variante distingue los escenarios de un mismo método y regla y
+    # forma parte de su nombre en la línea base: no debe cambiar.
+    articulo = lambda: random.randint(1, volumenes.articulos)
+    categoria = lambda: random.randint(1, volumenes.categorias)
+    proveedor = lambda: random.randint(1, volumenes.proveedores)
+    desde = (datetime.datetime.now() - datetime.timedelta(minutes=volumenes.historial // 100)).isoformat(timespec="seconds")
+    articulos_borrables = itertools.count(volumenes.articulos + 1)
+    categorias_borrables = itertools.count(volumenes.categorias + 1)
+    proveedores_borrables = itertools.count(volumenes.proveedores + 1)
+    tipos_borrables = itertools.count(3)
+    historial_borrable = itertools.count(volumenes.historial + 1)
+    fecha_pasada = lambda: (datetime.datetime.now() - datetime.timedelta(minutes=random.randint(0, volumenes.historial))).isoformat(timespec="seconds")
+    nombres = itertools.count()
+
+    def nuevo_articulo():
+        return {"nombre": f"Nuevo {next(nombres)}", "descripcion": "bench", "categoria_id": categoria(),
+                "proveedor_id": proveedor(), "stock": 10, "precio": 9.5}
+
+    def movimiento():
+        return {"articulo_id": articulo(), "tipo_movimiento_id": 1, "cantidad": 1}
+
+    def lista_precios():
+        # CSV de 500 filas: actualizaciones por id y altas nuevas a partes iguales
+        filas = ["id,nombre,descripcion,categoria,proveedor,stock,precio"]
+        for _ in range(250):
+            filas.append(f"{articulo()},Articulo {next(nombres)},bench,Categoria {categoria()},Proveedor {proveedor()},,{random.randint(1, 500)}.5")
+            filas.append(f",Importado {next(nombres)},bench,Categoria {categoria()},Proveedor {proveedor()},10,9.5")
+        return "\n".join(filas) + "\n"
+
+    return {
+        "/": [("GET", "", lambda: "/", None, {200}, 1)],
+        "/api/articulos": [
+            ("GET", "", lambda: "/api/articulos", None, {200}, 1),
+            ("GET", "categoria_stock", lambda: f"/api/articulos?categoria_id={categoria()}&sort=-stock&limit=50", None, {200}, 1),
+            ("GET", "fields", lambda: "/api/articulos?fields=id,nombre,stock&limit=1000", None, {200}, 1),
+            ("GET", "expand", lambda: "/api/articulos?expand=categoria,proveedor&limit=50", None, {200}, 0.5),
+            ("POST", "", lambda: "/api/articulos", nuevo_articulo, {201}, 1),
+        ],
+        "/api/articulos/importar": [
+            ("POST", "", lambda: "/api/articulos/importar", lista_precios, {200, 207}, 0.05),
+        ],
+        "/api/articulos/exportar": [("GET", "", lambda: "/api/articulos/exportar?formato=csv", None, {200}, 0.05)],
+        "/api/articulos/buscar": [
+            ("GET", "", lambda: f"/api/articulos/buscar?q=articulo+{random.randint(1, volumenes.articulos)}", None, {200}, 1),
+            ("GET", "prefijo", lambda: "/api/articulos/buscar?q=art&limit=20", None, {200}, 1),
+        ],
+        "/api/articulos/valoracion": [
+            ("GET", "", lambda: "/api/articulos/valoracion?agrupar=categoria,proveedor", None, {200}, 1),
+        ],
+        "/api/articulos/prevision": [
+            ("GET", "", lambda: "/api/articulos/prevision?reponer=true&limit=100", None, {200}, 0.25),
+        ],
+        "/api/articulos/cambios": [("GET", "", lambda: "/api/articulos/cambios", None, {200}, 0.05)],
+        "/api/articulos/<int:articulo_id>/stock": [
+            ("GET", "", lambda: f"/api/articulos/{articulo()}/stock?fecha={fecha_pasada()}", None, {200}, 1),
+        ],
+        "/api/articulos/<int:articulo_id>": [
+            ("GET", "", lambda: f"/api/articulos/{articulo()}", None, {200}, 1),
+            ("GET", "expand", lambda: f"/api/articulos/{articulo()}?expand=categoria,proveedor,historial", None, {200}, 0.5),
+            ("PATCH", "", lambda: f"/api/articulos/{articulo()}", nuevo_articulo, {200}, 1),
+            ("DELETE", "", lambda: f"/api/articulos/{next(articulos_borrables)}", None, {200}, 0.25),
+        ],
+        "/api/categorias": [
+            ("GET", "", lambda: "/api/categorias", None, {200}, 1),
+            ("POST", "", lambda: "/api/categorias", lambda: {"categoria": f"Nueva {next(nombres)}"}, {201}, 0.25),
+        ],
+        "/api/categorias/<int:categoria_id>": [
+            ("GET", "", lambda: f"/api/categorias/{categoria()}", None, {200}, 1),
+            ("PATCH", "", lambda: f"/api/categorias/{next(categorias_borrables)}", lambda: {"categoria": f"Editada {next(nombres)}"}, {200}, 0.25),
+            ("DELETE", "", lambda: f"/api/categorias/{next(categorias_borrables)}", None, {200}, 0.25),
+        ],
+        "/api/proveedores": [
+            ("GET", "", lambda: "/api/proveedores", None, {200}, 1),
+            ("POST", "", lambda: "/api/proveedores", lambda: {"proveedor": f"Nuevo {next(nombres)}"}, {201}, 0.25),
+        ],
+        "/api/proveedores/<int:proveedor_id>": [
+            ("GET", "", lambda: f"/api/proveedores/{proveedor()}", None, {200}, 1),
+            ("PATCH", "", lambda: f"/api/proveedores/{next(proveedores_borrables)}", lambda: {"proveedor": f"Editado {next(nombres)}"}, {200}, 0.25),
+            ("DELETE", "", lambda: f"/api/proveedores/{next(proveedores_borrables)}", None, {200}, 0.25),
+        ],
+        "/api/historial_inventario": [
+            ("GET", "", lambda: "/api/historial_inventario", None, {200}, 1),
+            ("GET", "articulo_fecha", lambda: f"/api/historial_inventario?articulo_id={articulo()}&sort=-fecha_movimiento", None, {200}, 1),
+            ("POST", "", lambda: "/api/historial_inventario", movimiento, {201}, 1),
+        ],
+        "/api/historial_inventario/exportar": [
+            ("GET", "", lambda: f"/api/historial_inventario/exportar?desde={desde}", None, {200}, 0.25),
+        ],
+        "/api/historial_inventario/lote": [
+            ("POST", "", lambda: "/api/historial_inventario/lote", lambda: [movimiento() for _ in range(100)], {201, 207}, 0.25),
+        ],
+        "/api/historial_inventario/resumen": [
+            ("GET", "", lambda: "/api/historial_inventario/resumen", None, {200}, 0.5),
+            ("GET", "semana_articulo", lambda: f"/api/historial_inventario/resumen?granularidad=semana&articulo_id={articulo()}", None, {200}, 0.5),
+            ("GET", "mes_tipo", lambda: "/api/historial_inventario/resumen?granularidad=mes&tipo_movimiento_id=2", None, {200}, 0.25),
+        ],
+        "/api/historial_inventario/<int:historial_id>": [
+            ("GET", "", lambda: f"/api/historial_inventario/{random.randint(1, volumenes.historial)}", None, {200}, 1),
+            ("DELETE", "", lambda: f"/api/historial_inventario/{next(historial_borrable)}", None, {200}, 0.25),
+        ],
+        "/api/tipos_movimiento": [
+            ("GET", "", lambda: "/api/tipos_movimiento", None, {200}, 1),
+            ("POST", "", lambda: "/api/tipos_movimiento", lambda: {"tipo": f"T{next(nombres)}"}, {201}, 0.25),
+        ],
+        "/api/tipos_movimiento/<int:tipo_id>": [
+            ("GET", "", lambda: "/api/tipos_movimiento/1", None, {200}, 1),
+            ("PATCH", "", lambda: f"/api/tipos_movimiento/{next(tipos_borrables)}", lambda: {"tipo": f"E{next(nombres)}"}, {200}, 0.25),
+            ("DELETE", "", lambda: f"/api/tipos_movimiento/{next(tipos_borrables)}", None, {200}, 0.25),
+        ],
+        "/api/metricas": [("GET", "", lambda: "/api/metricas", None, {200}, 1)],
+    }
+
+
+def peticion(url_base, metodo, ruta, cuerpo, cabeceras=None):
+    # Los cuerpos de texto se envían como CSV; el resto como JSON
+    if isinstance(cuerpo, str):
+        datos, tipo = cuerpo.encode(), "text/csv"
+    else:
+        datos, tipo = (json.dumps(cuerpo).encode(), "application/json") if cuerpo is not None else (None, None)
+    cabeceras = dict(cabeceras or {})
+    if datos:
+        cabeceras["Content-Type"] = tipo
+    solicitud = urllib.request.Request(url_base + ruta, data=datos, method=metodo, headers=cabeceras)
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(solicitud, timeout=120) as respuesta:
+            respuesta.read()
+            estado = respuesta.status
+    except urllib.error.HTTPError as error:
+        error.read()
+        estado = error.code
+    return estado, time.perf_counter() - inicio
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def ejecutar(url_base, nombre, metodo, ruta, cuerpo, esperados, peticiones, concurrencia, cabeceras=None):
+    def una(_):
+        return peticion(url_base, metodo, ruta(), cuerpo() if cuerpo else None, cabeceras)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        resultados = list(executor.map(una, range(peticiones)))
+    duracion = time.perf_counter() - inicio
+    latencias = [latencia * 1000 for _, latencia in resultados]
+    return {
+        "peticiones": peticiones,
+        "errores": sum(1 for estado, _ in resultados if estado not in esperados),
+        "rps": peticiones / duracion,
+        "p50_ms": percentil(latencias, 50),
+        "p95_ms": percentil(latencias, 95),
+        "p99_ms": percentil(latencias, 99)
+    }
+
+
+def nombre_escenario(metodo, regla, variante):
+    return f"{metodo} {regla} [{variante}]" if variante else f"{metodo} {regla}"
+
+
+def comparar(resultados, baseline, tolerancia, tolerancia_p95):
+    # La cola (p95) de las escrituras en SQLite depende mucho de la espera
+    # por el bloqueo, por eso tiene su propia tolerancia, más amplia.
+    # Un escenario sin línea base también falla: sin ella no hay control.
+    regresiones = []
+    for nombre in sorted(set(baseline) - set(resultados)):
+        print(f"Escenario de la línea base que ya no se mide: {nombre}")
+    for nombre, actual in resultados.items():
+        anterior = baseline.get(nombre)
+        if not anterior:
+            regresiones.append(f"{nombre}: sin línea base (regenérela con --guardar-baseline)")
+            continue
+        if actual["p50_ms"] > anterior["p50_ms"] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p50 {anterior['p50_ms']:.1f}ms -> {actual['p50_ms']:.1f}ms")
+        if actual["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia_p95):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']:.1f}ms -> {actual['p95_ms']:.1f}ms")
+        if actual["rps"] < anterior["rps"] / (1 + tolerancia):
+            regresiones.append(f"{nombre}: rps {anterior['rps']:.0f} -> {actual['rps']:.0f}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articulos", type=int, default=20000)
+    parser.add_argument("--categorias", type=int, default=50)
+    parser.add_argument("--proveedores", type=int, default=50)
+    parser.add_argument("--historial", type=int, default=200000)
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por endpoint")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--tolerancia", type=float, default=1.0, help="empeoramiento admitido en p50 y rps (1.0 = el doble)")
+    parser.add_argument("--tolerancia-p95", type=float, default=3.0, help="empeoramiento admitido en p95")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--guardar-baseline", action="store_true")
+    parser.add_argument("--group-commit", action="store_true", help="registrar movimientos con MOVIMIENTOS_GROUP_COMMIT")
+    parser.add_argument("--db", help="ruta del fichero SQLite (por defecto, temporal)")
+    parser.add_argument("--accept-encoding", help='cabecera Accept-Encoding de las peticiones (p. ej. "gzip, br")')
+    opciones = parser.parse_args()
+
+    volumenes = Volumenes(opciones.articulos, opciones.categorias, opciones.proveedores, opciones.historial)
+    directorio = tempfile.mkdtemp(prefix="bench_api_")
+    ruta_db = opciones.db or os.path.join(directorio, "bench.db")
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.abspath(ruta_db)}",
+        'DB_POOL_SIZE': opciones.concurrencia,
+        'DB_MAX_OVERFLOW': opciones.concurrencia,
+        'MOVIMIENTOS_GROUP_COMMIT': opciones.group_commit,
+        # Las conexiones SSE se cierran pronto para poder medirlas
+        'FEED_DURACION_MAXIMA_S': 0.5
+    })
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        inicio = time.perf_counter()
+        sembrar(volumenes)
+        print(f"Siembra: {volumenes.articulos} artículos, {volumenes.historial} movimientos "
+              f"en {time.perf_counter() - inicio:.1f}s ({ruta_db})")
+
+    tabla = escenarios(volumenes)
+    reglas = {regla.rule for regla in app.url_map.iter_rules() if regla.endpoint != "static"}
+    sin_escenario = sorted(reglas - set(tabla))
+    if sin_escenario:
+        print(f"Rutas sin escenario de benchmark: {', '.join(sin_escenario)}")
+        return 1
+    nombres = [nombre_escenario(metodo, regla, variante) for regla, lista in tabla.items() for metodo, variante, *_ in lista]
+    repetidos = sorted({nombre for nombre in nombres if nombres.count(nombre) > 1})
+    if repetidos:
+        print(f"Escenarios con el mismo nombre: {', '.join(repetidos)}")
+        return 1
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    servidor = make_server("127.0.0.1", 0, app, threaded=True)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    url_base = f"http://127.0.0.1:{servidor.server_port}"
+
+    resultados = {}
+    try:
+        print(f"{'endpoint':62} {'n':>5} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for regla in sorted(tabla):
+            for metodo, variante, ruta, cuerpo, esperados, factor in tabla[regla]:
+                nombre = nombre_escenario(metodo, regla, variante)
+                peticiones = max(1, int(opciones.peticiones * factor))
+                resultado = ejecutar(url_base, nombre, metodo, ruta, cuerpo, esperados, peticiones, opciones.concurrencia,
+                                     {"Accept-Encoding": opciones.accept_encoding} if opciones.accept_encoding else None)
+                resultados[nombre] = resultado
+                print(f"{nombre[:62]:62} {resultado['peticiones']:5} {resultado['errores']:4} {resultado['rps']:8.1f} "
+                      f"{resultado['p50_ms']:7.1f}ms {resultado['p95_ms']:7.1f}ms {resultado['p99_ms']:7.1f}ms")
+    finally:
+        servidor.shutdown()
+
+    fallos = [f"{nombre}: {r['errores']} respuestas inesperadas" for nombre, r in resultados.items() if r["errores"]]
+    if opciones.guardar_baseline:
+        with open(opciones.baseline, "w") as fichero:
+            json.dump({"volumenes": vars(volumenes), "concurrencia": opciones.concurrencia,
+                       "endpoints": resultados}, fichero, indent=2, sort_keys=True)
+        print(f"Línea base guardada en {opciones.baseline}")
+    elif os.path.exists(opciones.baseline):
+        with open(opciones.baseline) as fichero:
+            fallos += comparar(resultados, json.load(fichero)["endpoints"], opciones.tolerancia, opciones.tolerancia_p95)
+    else:
+        print(f"No hay línea base en {opciones.baseline}; use --guardar-baseline")
+
+    for fallo in fallos:
+        print(f"REGRESIÓN: {fallo}")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
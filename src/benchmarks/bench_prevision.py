@@ -0,0 +1,84 @@
+# Benchmark de la previsión de stock (api/forecast.py): agregación con numpy
+# frente al recorrido fila a fila en Python, sobre egresos repartidos en la
+# ventana. Los egresos se leen del resumen diario, que se reconstruye tras
+# la carga.
+#
+#   python benchmarks/bench_prevision.py --articulos 100000 --movimientos 10000000
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento
+from api.forecast import prevision_stock, np
+from api.rollups import reconstruir_resumen
+from app import create_app
+
+TAMANO_LOTE = 200000
+
+
+def poblar(articulos, movimientos, ventana):
+    db.session.add_all([Categoria(categoria="Bench"), Proveedor(proveedor="Bench"),
+                        TipoMovimiento(tipo="Ingreso"), TipoMovimiento(tipo="Egreso")])
+    db.session.flush()
+    db.session.execute(db.insert(Articulo), [
+        {"nombre": f"Articulo {i}", "descripcion": "", "categoria_id": 1, "proveedor_id": 1,
+         "stock": random.randint(0, 500), "precio": 1.0}
+        for i in range(articulos)
+    ])
+    # Directamente con el cursor de la base: la carga no es lo que se mide
+    ahora = datetime.datetime.now()
+    segundos = ventana * 86400
+    cursor = db.session.connection().connection.cursor()
+    sentencia = ("INSERT INTO historial_inventario (articulo_id, tipo_movimiento_id, cantidad, fecha_movimiento) "
+                 "VALUES (?, ?, ?, ?)")
+    for desde in range(0, movimientos, TAMANO_LOTE):
+        cursor.executemany(sentencia, [
+            (random.randint(1, articulos), 2 if random.random() < 0.8 else 1, random.randint(1, 5),
+             (ahora - datetime.timedelta(seconds=random.randrange(segundos))).isoformat(" "))
+            for _ in range(min(TAMANO_LOTE, movimientos - desde))
+        ])
+    # La previsión lee el resumen diario, no el historial
+    reconstruir_resumen()
+    db.session.commit()
+
+
+def medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articulos", type=int, default=100000)
+    parser.add_argument("--movimientos", type=int, default=10000000)
+    parser.add_argument("--ventana", type=int, default=30)
+    parser.add_argument("--sin-python", action="store_true", help="no medir la versión fila a fila")
+    opciones = parser.parse_args()
+    if np is None:
+        sys.exit("Este benchmark necesita numpy (pip install numpy)")
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'UMBRAL_SENTENCIAS_REPETIDAS': None})
+    with app.app_context():
+        db.create_all()
+        _, carga = medir(lambda: poblar(opciones.articulos, opciones.movimientos, opciones.ventana))
+        print(f"{opciones.articulos} artículos y {opciones.movimientos} movimientos cargados en {carga:.1f}s")
+
+        # Misma fecha de referencia en las dos mediciones para poder compararlas
+        ahora = datetime.datetime.now()
+        con_numpy, tiempo_numpy = medir(lambda: prevision_stock(ventana=opciones.ventana, ahora=ahora))
+        print(f"{'numpy':8} {tiempo_numpy:8.2f}s")
+        if not opciones.sin_python:
+            en_python, tiempo_python = medir(lambda: prevision_stock(ventana=opciones.ventana, ahora=ahora, usar_numpy=False))
+            print(f"{'python':8} {tiempo_python:8.2f}s  ({tiempo_python / tiempo_numpy:.1f}x)")
+            assert con_numpy == en_python
+        print(f"{sum(p['reponer'] for p in con_numpy)} artículos por debajo del punto de pedido")
+
+
+if __name__ == "__main__":
+    main()
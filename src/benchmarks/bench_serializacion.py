@@ -0,0 +1,71 @@
+# Micro-benchmark: marshal() de flask_restful frente al serializador compilado
+# sobre entidades del ORM y sobre filas de un select() de columnas.
+#
+#   python benchmarks/bench_serializacion.py --filas 100000
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_restful import marshal
+from api.models import db, Articulo, HistorialInventario
+from api.controllers import articulo_fields, historial_inventario_fields
+from api.serializers import serializar
+from app import create_app
+
+
+def medir(nombre, funcion, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, default=50000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    opciones = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        ahora = datetime.datetime.now()
+        db.session.execute(db.insert(Articulo), [
+            {"nombre": f"Articulo {i}", "descripcion": "Descripción de prueba", "categoria_id": i % 10 + 1,
+             "proveedor_id": i % 7 + 1, "stock": i % 100, "precio": i * 1.5}
+            for i in range(opciones.filas)
+        ])
+        db.session.execute(db.insert(HistorialInventario), [
+            {"articulo_id": i % 1000 + 1, "tipo_movimiento_id": i % 2 + 1, "cantidad": i % 9 + 1,
+             "fecha_movimiento": ahora - datetime.timedelta(minutes=i)}
+            for i in range(opciones.filas)
+        ])
+        db.session.commit()
+
+        casos = [
+            ("articulos (ORM)", Articulo.query.all(), articulo_fields),
+            ("articulos (select columnas)", db.session.execute(
+                db.select(*[getattr(Articulo, c) for c in articulo_fields])).all(), articulo_fields),
+            ("historial (ORM)", HistorialInventario.query.all(), historial_inventario_fields),
+            ("historial (select columnas)", db.session.execute(
+                db.select(*[getattr(HistorialInventario, c) for c in historial_inventario_fields])).all(),
+             historial_inventario_fields),
+        ]
+
+        print(f"{'caso':32} {'marshal':>10} {'compilado':>10} {'x':>6}")
+        for nombre, filas, campos in casos:
+            assert json.dumps(serializar(filas[:100], campos)) == json.dumps(marshal(filas[:100], campos))
+            antes = medir(nombre, lambda: json.dumps(marshal(filas, campos)), opciones.repeticiones)
+            despues = medir(nombre, lambda: json.dumps(serializar(filas, campos)), opciones.repeticiones)
+            print(f"{nombre:32} {antes:9.3f}s {despues:9.3f}s {antes / despues:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
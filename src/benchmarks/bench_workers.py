@@ -0,0 +1,152 @@
+# Prueba de humo de servidor.py: siembra una base SQLite en disco, arranca el
+# servidor de producción con distinto número de workers y mide el throughput
+# de una mezcla de lecturas con clientes en procesos separados (para que el
+# GIL del cliente no limite la medida). También informa la latencia de la
+# primera petición tras el arranque, con y sin calentamiento.
+#
+#   python benchmarks/bench_workers.py --workers 1,2,4 --duracion 10
+#
+# Necesita gunicorn. El escalado depende de los núcleos disponibles: con más
+# workers que núcleos el throughput deja de crecer.
+import argparse
+import http.client
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bench_endpoints import Volumenes, sembrar, percentil
+from api.models import db
+from app import create_app
+from servidor import BaseApplication, nucleos
+
+
+def rutas(volumenes):
+    articulo = lambda: random.randint(1, volumenes.articulos)
+    return [
+        lambda: "/api/categorias",
+        lambda: "/api/tipos_movimiento",
+        lambda: f"/api/articulos?categoria_id={random.randint(1, volumenes.categorias)}&limit=20",
+        lambda: f"/api/articulos/{articulo()}",
+        lambda: f"/api/articulos/{articulo()}?expand=categoria,proveedor,historial",
+        lambda: f"/api/historial_inventario?articulo_id={articulo()}&limit=20",
+    ]
+
+
+def puerto_libre():
+    with socket.socket() as conexion:
+        conexion.bind(("127.0.0.1", 0))
+        return conexion.getsockname()[1]
+
+
+def esperar_servidor(puerto, limite=60):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            with socket.create_connection(("127.0.0.1", puerto), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"El servidor no arrancó en {limite}s")
+
+
+def primera_peticion(puerto, ruta):
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+    inicio = time.perf_counter()
+    conexion.request("GET", ruta)
+    conexion.getresponse().read()
+    conexion.close()
+    return time.perf_counter() - inicio
+
+
+def cliente(puerto, volumenes, duracion, semilla):
+    # Un proceso cliente: peticiones seguidas por una conexión keep-alive
+    random.seed(semilla)
+    generadores = rutas(volumenes)
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=60)
+    latencias, errores = [], 0
+    fin = time.perf_counter() + duracion
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        conexion.request("GET", random.choice(generadores)())
+        respuesta = conexion.getresponse()
+        respuesta.read()
+        latencias.append(time.perf_counter() - inicio)
+        errores += respuesta.status != 200
+    conexion.close()
+    return latencias, errores
+
+
+def medir(ruta_db, volumenes, workers, clientes, duracion, calentar=True):
+    puerto = puerto_libre()
+    entorno = dict(os.environ, FLASK_SQLALCHEMY_DATABASE_URI=f"sqlite:///{ruta_db}")
+    orden = [sys.executable, os.path.join(RAIZ, "servidor.py"), "--bind", f"127.0.0.1:{puerto}",
+             "--workers", str(workers)]
+    if not calentar:
+        orden.append("--sin-calentar")
+    proceso = subprocess.Popen(orden, cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        esperar_servidor(puerto)
+        primera = primera_peticion(puerto, "/api/articulos/1?expand=categoria,proveedor,historial")
+        with ProcessPoolExecutor(max_workers=clientes) as executor:
+            resultados = list(executor.map(cliente, [puerto] * clientes, [volumenes] * clientes,
+                                           [duracion] * clientes, range(clientes)))
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        proceso.wait(30)
+    latencias = [latencia * 1000 for parcial, _ in resultados for latencia in parcial]
+    return {
+        "workers": workers,
+        "peticiones": len(latencias),
+        "errores": sum(errores for _, errores in resultados),
+        "rps": len(latencias) / duracion,
+        "p50_ms": percentil(latencias, 50),
+        "p95_ms": percentil(latencias, 95),
+        "primera_ms": primera * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="números de workers a medir, separados por comas")
+    parser.add_argument("--clientes", type=int, default=8, help="procesos cliente concurrentes")
+    parser.add_argument("--duracion", type=float, default=10, help="segundos de carga por medición")
+    parser.add_argument("--articulos", type=int, default=20000)
+    parser.add_argument("--historial", type=int, default=200000)
+    opciones = parser.parse_args()
+    if BaseApplication is None:
+        sys.exit("Este benchmark necesita gunicorn (pip install gunicorn)")
+
+    volumenes = Volumenes(opciones.articulos, 50, 50, opciones.historial)
+    ruta_db = os.path.join(tempfile.mkdtemp(prefix="bench_workers_"), "bench.db")
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{ruta_db}"})
+    with app.app_context():
+        db.create_all()
+        sembrar(volumenes)
+        db.engine.dispose()
+    print(f"Siembra: {volumenes.articulos} artículos, {volumenes.historial} movimientos ({ruta_db}); "
+          f"{nucleos()} núcleos disponibles")
+
+    print(f"{'workers':>7} {'n':>7} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'1ª petición':>12}")
+    base = None
+    for workers in [int(n) for n in opciones.workers.split(",")]:
+        r = medir(ruta_db, volumenes, workers, opciones.clientes, opciones.duracion)
+        base = base or r["rps"]
+        print(f"{r['workers']:7} {r['peticiones']:7} {r['errores']:4} {r['rps']:8.1f} {r['p50_ms']:7.1f}ms "
+              f"{r['p95_ms']:7.1f}ms {r['primera_ms']:10.1f}ms  ({r['rps'] / base:.2f}x)")
+
+    # Efecto del calentamiento: primera petición de un worker recién creado
+    frio = medir(ruta_db, volumenes, 1, 1, 0.5, calentar=False)
+    print(f"Primera petición sin calentar: {frio['primera_ms']:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import argparse
+from app import create_app
+from api.models import db
+from api.snapshots import crear_snapshots
+
+# Pensado para ejecutarse periódicamente (cron): cuanto más frecuente, menos
+# movimientos hay que recorrer al consultar el stock a una fecha.
+parser = argparse.ArgumentParser(description="Crea snapshots de stock de los artículos con movimientos nuevos")
+parser.add_argument("--todos", action="store_true", help="crear un snapshot de todos los artículos")
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    creados = crear_snapshots(todos=args.todos)
+    db.session.commit()
+    print(f"Snapshots creados: {creados}")
@@ -1,5 +1,15 @@
-from app import app, db
+from app import create_app
+from api.models import db
+from api.search import crear_indice_busqueda
+
+app = create_app()
 
 with app.app_context():
     db.create_all()
-    print("Database created successfully!")
\ No newline at end of file
+    # create_all no crea índices nuevos en tablas que ya existían
+    for tabla in db.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conexion:
+        crear_indice_busqueda(conexion)
+    print("Database created successfully!")
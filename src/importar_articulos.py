@@ -0,0 +1,25 @@
+import argparse
+from app import create_app
+from api.importer import importar_articulos, ErrorImportacion
+
+# Importa o actualiza artículos desde un CSV (ver api/importer.py):
+#   python importar_articulos.py lista_precios.csv
+parser = argparse.ArgumentParser(description="Importa artículos desde un fichero CSV")
+parser.add_argument("fichero")
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    with open(args.fichero, encoding="utf-8-sig", newline="") as lineas:
+        try:
+            resumen = importar_articulos(lineas)
+        except ErrorImportacion as error:
+            if error.resumen is None:
+                raise SystemExit(str(error))
+            resumen = error.resumen
+            print(f"{error}; confirmado hasta la fila {resumen['confirmado_hasta']}")
+    for error in resumen["errores"]:
+        print(f"Fila {error['fila']}: {error['mensaje']}")
+    print(f"{resumen['filas']} filas: {resumen['insertados']} insertados, "
+          f"{resumen['actualizados']} actualizados, {resumen['con_error']} con error")
@@ -0,0 +1,23 @@
+import argparse
+import datetime
+from app import create_app
+from api.models import db
+from api.rollups import reconstruir_resumen
+
+# Recalcula el resumen diario de movimientos (ver api/rollups.py) a partir
+# del historial. Para rellenarlo en una base existente (tras create_db.py,
+# que crea la tabla) o reparar un rango;
+# los días anteriores al historial que queda (meses archivados) no se tocan.
+fecha = lambda texto: datetime.datetime.strptime(texto, "%Y-%m-%d").date()
+
+parser = argparse.ArgumentParser(description="Reconstruye el resumen diario de movimientos")
+parser.add_argument("--desde", type=fecha, help="primer día a recalcular, YYYY-MM-DD (por defecto el primer movimiento)")
+parser.add_argument("--hasta", type=fecha, help="último día a recalcular, YYYY-MM-DD (por defecto sin límite)")
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    filas = reconstruir_resumen(args.desde, args.hasta)
+    db.session.commit()
+    print(f"Resumen reconstruido: {filas} filas (artículo, tipo, día)")
@@ -0,0 +1,124 @@
+import argparse
+import gc
+import os
+import sys
+from app import create_app
+from api.models import db
+from api.warmup import calentar, tras_fork, al_salir
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # dependencia opcional: sólo hace falta para producción
+    BaseApplication = None
+
+# Servidor de producción: gunicorn con varios workers (procesos) de hilos.
+#
+#   python servidor.py --bind 0.0.0.0:8000
+#
+# La aplicación se crea y se calienta en el maestro (api/warmup.py) y los
+# workers se crean con fork. Señales al proceso maestro:
+#   TERM / INT   parada ordenada: cada worker termina sus peticiones (hasta
+#                --graceful-timeout) y confirma los movimientos encolados
+#   HUP          recrea los workers con la configuración actual; el código ya
+#                está cargado en el maestro, así que no recoge cambios de código
+#   USR2, luego WINCH y QUIT al maestro viejo
+#                despliegue de código nuevo sin cortar el servicio
+#   TTIN / TTOU  un worker más / menos
+#
+# La base tiene que estar en disco: con SQLite en memoria cada proceso
+# tendría la suya.
+#
+# Las conexiones SSE (/api/articulos/cambios) ocupan un hilo mientras están
+# abiertas, hasta FEED_DURACION_MAXIMA_S. Cada worker tiene --hilos para las
+# peticiones normales más --conexiones-sse para el feed, y rechaza con 503
+# las conexiones al feed por encima de ese número: como mucho
+# workers × conexiones-sse paneles a la vez, sin que esperen las demás
+# peticiones. Un hilo bloqueado esperando eventos apenas consume, así que
+# para más paneles basta con subir --conexiones-sse. Cada worker lee los
+# cambios de todos de la tabla cambios_stock (api/feed.py). Las conexiones
+# se cortan al reiniciar un worker; el navegador se reconecta solo, a
+# cualquier worker, y sigue desde su Last-Event-ID.
+
+
+def nucleos():
+    # Núcleos que puede usar este proceso (respeta cgroups/taskset)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de producción de la API (gunicorn)")
+    parser.add_argument("--bind", default=os.environ.get("BIND", "127.0.0.1:8000"))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 0)) or nucleos(),
+                        help="procesos (por defecto WEB_CONCURRENCY o uno por núcleo)")
+    parser.add_argument("--hilos", type=int, default=4, help="hilos por worker para las peticiones normales")
+    parser.add_argument("--conexiones-sse", type=int, default=32,
+                        help="conexiones al feed de cambios por worker, cada una con su hilo")
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--graceful-timeout", type=int, default=30)
+    parser.add_argument("--max-requests", type=int, default=0,
+                        help="reciclar cada worker tras n peticiones (0: nunca)")
+    parser.add_argument("--sin-calentar", action="store_true", help="no calentar la aplicación antes del fork")
+    return parser.parse_args(argv)
+
+
+def configuracion(opciones, app):
+    # Ajustes de gunicorn. Con preload_app la aplicación ya creada se
+    # comparte con los workers; los hooks rehacen en cada uno lo que no
+    # sobrevive al fork.
+    return {
+        "bind": opciones.bind,
+        "workers": opciones.workers,
+        "worker_class": "gthread",
+        "threads": opciones.hilos + opciones.conexiones_sse,
+        "timeout": opciones.timeout,
+        "graceful_timeout": opciones.graceful_timeout,
+        "max_requests": opciones.max_requests,
+        "max_requests_jitter": opciones.max_requests // 10,
+        "preload_app": True,
+        "accesslog": "-",
+        "post_fork": lambda servidor, worker: tras_fork(app),
+        "worker_exit": lambda servidor, worker: al_salir(app, opciones.graceful_timeout),
+    }
+
+
+def preparar(opciones):
+    config = {'FEED_CONEXIONES_MAXIMAS': opciones.conexiones_sse}
+    if opciones.workers > 1:
+        config['CACHE_SINCRONIZACION_S'] = 1.0
+    app = create_app(config)
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if opciones.workers > 1 and uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') == 'sqlite:'):
+        raise SystemExit("Con varios workers la base SQLite tiene que estar en un fichero")
+    if not opciones.sin_calentar:
+        calentar(app)
+    with app.app_context():
+        # Ninguna conexión abierta en el maestro pasa a los workers
+        db.engine.dispose()
+    # Lo cargado hasta aquí no lo vuelve a recorrer el GC de los workers,
+    # así sus páginas no se copian al primer ciclo de recolección
+    gc.freeze()
+    return app
+
+
+def main(argv=None):
+    opciones = argumentos(argv)
+    if BaseApplication is None:
+        sys.exit("Falta gunicorn (pip install gunicorn). Para desarrollo: python app.py")
+    app = preparar(opciones)
+
+    class Servidor(BaseApplication):
+        def load_config(self):
+            for nombre, valor in configuracion(opciones, app).items():
+                self.cfg.set(nombre, valor)
+
+        def load(self):
+            return app
+
+    Servidor().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import datetime
+import itertools
+import pytest
+from sqlalchemy import event
+from flask_sqlalchemy.session import Session
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento, HistorialInventario
+from api.movements import signo_movimiento
+from api.cache import invalidar_caches
+from api.versions import registrar_cambio
+from api.rollups import sumar_movimientos
+from api.warmup import al_salir
+from app import create_app
+
+# Aplicación y esquema compartidos por todas las pruebas del proceso; cada
+# prueba corre dentro de una transacción que se deshace al terminar. Los
+# commit de los handlers confirman un SAVEPOINT dentro de esa transacción,
+# así que cada prueba ve sus propios datos y empieza con la base vacía.
+#
+# La base es SQLite en memoria, propia de cada proceso: con pytest-xdist
+# (pytest -n auto) cada worker tiene la suya y no comparten nada.
+#
+# Las pruebas que necesitan otra configuración (group commit, ficheros,
+# hilos, varios procesos...) usan una aplicación propia: crear_app, o
+# app_configurada parametrizada con la configuración. Los módulos que las
+# usan para todas sus pruebas definen su propio fixture `app`, que tiene
+# preferencia.
+
+
+class SesionPrueba(Session):
+    # La sesión de Flask-SQLAlchemy elige siempre el engine de la tabla; aquí
+    # tiene que usar la conexión de la prueba, que tiene la transacción
+    # externa abierta.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+
+def _savepoints_sqlite(engine):
+    # pysqlite abre y cierra transacciones por su cuenta y rompe los
+    # SAVEPOINT; se le quita el control y el BEGIN lo emite SQLAlchemy
+    @event.listens_for(engine, "connect")
+    def sin_transacciones_implicitas(conexion, registro):
+        conexion.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(conexion):
+        conexion.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="session")
+def app_compartida():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'TESTING': True})
+    with app.app_context():
+        _savepoints_sqlite(db.engine)
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def app(app_compartida):
+    with app_compartida.app_context():
+        conexion = db.engine.connect()
+        transaccion = conexion.begin()
+        sesion_original = db.session
+        db.session = db._make_scoped_session({
+            "bind": conexion, "join_transaction_mode": "create_savepoint", "class_": SesionPrueba
+        })
+        # Las cachés del proceso podrían tener datos de la prueba anterior
+        invalidar_caches()
+        try:
+            yield app_compartida
+        finally:
+            db.session.remove()
+            db.session = sesion_original
+            transaccion.rollback()
+            conexion.close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def crear_app(tmp_path):
+    # Aplicaciones propias con el esquema creado y vacío. Con en_disco=True
+    # la base es un fichero de tmp_path: los hilos del feed y de la cola de
+    # movimientos no ven una base en memoria. Al terminar se paran sus hilos.
+    creadas = []
+
+    def crear(en_disco=False, uri=None, **config):
+        if uri is None:
+            uri = f"sqlite:///{tmp_path / f'app{len(creadas)}.db'}" if en_disco else "sqlite:///:memory:"
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'TESTING': True, **config})
+        with app.app_context():
+            db.create_all()
+        creadas.append(app)
+        return app
+    yield crear
+    for app in creadas:
+        al_salir(app, 5)
+        with app.app_context():
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app_configurada(request, crear_app):
+    # @pytest.mark.parametrize('app_configurada', [{...}], indirect=True):
+    # argumentos de crear_app (en_disco, uri y claves de configuración)
+    return crear_app(**getattr(request, "param", {}))
+
+
+# Fábricas: crean filas con valores por defecto razonables y las referencias
+# que falten (categoría, proveedor, tipo de movimiento). Registran el cambio
+# de versión como los handlers para que los ETag y la caché de respuestas
+# no sirvan lo que había antes.
+
+def _obtener_o_crear(modelo, coleccion, **campos):
+    fila = modelo.query.filter_by(**campos).first()
+    if fila is None:
+        fila = modelo(**campos)
+        db.session.add(fila)
+        db.session.flush()
+        registrar_cambio(coleccion, fila.id)
+    return fila
+
+
+@pytest.fixture
+def crear_articulo(app):
+    numeros = itertools.count(1)
+
+    def crear(**campos):
+        n = next(numeros)
+        categoria = campos.pop("categoria", "Electrónica")
+        proveedor = campos.pop("proveedor", "Tech Supplier")
+        if "categoria_id" not in campos:
+            campos["categoria_id"] = _obtener_o_crear(Categoria, "categorias", categoria=categoria).id
+        if "proveedor_id" not in campos:
+            campos["proveedor_id"] = _obtener_o_crear(Proveedor, "proveedores", proveedor=proveedor).id
+        articulo = Articulo(**{"nombre": f"Articulo {n}", "descripcion": "Descripción de prueba",
+                               "stock": 10, "precio": 1.5, **campos})
+        db.session.add(articulo)
+        db.session.flush()
+        registrar_cambio("articulos", articulo.id)
+        db.session.commit()
+        return articulo
+    return crear
+
+
+@pytest.fixture
+def crear_movimiento(app, crear_articulo):
+    # Registra el movimiento y aplica su efecto al stock, como la API, sin
+    # pasar por ella: para preparar historiales largos o con fechas dadas
+    def crear(articulo=None, tipo="Ingreso", cantidad=1, fecha=None, **campos):
+        articulo = articulo if articulo is not None else crear_articulo()
+        tipo_movimiento = _obtener_o_crear(TipoMovimiento, "tipos_movimiento", tipo=tipo)
+        movimiento = HistorialInventario(
+            articulo_id=articulo.id, tipo_movimiento_id=tipo_movimiento.id, cantidad=cantidad,
+            fecha_movimiento=fecha or datetime.datetime.now(), **campos
+        )
+        articulo.stock += signo_movimiento(tipo) * cantidad
+        db.session.add(movimiento)
+        sumar_movimientos([movimiento])
+        registrar_cambio("articulos", articulo.id)
+        db.session.commit()
+        return movimiento
+    return crear
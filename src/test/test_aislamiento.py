@@ -0,0 +1,38 @@
+from api.models import db, Articulo, Categoria, HistorialInventario
+
+
+#Lo que confirma una prueba (por la API o directamente) se deshace al terminar
+def test_escribe_datos(client, crear_articulo):
+    crear_articulo(nombre='Laptop ASUS')
+    response = client.post('/api/categorias', json={'categoria': 'Hogar'})
+    assert response.status_code == 201
+    assert Articulo.query.count() == 1
+    assert Categoria.query.count() == 2
+
+def test_empieza_vacia(client):
+    assert Articulo.query.count() == 0
+    assert client.get('/api/categorias').get_json() == []
+    # Los ids vuelven a empezar
+    assert client.post('/api/categorias', json={'categoria': 'Hogar'}).get_json()['id'] == 1
+
+#Las fábricas crean las referencias que faltan y aplican el movimiento al stock
+def test_fabricas(client, crear_articulo, crear_movimiento):
+    articulo = crear_articulo(stock=5)
+    otro = crear_articulo(categoria='Hogar')
+    assert (articulo.nombre, otro.nombre) == ('Articulo 1', 'Articulo 2')
+    assert articulo.categoria_id != otro.categoria_id and articulo.proveedor_id == otro.proveedor_id
+
+    crear_movimiento(articulo, cantidad=3)
+    crear_movimiento(articulo, tipo='Egreso', cantidad=1)
+    assert client.get(f'/api/articulos/{articulo.id}').get_json()['stock'] == 7
+    assert HistorialInventario.query.filter_by(articulo_id=articulo.id).count() == 2
+    # Sin artículo se crea uno nuevo
+    assert crear_movimiento().articulo_id == 3
+
+#Un error dentro de un handler no deja la transacción de la prueba inservible
+def test_error_en_handler(client):
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    response = client.post('/api/historial_inventario', json={'articulo_id': 99, 'tipo_movimiento_id': 1, 'cantidad': 1})
+    assert response.status_code == 404
+    assert client.post('/api/categorias', json={'categoria': 'Hogar'}).status_code == 201
+    assert db.session.get(Categoria, 1).categoria == 'Hogar'
@@ -0,0 +1,37 @@
+from sqlalchemy import inspect, text
+from api.models import db
+from app import create_app
+
+
+#Los PRAGMAs de SQLite se aplican a cada conexión y el pool usa la configuración
+def test_pragmas_y_pool_sqlite(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+        'DB_POOL_SIZE': 3,
+        'SQLITE_PRAGMAS': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 1234},
+    })
+    with app.app_context():
+        conexion = db.session.connection()
+        assert conexion.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conexion.execute(text('PRAGMA synchronous')).scalar() == 1
+        assert conexion.execute(text('PRAGMA busy_timeout')).scalar() == 1234
+        assert db.engine.pool.size() == 3
+        db.session.close()
+        db.engine.dispose()
+
+
+#Crear la aplicación no toca el esquema
+def test_create_app_no_crea_tablas(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'vacia.db'}"})
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+        db.engine.dispose()
+
+
+#La configuración también se puede dar con variables de entorno FLASK_*
+def test_configuracion_desde_entorno(monkeypatch):
+    monkeypatch.setenv('FLASK_SQLALCHEMY_DATABASE_URI', 'sqlite:///:memory:')
+    monkeypatch.setenv('FLASK_DB_POOL_RECYCLE', '60')
+    app = create_app()
+    assert app.config['SQLALCHEMY_DATABASE_URI'] == 'sqlite:///:memory:'
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_recycle'] == 60
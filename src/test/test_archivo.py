@@ -0,0 +1,163 @@
+import gzip
+import json
+import os
+from datetime import datetime
+import pytest
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento, HistorialInventario, ParticionHistorial, SnapshotStock
+import api.archive
+from api.archive import archivar_historial, corte_para
+
+# Movimientos de enero a abril de 2024: 3 por mes sobre el artículo 1
+FECHAS = [datetime(2024, mes, dia, 12) for mes in (1, 2, 3, 4) for dia in (5, 15, 25)]
+
+
+@pytest.fixture
+def app(crear_app, tmp_path):
+    app = crear_app(ARCHIVO_HISTORIAL_DIR=str(tmp_path / 'archivo'))
+    with app.app_context():
+        db.session.add_all([Categoria(categoria='Electrónica'), Proveedor(proveedor='Tech Supplier'),
+                            TipoMovimiento(tipo='Ingreso'), TipoMovimiento(tipo='Egreso')])
+        db.session.add(Articulo(nombre='Laptop ASUS', descripcion='Laptop gaming', categoria_id=1, proveedor_id=1, stock=100 + len(FECHAS), precio=1500.0))
+        db.session.add(SnapshotStock(articulo_id=1, fecha=datetime(2024, 1, 1), stock=100, motivo='alta'))
+        db.session.add_all([HistorialInventario(articulo_id=1, tipo_movimiento_id=1, cantidad=1, fecha_movimiento=fecha) for fecha in FECHAS])
+        db.session.commit()
+        yield app
+
+
+#El corte se alinea al inicio de mes
+def test_corte_para():
+    assert corte_para(30, ahora=datetime(2024, 4, 20)) == datetime(2024, 3, 1)
+
+#Los meses anteriores al corte pasan a ficheros gzip y salen de la tabla
+def test_archivar_historial(app):
+    particiones = archivar_historial(datetime(2024, 3, 1))
+    assert [(p.periodo, p.filas, p.cantidad) for p in particiones] == [('2024-01', 3, 3), ('2024-02', 3, 3)]
+    assert HistorialInventario.query.count() == 6
+    assert ParticionHistorial.query.count() == 2
+
+    ruta = os.path.join(app.config['ARCHIVO_HISTORIAL_DIR'], particiones[0].fichero)
+    with gzip.open(ruta, 'rt', encoding='utf-8') as fichero:
+        filas = [json.loads(linea) for linea in fichero]
+    assert [f['id'] for f in filas] == [1, 2, 3]
+    assert filas[0]['fecha_movimiento'] == '2024-01-05T12:00:00'
+
+    # Volver a ejecutar no archiva nada nuevo
+    assert archivar_historial(datetime(2024, 3, 1)) == []
+
+#La lista de historial y la exportación leen el archivo cuando el rango llega a él
+def test_lectura_transparente(app, client):
+    archivar_historial(datetime(2024, 3, 1))
+
+    # Sin rango de fechas la lista incluye también lo archivado
+    assert [h['id'] for h in client.get('/api/historial_inventario').get_json()] == list(range(1, 13))
+
+    response = client.get('/api/historial_inventario?desde=2024-02-10T00:00:00&hasta=2024-03-20T00:00:00')
+    print(f"Response JSON: {response.get_json()}")
+    assert [h['id'] for h in response.get_json()] == [5, 6, 7, 8]
+    assert response.get_json()[0]['fecha_movimiento'] == 'Thu, 15 Feb 2024 12:00:00 -0000'
+
+    # Paginación que cruza de la tabla al archivo
+    vistos = []
+    url = '/api/historial_inventario?desde=2024-01-01T00:00:00&sort=-fecha_movimiento&limit=4'
+    while url:
+        response = client.get(url)
+        vistos += [h['id'] for h in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/historial_inventario?desde=2024-01-01T00:00:00&sort=-fecha_movimiento&limit=4&cursor={cursor}' if cursor else None
+    assert vistos == list(range(12, 0, -1))
+
+    response = client.get('/api/historial_inventario/exportar?formato=ndjson&desde=2024-02-20T00:00:00')
+    assert [json.loads(linea)['id'] for linea in response.get_data(as_text=True).splitlines()] == list(range(6, 13))
+
+#Un rango acotado sólo por hasta también llega al archivo
+def test_rango_solo_hasta(app, client):
+    archivar_historial(datetime(2024, 3, 1))
+    response = client.get('/api/historial_inventario?hasta=2024-02-01T00:00:00')
+    assert [h['id'] for h in response.get_json()] == [1, 2, 3]
+    response = client.get('/api/historial_inventario?hasta=2024-03-10T00:00:00&sort=-fecha_movimiento&limit=2')
+    assert [h['id'] for h in response.get_json()] == [7, 6]
+
+    response = client.get('/api/historial_inventario/exportar?formato=ndjson&hasta=2024-02-16T00:00:00')
+    assert [json.loads(linea)['id'] for linea in response.get_data(as_text=True).splitlines()] == [1, 2, 3, 4, 5]
+
+#Una página sólo abre los ficheros que el cursor alcanza, hasta llenarse
+def test_pagina_abre_solo_lo_necesario(app, client, monkeypatch):
+    archivar_historial(datetime(2024, 3, 1))
+    # Movimiento de enero que llega tarde: segunda partición de enero
+    db.session.add(HistorialInventario(articulo_id=1, tipo_movimiento_id=1, cantidad=1, fecha_movimiento=datetime(2024, 1, 10)))
+    db.session.commit()
+    archivar_historial(datetime(2024, 3, 1))
+    assert ParticionHistorial.query.count() == 3
+
+    abiertos = []
+    leer = api.archive._leer_fichero
+    monkeypatch.setattr(api.archive, '_leer_fichero', lambda fichero, *args, **kwargs: abiertos.append(fichero[10:17]) or leer(fichero, *args, **kwargs))
+
+    response = client.get('/api/historial_inventario?limit=2')
+    assert [h['id'] for h in response.get_json()] == [1, 2]
+    # Las tres filas (limit + 1) salen del primer fichero
+    assert abiertos == ['2024-01']
+    abiertos.clear()
+    cursor = client.get('/api/historial_inventario?limit=4').headers['X-Next-Cursor']
+    abiertos.clear()
+    response = client.get(f'/api/historial_inventario?limit=4&cursor={cursor}')
+    assert [h['id'] for h in response.get_json()] == [5, 6, 7, 8]
+    # El primer fichero de enero (ids 1-3) queda entero antes del cursor, y
+    # el segundo (id 13) detrás de la última fila de la tabla que hace falta
+    assert abiertos == ['2024-02']
+
+    # En orden descendente la tabla llena la página: sólo se abre el
+    # fichero del id 13, que va delante de las filas de la tabla
+    abiertos.clear()
+    response = client.get('/api/historial_inventario?sort=-id&limit=3')
+    assert [h['id'] for h in response.get_json()] == [13, 12, 11]
+    response = client.get(f"/api/historial_inventario?sort=-id&limit=3&cursor={response.headers['X-Next-Cursor']}")
+    assert [h['id'] for h in response.get_json()] == [10, 9, 8]
+    response = client.get('/api/historial_inventario?sort=-fecha_movimiento&limit=3')
+    assert [h['id'] for h in response.get_json()] == [12, 11, 10]
+    assert abiertos == ['2024-01']
+    # Cuando la página llega al archivo, en orden descendente sólo se
+    # guardan las filas que caben
+    response = client.get('/api/historial_inventario?sort=-id&limit=8')
+    assert [h['id'] for h in response.get_json()] == [13, 12, 11, 10, 9, 8, 7, 6]
+
+    # Por fecha las dos particiones de enero se solapan y se mezclan
+    abiertos.clear()
+    response = client.get('/api/historial_inventario?sort=fecha_movimiento&limit=3')
+    assert [h['id'] for h in response.get_json()] == [1, 13, 2]
+    assert sorted(abiertos) == ['2024-01', '2024-01']
+    abiertos.clear()
+    response = client.get('/api/historial_inventario?sort=-fecha_movimiento&hasta=2024-02-28T00:00:00&limit=2')
+    assert [h['id'] for h in response.get_json()] == [6, 5]
+    assert abiertos == ['2024-02']
+
+#Archivar cambia el ETag de los artículos cuyo historial expandido cambia
+def test_archivar_cambia_etag(app, client):
+    db.session.add(HistorialInventario(articulo_id=1, tipo_movimiento_id=1, cantidad=1, fecha_movimiento=datetime.now()))
+    db.session.commit()
+    url = '/api/articulos/1?expand=historial&historial_limit=20'
+    etag = client.get(url).headers['ETag']
+    etag_lista = client.get('/api/articulos?expand=historial').headers['ETag']
+    archivar_historial(datetime(2024, 3, 1))
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()['historial']) == 7
+    assert client.get('/api/articulos?expand=historial', headers={'If-None-Match': etag_lista}).status_code == 200
+
+#El stock a una fecha da lo mismo antes y después de archivar
+def test_stock_a_fecha_con_archivo(app, client):
+    fechas = ['2024-01-20T00:00:00', '2024-02-28T00:00:00', '2024-04-01T00:00:00']
+    antes = [client.get(f'/api/articulos/1/stock?fecha={fecha}').get_json()['stock'] for fecha in fechas]
+    archivar_historial(datetime(2024, 3, 1))
+    despues = [client.get(f'/api/articulos/1/stock?fecha={fecha}').get_json()['stock'] for fecha in fechas]
+    assert antes == despues == [102, 106, 109]
+
+#Un fichero que no está en el manifiesto (ejecución fallida) se ignora
+def test_fichero_sin_manifiesto(app, client):
+    archivar_historial(datetime(2024, 2, 1))
+    ruta = os.path.join(app.config['ARCHIVO_HISTORIAL_DIR'], 'historial-2024-01.huerfano.ndjson.gz')
+    with gzip.open(ruta, 'wt', encoding='utf-8') as fichero:
+        fichero.write(json.dumps({'id': 99, 'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 1, 'fecha_movimiento': '2024-01-06T00:00:00'}) + '\n')
+    response = client.get('/api/historial_inventario?desde=2024-01-01T00:00:00&hasta=2024-01-31T00:00:00')
+    assert [h['id'] for h in response.get_json()] == [1, 2, 3]
@@ -0,0 +1,69 @@
+import gzip
+import json
+import pytest
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento
+
+
+@pytest.fixture(autouse=True)
+def datos(app):
+    db.session.add_all([Categoria(categoria='Electrónica'), Proveedor(proveedor='Tech Supplier'),
+                        TipoMovimiento(tipo='Ingreso'), TipoMovimiento(tipo='Egreso')])
+    db.session.add_all([Articulo(nombre=f'Articulo {i}', descripcion='Descripción de prueba', categoria_id=1,
+                                 proveedor_id=1, stock=10, precio=1.5) for i in range(1, 101)])
+    db.session.commit()
+
+
+def _aciertos(client):
+    return client.get('/api/metricas').get_json()['cache']['respuestas']['aciertos']
+
+
+#Con Accept-Encoding: gzip la lista sale comprimida y con el mismo contenido
+def test_gzip(client):
+    plano = client.get('/api/articulos')
+    assert 'Content-Encoding' not in plano.headers
+
+    response = client.get('/api/articulos', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(plano.data)
+    assert json.loads(gzip.decompress(response.data)) == plano.get_json()
+    # ETag débil para la versión comprimida, y el 304 sigue funcionando
+    assert response.headers['ETag'].startswith('W/')
+    response = client.get('/api/articulos', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+#Brotli tiene preferencia si está instalado
+def test_brotli(client):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/api/articulos', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.data)) == client.get('/api/articulos').get_json()
+    response = client.get('/api/articulos', headers={'Accept-Encoding': 'gzip, br;q=0.5'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+#Las respuestas pequeñas, los errores y las exportaciones en streaming no se comprimen
+def test_sin_compresion(client):
+    cabeceras = {'Accept-Encoding': 'gzip'}
+    assert 'Content-Encoding' not in client.get('/api/categorias', headers=cabeceras).headers
+    assert 'Content-Encoding' not in client.get('/api/articulos/999', headers=cabeceras).headers
+    assert 'Content-Encoding' not in client.get('/api/articulos/exportar', headers=cabeceras).headers
+
+#Las lecturas repetidas salen de la caché y una escritura la invalida
+def test_cache_de_respuestas(client):
+    cabeceras = {'Accept-Encoding': 'gzip'}
+    client.get('/api/articulos?limit=50', headers=cabeceras)
+    antes = _aciertos(client)
+    primera = client.get('/api/articulos?limit=50', headers=cabeceras)
+    assert _aciertos(client) == antes + 1
+    assert primera.headers['Content-Encoding'] == 'gzip'
+    assert primera.headers['Link']
+
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5})
+    response = client.get('/api/articulos?limit=50', headers=cabeceras)
+    assert json.loads(gzip.decompress(response.data))[0]['stock'] == 15
+    assert response.headers['ETag'] != primera.headers['ETag']
+
+    # Los tipos de movimiento también tienen versión ahora
+    client.get('/api/tipos_movimiento')
+    client.patch('/api/tipos_movimiento/2', json={'tipo': 'Salida'})
+    assert client.get('/api/tipos_movimiento').get_json()[1]['tipo'] == 'Salida'
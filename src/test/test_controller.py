@@ -1,41 +1,18 @@
+import base64
+import threading
 from datetime import datetime
 from flask import Flask, json
+from sqlalchemy import event
 from flask_sqlalchemy import SQLAlchemy
 from flask_restful import Api
 import unittest
 import pytest
-from api.models import db, Articulo, Categoria, Proveedor
-from api.controllers import ArticuloResource, ArticulosResource, CategoriaResource, CategoriasResource, ProveedorResource, ProveedoresResource, TiposMovimientoResource, TipoMovimientoResource, HistorialDetalleResource, HistorialResource
-
-@pytest.fixture
-def app():
-    app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['TESTING'] = True
-
-    db.init_app(app)
-
-    api = Api(app)
-
-    api.add_resource(ArticulosResource, '/api/articulos')
-    api.add_resource(ArticuloResource, '/api/articulos/<int:articulo_id>')
-    api.add_resource(CategoriasResource, '/api/categorias')
-    api.add_resource(CategoriaResource, '/api/categorias/<int:categoria_id>')
-    api.add_resource(ProveedoresResource, '/api/proveedores')
-    api.add_resource(ProveedorResource, '/api/proveedores/<int:proveedor_id>')
-    api.add_resource(HistorialResource, '/api/historial_inventario')
-    api.add_resource(HistorialDetalleResource, '/api/historial_inventario/<int:historial_id>')
-    api.add_resource(TiposMovimientoResource, '/api/tipos_movimiento')
-    api.add_resource(TipoMovimientoResource, '/api/tipos_movimiento/<int:tipo_id>')
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.drop_all()
+import api.group_commit
+import api.movements
+from api.models import db, Articulo, Categoria, Proveedor, HistorialInventario, SnapshotStock, VersionRecurso
+from api.snapshots import crear_snapshots
 
-@pytest.fixture
-def client(app):
-    return app.test_client()
+# Los fixtures app y client están en conftest.py
 
 
 # Pruebas para proveedores
@@ -306,3 +283,558 @@ def test_delete_historial_inventario(client):
     print(f"Delete Response: {delete_response.get_json()}")
     assert delete_response.status_code == 200
     assert client.get('/api/historial_inventario').get_json() == [] 
+
+
+# Pruebas de paginación, filtros y orden en las listas
+
+#Recorrer los proveedores página a página con el cursor
+def test_paginacion_proveedores(client):
+    for nombre in ['A', 'B', 'C', 'D', 'E']:
+        client.post('/api/proveedores', json={'proveedor': nombre})
+
+    vistos = []
+    response = client.get('/api/proveedores?limit=2')
+    while True:
+        assert response.status_code == 200
+        vistos.extend(p['proveedor'] for p in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        response = client.get(f'/api/proveedores?limit=2&cursor={cursor}')
+    print(f"Proveedores recorridos: {vistos}")
+    assert vistos == ['A', 'B', 'C', 'D', 'E']
+
+#Orden descendente por nombre
+def test_orden_categorias_descendente(client):
+    for nombre in ['Hogar', 'Ropa', 'Electrónica']:
+        client.post('/api/categorias', json={'categoria': nombre})
+    response = client.get('/api/categorias?sort=-categoria&limit=2')
+    assert [c['categoria'] for c in response.get_json()] == ['Ropa', 'Hogar']
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/api/categorias?sort=-categoria&limit=2&cursor={cursor}')
+    assert [c['categoria'] for c in response.get_json()] == ['Electrónica']
+    assert 'X-Next-Cursor' not in response.headers
+
+#Filtrar artículos por categoría y rango de stock
+def test_filtros_articulos(client):
+    client.post('/api/proveedores', json={'proveedor': 'Tech Supplier'})
+    client.post('/api/categorias', json={'categoria': 'Electrónica'})
+    client.post('/api/categorias', json={'categoria': 'Hogar'})
+    for nombre, categoria_id, stock in [('Laptop', 1, 10), ('Mouse', 1, 50), ('Silla', 2, 20), ('Monitor', 1, 5)]:
+        client.post('/api/articulos', json={'nombre': nombre, 'descripcion': '', 'categoria_id': categoria_id,
+                                            'proveedor_id': 1, 'stock': stock, 'precio': 10.0})
+
+    response = client.get('/api/articulos?categoria_id=1&stock_min=6&stock_max=50&sort=-stock')
+    print(f"Response JSON: {response.get_json()}")
+    assert [a['nombre'] for a in response.get_json()] == ['Mouse', 'Laptop']
+
+#Historial ordenado por fecha descendente y filtrado por artículo
+def test_historial_orden_fecha(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/articulos', json={'nombre': 'Mouse', 'descripcion': '', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 15.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    for articulo_id, cantidad in [(1, 1), (2, 2), (1, 3), (1, 4)]:
+        client.post('/api/historial_inventario', json={'articulo_id': articulo_id, 'tipo_movimiento_id': 1, 'cantidad': cantidad})
+
+    response = client.get('/api/historial_inventario?articulo_id=1&sort=-fecha_movimiento&limit=2')
+    assert [h['cantidad'] for h in response.get_json()] == [4, 3]
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/api/historial_inventario?articulo_id=1&sort=-fecha_movimiento&limit=2&cursor={cursor}')
+    assert [h['cantidad'] for h in response.get_json()] == [1]
+
+#Parámetros de paginación inválidos
+def test_paginacion_parametros_invalidos(client):
+    assert client.get('/api/articulos?cursor=no-es-un-cursor').status_code == 400
+    assert client.get('/api/articulos?sort=descripcion').status_code == 400
+    assert client.get('/api/articulos?limit=0').status_code == 400
+    # JSON válido pero con una fecha que no lo es
+    cursor = base64.urlsafe_b64encode(b'{"o":"fecha_movimiento","d":false,"k":["ayer",1]}').decode()
+    response = client.get(f'/api/historial_inventario?sort=fecha_movimiento&cursor={cursor}')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Cursor inválido'
+
+
+# Pruebas de exportación en streaming
+
+#Exportar el historial en NDJSON
+def test_exportar_historial_ndjson(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    for cantidad in [1, 2, 3]:
+        client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': cantidad})
+
+    response = client.get('/api/historial_inventario/exportar')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lineas = [json.loads(linea) for linea in response.get_data(as_text=True).splitlines()]
+    print(f"Líneas exportadas: {lineas}")
+    assert [h['cantidad'] for h in lineas] == [1, 2, 3]
+    assert datetime.fromisoformat(lineas[0]['fecha_movimiento'])
+
+#Exportar el historial en CSV con rango de fechas vacío
+def test_exportar_historial_csv_rango(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5})
+
+    response = client.get('/api/historial_inventario/exportar?formato=csv&hasta=2000-01-01T00:00:00')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).splitlines() == ['id,articulo_id,tipo_movimiento_id,cantidad,fecha_movimiento']
+
+#Exportar artículos en CSV
+def test_exportar_articulos_csv(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    response = client.get('/api/articulos/exportar?formato=csv')
+    lineas = response.get_data(as_text=True).splitlines()
+    assert lineas[0] == 'id,nombre,descripcion,categoria_id,proveedor_id,stock,precio'
+    assert lineas[1] == '1,Laptop ASUS,Laptop gaming,1,1,10,1500.0'
+    assert client.get('/api/articulos/exportar?formato=xml').status_code == 400
+
+
+# Pruebas de registro de movimientos por lote
+
+#Lote con ingresos y egresos del mismo artículo y un fallo parcial
+def test_lote_movimientos_fallo_parcial(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/articulos', json={'nombre': 'Mouse', 'descripcion': '', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 1, 'precio': 15.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Egreso'})
+
+    response = client.post('/api/historial_inventario/lote', json={'movimientos': [
+        {'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 8},
+        {'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 5},
+        {'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 4},
+        {'articulo_id': 2, 'tipo_movimiento_id': 2, 'cantidad': 1},
+        {'articulo_id': 999, 'tipo_movimiento_id': 1, 'cantidad': 1},
+        {'articulo_id': 2, 'tipo_movimiento_id': 1},
+    ]})
+    data = response.get_json()
+    print(f"Response JSON: {data}")
+    assert response.status_code == 207
+    assert [r['estado'] for r in data['resultados']] == [201, 400, 201, 201, 404, 400]
+    assert data['aceptados'] == 3 and data['rechazados'] == 3
+    assert data['resultados'][0]['historial']['cantidad'] == 8
+
+    assert client.get('/api/articulos/1').get_json()['stock'] == 6
+    assert client.get('/api/articulos/2').get_json()['stock'] == 0
+    assert len(client.get('/api/historial_inventario').get_json()) == 3
+
+#Si otro proceso consume stock entre la lectura y la escritura, sólo se
+#rechazan los egresos que ya no caben, no todo lo del artículo
+def test_lote_stock_cambiado_por_otro_proceso(client, monkeypatch):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Egreso'})
+
+    # Los tipos se consultan después de leer el stock
+    obtener_tipos = api.movements.obtener_tipos
+    def consumir_y_obtener(tipo_ids):
+        db.session.execute(db.update(Articulo).where(Articulo.id == 1).values(stock=2))
+        return obtener_tipos(tipo_ids)
+    monkeypatch.setattr(api.movements, 'obtener_tipos', consumir_y_obtener)
+
+    response = client.post('/api/historial_inventario/lote', json=[
+        {'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5},
+        {'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 8},
+        {'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 4},
+    ])
+    assert [r['estado'] for r in response.get_json()['resultados']] == [201, 400, 201]
+    assert client.get('/api/articulos/1').get_json()['stock'] == 3
+    assert [h['cantidad'] for h in client.get('/api/historial_inventario').get_json()] == [5, 4]
+
+#Lote vacío
+def test_lote_movimientos_vacio(client):
+    response = client.post('/api/historial_inventario/lote', json=[])
+    assert response.status_code == 400
+
+#Cantidades cero o negativas se rechazan y no tocan el stock
+def test_movimiento_cantidad_no_positiva(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Egreso'})
+
+    for cantidad in (0, -5):
+        response = client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': cantidad})
+        assert response.status_code == 400
+        assert response.get_json()['message'] == 'La cantidad debe ser mayor que cero'
+
+    response = client.post('/api/historial_inventario/lote', json=[
+        {'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': -5},
+        {'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 0},
+        {'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 3},
+    ])
+    resultados = response.get_json()['resultados']
+    assert [r['estado'] for r in resultados] == [400, 400, 201]
+    assert resultados[0]['mensaje'] == 'La cantidad debe ser mayor que cero'
+
+    assert client.get('/api/articulos/1').get_json()['stock'] == 7
+    assert [h['cantidad'] for h in client.get('/api/historial_inventario').get_json()] == [3]
+
+
+# Pruebas de la caché de datos de referencia
+
+#Las lecturas repetidas salen de la caché y las escrituras la invalidan
+def test_cache_categorias(client):
+    client.post('/api/categorias', json={'categoria': 'Electrónica'})
+    client.get('/api/categorias')
+    client.get('/api/categorias')
+    # La segunda lectura de la lista sale ya codificada de la caché de
+    # respuestas; el detalle usa la caché de categorías
+    client.get('/api/categorias/1')
+    client.get('/api/categorias/1')
+    metricas = client.get('/api/metricas').get_json()['cache']
+    print(f"Métricas: {metricas}")
+    assert metricas['respuestas']['aciertos'] >= 1
+    assert metricas['categorias']['aciertos'] >= 1
+
+    client.patch('/api/categorias/1', json={'categoria': 'Hogar'})
+    assert client.get('/api/categorias').get_json() == [{'id': 1, 'categoria': 'Hogar'}]
+    assert client.get('/api/categorias/1').get_json()['categoria'] == 'Hogar'
+
+#Cambiar el tipo de un movimiento invalida la caché usada al registrar movimientos
+def test_cache_tipos_movimiento_invalidacion(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5})
+    client.patch('/api/tipos_movimiento/1', json={'tipo': 'Egreso'})
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 3})
+    assert client.get('/api/articulos/1').get_json()['stock'] == 12
+
+
+# Pruebas de GET condicional (ETag / 304)
+
+#La lista de artículos responde 304 mientras no haya cambios
+def test_etag_lista_articulos(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    response = client.get('/api/articulos')
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+
+    response = client.get('/api/articulos', headers={'If-None-Match': etag})
+    print(f"Status Code: {response.status_code}")
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+    # Otros parámetros son otra representación
+    assert client.get('/api/articulos?limit=1', headers={'If-None-Match': etag}).status_code == 200
+
+    # Un movimiento cambia el stock y por tanto la versión
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5})
+    response = client.get('/api/articulos', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+#Versión por elemento: cambiar un proveedor no invalida otro
+def test_etag_por_elemento(client):
+    client.post('/api/proveedores', json={'proveedor': 'Tech Supplier'})
+    client.post('/api/proveedores', json={'proveedor': 'Best Supplies'})
+    etag_1 = client.get('/api/proveedores/1').headers['ETag']
+    etag_2 = client.get('/api/proveedores/2').headers['ETag']
+
+    client.patch('/api/proveedores/2', json={'proveedor': 'Best Supplies SA'})
+    assert client.get('/api/proveedores/1', headers={'If-None-Match': etag_1}).status_code == 304
+    response = client.get('/api/proveedores/2', headers={'If-None-Match': etag_2})
+    assert response.status_code == 200
+    assert response.get_json()['proveedor'] == 'Best Supplies SA'
+
+
+#Movimientos de artículos distintos no escriben la misma fila de versión,
+#pero la versión de la colección cambia con cualquiera de ellos
+def test_version_coleccion_fragmentada(client):
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    for nombre in ('Laptop ASUS', 'Mouse'):
+        client.post('/api/articulos', json={'nombre': nombre, 'descripcion': '', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1.0})
+
+    versiones = lambda: {v.clave: v.version for v in VersionRecurso.query.filter(VersionRecurso.clave.like('articulos%'))}
+    etags = [client.get('/api/articulos').headers['ETag']]
+    cambiadas = []
+    for articulo_id in (1, 2):
+        antes = versiones()
+        client.post('/api/historial_inventario', json={'articulo_id': articulo_id, 'tipo_movimiento_id': 1, 'cantidad': 1})
+        despues = versiones()
+        cambiadas.append({clave for clave in despues if despues[clave] != antes.get(clave)})
+        etags.append(client.get('/api/articulos').headers['ETag'])
+    assert cambiadas == [{'articulos#1', 'articulos/1'}, {'articulos#2', 'articulos/2'}]
+    assert len(set(etags)) == 3
+
+
+# Pruebas de valoración de inventario
+
+def _crear_catalogo_valoracion(client):
+    client.post('/api/categorias', json={'categoria': 'Electrónica'})
+    client.post('/api/categorias', json={'categoria': 'Hogar'})
+    client.post('/api/proveedores', json={'proveedor': 'Tech Supplier'})
+    client.post('/api/proveedores', json={'proveedor': 'Best Supplies'})
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/articulos', json={'nombre': 'Mouse', 'descripcion': 'Mouse inalámbrico', 'categoria_id': 1, 'proveedor_id': 2, 'stock': 4, 'precio': 25.50})
+    client.post('/api/articulos', json={'nombre': 'Lámpara', 'descripcion': 'Lámpara de mesa', 'categoria_id': 2, 'proveedor_id': 2, 'stock': 3, 'precio': 40.00})
+
+#Valoración total sin agrupar
+def test_valoracion_total(client):
+    _crear_catalogo_valoracion(client)
+    response = client.get('/api/articulos/valoracion')
+    print(f"Response JSON: {response.get_json()}")
+    assert response.status_code == 200
+    assert response.get_json() == [{'articulos': 3, 'unidades': 17, 'valor': 15222.0}]
+
+#Valoración agrupada por categoría y por categoría y proveedor, con filtros
+def test_valoracion_agrupada(client):
+    _crear_catalogo_valoracion(client)
+    response = client.get('/api/articulos/valoracion?agrupar=categoria')
+    assert response.get_json() == [
+        {'categoria_id': 1, 'categoria': 'Electrónica', 'articulos': 2, 'unidades': 14, 'valor': 15102.0},
+        {'categoria_id': 2, 'categoria': 'Hogar', 'articulos': 1, 'unidades': 3, 'valor': 120.0}
+    ]
+
+    response = client.get('/api/articulos/valoracion?agrupar=categoria,proveedor&stock_min=4')
+    assert response.get_json() == [
+        {'categoria_id': 1, 'categoria': 'Electrónica', 'proveedor_id': 1, 'proveedor': 'Tech Supplier', 'articulos': 1, 'unidades': 10, 'valor': 15000.0},
+        {'categoria_id': 1, 'categoria': 'Electrónica', 'proveedor_id': 2, 'proveedor': 'Best Supplies', 'articulos': 1, 'unidades': 4, 'valor': 102.0}
+    ]
+
+    assert client.get('/api/articulos/valoracion?agrupar=precio').status_code == 400
+
+#El ETag de la valoración cambia si cambia un artículo o el nombre de una categoría
+def test_valoracion_etag(client):
+    _crear_catalogo_valoracion(client)
+    etag = client.get('/api/articulos/valoracion?agrupar=categoria').headers['ETag']
+    assert client.get('/api/articulos/valoracion?agrupar=categoria', headers={'If-None-Match': etag}).status_code == 304
+
+    client.patch('/api/categorias/2', json={'categoria': 'Hogar y jardín'})
+    response = client.get('/api/articulos/valoracion?agrupar=categoria', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()[1]['categoria'] == 'Hogar y jardín'
+
+
+# Pruebas de búsqueda de texto completo
+
+#Búsqueda por prefijo, sin acentos y ordenada por relevancia
+def test_buscar_articulos(client):
+    client.post('/api/articulos', json={'nombre': 'Lámpara de escritorio', 'descripcion': 'Luz LED', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 3, 'precio': 40.00})
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/articulos', json={'nombre': 'Mochila', 'descripcion': 'Mochila para laptop', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 4, 'precio': 25.50})
+
+    response = client.get('/api/articulos/buscar?q=lapt')
+    print(f"Response JSON: {response.get_json()}")
+    assert response.status_code == 200
+    assert [a['nombre'] for a in response.get_json()] == ['Laptop ASUS', 'Mochila']
+
+    assert [a['id'] for a in client.get('/api/articulos/buscar?q=lampara').get_json()] == [1]
+    assert [a['id'] for a in client.get('/api/articulos/buscar?q=laptop moch').get_json()] == [3]
+    assert client.get('/api/articulos/buscar?q=teclado').get_json() == []
+    assert client.get('/api/articulos/buscar?q=" *').status_code == 400
+    assert client.get('/api/articulos/buscar').status_code == 400
+
+#El índice sigue a las altas, modificaciones y bajas, pero no a los cambios de stock
+def test_buscar_articulos_sincronizado(client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5})
+    assert client.get('/api/articulos/buscar?q=laptop').get_json()[0]['stock'] == 15
+
+    client.patch('/api/articulos/1', json={'nombre': 'Notebook ASUS', 'descripcion': 'Equipo portátil', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 15, 'precio': 1500.00})
+    assert client.get('/api/articulos/buscar?q=laptop').get_json() == []
+    assert [a['id'] for a in client.get('/api/articulos/buscar?q=notebook').get_json()] == [1]
+
+    client.delete('/api/articulos/1')
+    assert client.get('/api/articulos/buscar?q=notebook').get_json() == []
+
+#Paginación con limit/offset y enlace a la página siguiente
+def test_buscar_articulos_paginado(client):
+    for i in range(5):
+        client.post('/api/articulos', json={'nombre': f'Cable {i}', 'descripcion': 'Cable USB', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 1, 'precio': 5.00})
+    response = client.get('/api/articulos/buscar?q=cable&limit=2')
+    assert len(response.get_json()) == 2
+    assert response.headers['X-Next-Offset'] == '2'
+    vistos = [a['id'] for a in response.get_json()]
+    vistos += [a['id'] for a in client.get('/api/articulos/buscar?q=cable&limit=2&offset=2').get_json()]
+    response = client.get('/api/articulos/buscar?q=cable&limit=2&offset=4')
+    vistos += [a['id'] for a in response.get_json()]
+    assert 'X-Next-Offset' not in response.headers
+    assert sorted(vistos) == [1, 2, 3, 4, 5]
+
+
+# Pruebas de stock a una fecha (snapshots)
+
+def _mover(app, articulo_id, tipo_movimiento_id, cantidad, fecha):
+    with app.app_context():
+        historial = HistorialInventario(articulo_id=articulo_id, tipo_movimiento_id=tipo_movimiento_id, cantidad=cantidad, fecha_movimiento=fecha)
+        db.session.add(historial)
+        articulo = db.session.get(Articulo, articulo_id)
+        articulo.stock += cantidad if tipo_movimiento_id == 1 else -cantidad
+        db.session.commit()
+
+#El stock a una fecha parte del snapshot anterior y aplica sólo los movimientos posteriores
+def test_stock_a_fecha(app, client):
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Egreso'})
+    with app.app_context():
+        db.session.add(Articulo(id=1, nombre='Laptop ASUS', descripcion='Laptop gaming', categoria_id=1, proveedor_id=1, stock=10, precio=1500.00))
+        db.session.add(SnapshotStock(articulo_id=1, fecha=datetime(2024, 1, 1), stock=10, motivo='alta'))
+        db.session.commit()
+    _mover(app, 1, 1, 5, datetime(2024, 1, 10))
+    _mover(app, 1, 2, 3, datetime(2024, 2, 10))
+    with app.app_context():
+        assert crear_snapshots(ahora=datetime(2024, 3, 1)) == 1
+        assert crear_snapshots(ahora=datetime(2024, 3, 2)) == 0
+        db.session.commit()
+    _mover(app, 1, 1, 8, datetime(2024, 3, 10))
+
+    response = client.get('/api/articulos/1/stock?fecha=2024-01-15T00:00:00')
+    print(f"Response JSON: {response.get_json()}")
+    assert response.status_code == 200
+    assert response.get_json()['stock'] == 15
+    assert response.get_json()['movimientos_aplicados'] == 1
+    assert client.get('/api/articulos/1/stock?fecha=2024-02-15T00:00:00').get_json()['stock'] == 12
+
+    response = client.get('/api/articulos/1/stock?fecha=2024-04-01T00:00:00')
+    assert response.get_json()['stock'] == 20
+    assert response.get_json()['snapshot'].startswith('2024-03-01')
+    assert response.get_json()['movimientos_aplicados'] == 1
+
+    assert client.get('/api/articulos/1/stock?fecha=2023-12-01T00:00:00').status_code == 404
+    assert client.get('/api/articulos/2/stock?fecha=2024-01-15T00:00:00').status_code == 404
+    assert client.get('/api/articulos/1/stock').status_code == 400
+
+#Alta y edición de stock desde la API generan snapshots; sin snapshot anterior se deshacen movimientos
+def test_stock_a_fecha_alta_y_edicion(app, client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.patch('/api/articulos/1', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 7, 'precio': 1400.00})
+    client.patch('/api/articulos/1', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 7, 'precio': 1400.00})
+    with app.app_context():
+        assert [s.motivo for s in SnapshotStock.query.order_by(SnapshotStock.id)] == ['alta', 'edicion']
+        assert client.get(f'/api/articulos/1/stock?fecha={datetime.now().isoformat()}').get_json()['stock'] == 7
+
+        # Artículo anterior a los snapshots
+        db.session.add(Articulo(id=2, nombre='Mouse', descripcion='Mouse', categoria_id=1, proveedor_id=1, stock=4, precio=20.00))
+        db.session.commit()
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    _mover(app, 2, 1, 6, datetime(2024, 1, 10))
+    assert client.get('/api/articulos/2/stock?fecha=2024-01-01T00:00:00').get_json()['stock'] == 4
+    assert client.get('/api/articulos/2/stock?fecha=2024-02-01T00:00:00').get_json()['stock'] == 10
+
+
+# Pruebas del modo group commit
+
+#Con la cola activa las respuestas son las mismas que en modo síncrono
+@pytest.mark.parametrize('app_configurada', [{'MOVIMIENTOS_GROUP_COMMIT': True}], indirect=True)
+def test_movimientos_group_commit(app_configurada):
+    client = app_configurada.test_client()
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Egreso'})
+
+    response = client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 4})
+    print(f"Response JSON: {response.get_json()}")
+    assert response.status_code == 201
+    assert response.get_json()['cantidad'] == 4
+    assert response.get_json()['fecha_movimiento']
+
+    response = client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 7})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'No hay suficiente stock para realizar el egreso'
+    assert client.post('/api/historial_inventario', json={'articulo_id': 9, 'tipo_movimiento_id': 1, 'cantidad': 1}).status_code == 404
+    assert client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 9, 'cantidad': 1}).status_code == 404
+
+    assert client.get('/api/articulos/1').get_json()['stock'] == 6
+    assert client.get('/api/metricas').get_json()['cola_movimientos']['movimientos'] == 4
+
+#Un movimiento que agota la espera en la cola se cancela y no se registra;
+#uno que ya está en un grupo espera a su commit
+@pytest.mark.parametrize('app_configurada', [{'MOVIMIENTOS_GROUP_COMMIT': True, 'GROUP_COMMIT_TIMEOUT': 0.1}], indirect=True)
+def test_group_commit_cancela_al_agotar_espera(app_configurada, monkeypatch):
+    app = app_configurada
+    client = app.test_client()
+    dentro, liberar = threading.Event(), threading.Event()
+    registrar = api.group_commit.registrar_lote
+
+    def registrar_lento(movimientos):
+        dentro.set()
+        liberar.wait(5)
+        return registrar(movimientos)
+
+    monkeypatch.setattr(api.group_commit, 'registrar_lote', registrar_lento)
+    try:
+        client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+        client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+        movimiento = {'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5}
+
+        primero = []
+        hilo = threading.Thread(target=lambda: primero.append(app.test_client().post('/api/historial_inventario', json=movimiento).status_code))
+        hilo.start()
+        assert dentro.wait(5)
+        response = client.post('/api/historial_inventario', json=movimiento)
+        assert response.status_code == 503
+        assert 'no se ha registrado' in response.get_json()['message']
+        liberar.set()
+        hilo.join(5)
+        assert primero == [201]
+    finally:
+        # Vacía la cola: el segundo movimiento sale de ella ya cancelado
+        app.extensions['cola_movimientos'].detener()
+    assert app.extensions['cola_movimientos'].metricas()['cancelados'] == 1
+    assert client.get('/api/articulos/1').get_json()['stock'] == 15
+    with app.app_context():
+        assert HistorialInventario.query.count() == 1
+
+
+# Pruebas de campos parciales (?fields=)
+
+#La lista y el detalle de artículos sólo devuelven los campos pedidos
+def test_campos_parciales_articulos(client):
+    for i in range(3):
+        client.post('/api/articulos', json={'nombre': f'Articulo {i}', 'descripcion': 'Descripción larga', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10 - i, 'precio': 1.5})
+
+    response = client.get('/api/articulos?fields=nombre,stock,id')
+    print(f"Response JSON: {response.get_json()}")
+    assert response.status_code == 200
+    assert response.get_json()[0] == {'id': 1, 'nombre': 'Articulo 0', 'stock': 10}
+
+    # La paginación sigue funcionando aunque la columna de orden no se pida
+    response = client.get('/api/articulos?fields=nombre&sort=stock&limit=2')
+    assert response.get_json() == [{'nombre': 'Articulo 2'}, {'nombre': 'Articulo 1'}]
+    response = client.get(f"/api/articulos?fields=nombre&sort=stock&limit=2&cursor={response.headers['X-Next-Cursor']}")
+    assert response.get_json() == [{'nombre': 'Articulo 0'}]
+
+    assert client.get('/api/articulos/2?fields=stock').get_json() == {'stock': 9}
+    assert client.get('/api/articulos/9?fields=stock').status_code == 404
+    assert client.get('/api/articulos/buscar?q=articulo&fields=id').get_json() == [{'id': 1}, {'id': 2}, {'id': 3}]
+
+    response = client.get('/api/articulos?fields=nombre,costo')
+    assert response.status_code == 400
+    assert 'costo' in response.get_json()['message']
+
+#La consulta SQL sólo selecciona las columnas pedidas
+def test_campos_parciales_proyeccion_sql(app, client):
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    sentencias = []
+
+    def capturar(conn, cursor, sentencia, parametros, context, executemany):
+        if 'FROM articulos' in sentencia:
+            sentencias.append(sentencia)
+
+    event.listen(db.engine, 'before_cursor_execute', capturar)
+    try:
+        client.get('/api/articulos?fields=nombre')
+        client.get('/api/articulos/1?fields=nombre')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capturar)
+    assert len(sentencias) == 2
+    for sentencia in sentencias:
+        assert 'articulos.nombre' in sentencia
+        assert 'descripcion' not in sentencia and 'precio' not in sentencia
+
+#Las tablas de referencia e historial también aceptan fields
+def test_campos_parciales_referencia_e_historial(client):
+    client.post('/api/categorias', json={'categoria': 'Electrónica'})
+    client.post('/api/articulos', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1, 'proveedor_id': 1, 'stock': 10, 'precio': 1500.00})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5})
+
+    assert client.get('/api/categorias?fields=categoria').get_json() == [{'categoria': 'Electrónica'}]
+    assert client.get('/api/categorias').get_json() == [{'id': 1, 'categoria': 'Electrónica'}]
+    assert client.get('/api/categorias/1?fields=id').get_json() == {'id': 1}
+    assert client.get('/api/tipos_movimiento?fields=tipo').get_json() == [{'tipo': 'Ingreso'}]
+    assert client.get('/api/historial_inventario?fields=articulo_id,cantidad').get_json() == [{'articulo_id': 1, 'cantidad': 5}]
+    assert client.get('/api/historial_inventario/1?fields=cantidad').get_json() == {'cantidad': 5}
@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import event
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento, HistorialInventario
+
+
+@pytest.fixture(autouse=True)
+def datos(app):
+    db.session.add_all([Categoria(categoria='Electrónica'), Categoria(categoria='Hogar'),
+                        Proveedor(proveedor='Tech Supplier'), TipoMovimiento(tipo='Ingreso')])
+    db.session.add_all([Articulo(nombre=f'Articulo {i}', descripcion='Descripción de prueba', categoria_id=1 + i % 2,
+                                 proveedor_id=1, stock=10, precio=1.5) for i in range(1, 31)])
+    db.session.flush()
+    db.session.add_all([HistorialInventario(articulo_id=articulo_id, tipo_movimiento_id=1, cantidad=n)
+                        for articulo_id in range(1, 31) for n in range(1, 16)])
+    db.session.commit()
+
+
+def _consultas(client, url):
+    # Sentencias sobre artículos, relaciones e historial durante la petición
+    sentencias = []
+
+    def capturar(conn, cursor, sentencia, parametros, context, executemany):
+        if 'FROM articulos' in sentencia or 'FROM historial_inventario' in sentencia:
+            sentencias.append(sentencia)
+
+    event.listen(db.engine, 'before_cursor_execute', capturar)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capturar)
+    return response, sentencias
+
+
+#El detalle incluye categoría, proveedor y los últimos movimientos
+def test_expandir_detalle(client):
+    response = client.get('/api/articulos/3?expand=categoria,proveedor,historial')
+    assert response.status_code == 200
+    datos = response.get_json()
+    assert datos['categoria'] == {'id': 2, 'categoria': 'Hogar'}
+    assert datos['proveedor'] == {'id': 1, 'proveedor': 'Tech Supplier'}
+    assert len(datos['historial']) == 10
+    assert [h['cantidad'] for h in datos['historial']][:3] == [15, 14, 13]
+    assert {h['articulo_id'] for h in datos['historial']} == {3}
+
+    # Sin expand la respuesta no cambia
+    assert 'categoria' not in client.get('/api/articulos/3').get_json()
+    # Con fields sólo se devuelven esos campos más las expansiones
+    datos = client.get('/api/articulos/3?fields=nombre&expand=categoria').get_json()
+    assert datos == {'nombre': 'Articulo 3', 'categoria': {'id': 2, 'categoria': 'Hogar'}}
+
+#La lista expandida usa el mismo número de consultas para cualquier página
+@pytest.mark.parametrize('limite', [5, 30])
+def test_expandir_lista_sin_n_mas_1(client, limite):
+    response, sentencias = _consultas(client, f'/api/articulos?limit={limite}&expand=categoria,proveedor,historial&historial_limit=3')
+    assert response.status_code == 200
+    datos = response.get_json()
+    assert len(datos) == limite
+    assert all(len(d['historial']) == 3 and d['categoria']['id'] == 1 + d['id'] % 2 for d in datos)
+    assert len(sentencias) == 2
+
+#historial_limit está acotado y las expansiones desconocidas dan 400
+def test_expansion_invalida(client):
+    assert client.get('/api/articulos/1?expand=historial&historial_limit=40').status_code == 200
+    assert len(client.get('/api/articulos/1?expand=historial&historial_limit=40').get_json()['historial']) == 15
+    assert client.get('/api/articulos/1?expand=historial&historial_limit=101').status_code == 400
+    assert client.get('/api/articulos/1?expand=historial&historial_limit=0').status_code == 400
+    response = client.get('/api/articulos?expand=categoria,costo')
+    assert response.status_code == 400
+    assert 'costo' in response.get_json()['message']
+
+#El ETag de la respuesta expandida cambia con las relaciones incluidas
+def test_etag_expandido(client):
+    url = '/api/articulos/1?expand=categoria,historial'
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    client.patch('/api/categorias/2', json={'categoria': 'Casa'})
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['categoria']['categoria'] == 'Casa'
+    # Sin expandir la categoría el ETag del artículo no cambia
+    etag_simple = client.get('/api/articulos/1').headers['ETag']
+    client.patch('/api/categorias/2', json={'categoria': 'Hogar'})
+    assert client.get('/api/articulos/1', headers={'If-None-Match': etag_simple}).status_code == 304
+
+    etag = response.headers['ETag']
+    ultimo = response.get_json()['historial'][0]['id']
+    client.delete(f'/api/historial_inventario/{ultimo}')
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert ultimo not in [h['id'] for h in response.get_json()['historial']]
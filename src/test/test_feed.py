@@ -0,0 +1,148 @@
+import json
+import threading
+import pytest
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento, CambioStock
+from api.feed import FeedStock
+
+
+CONFIGURACION = {'FEED_LATIDO_S': 0.05, 'FEED_DURACION_MAXIMA_S': 0.2, 'FEED_SONDEO_S': 0.02}
+
+
+def _poblar(app):
+    with app.app_context():
+        db.session.add_all([Categoria(categoria='Electrónica'), Proveedor(proveedor='Tech Supplier'),
+                            TipoMovimiento(tipo='Ingreso'), TipoMovimiento(tipo='Egreso')])
+        db.session.add(Articulo(nombre='Laptop ASUS', descripcion='Laptop gaming', categoria_id=1, proveedor_id=1, stock=10, precio=1500.0))
+        db.session.commit()
+    return app
+
+
+# En disco: el hilo del feed lee la tabla con su propia conexión
+@pytest.fixture
+def app(crear_app):
+    return _poblar(crear_app(en_disco=True, **CONFIGURACION))
+
+
+def _eventos(texto):
+    # [(id, evento, datos)] de un cuerpo text/event-stream
+    eventos = []
+    for bloque in texto.split("\n\n"):
+        campos = dict(linea.split(": ", 1) for linea in bloque.splitlines() if ": " in linea and not linea.startswith(":"))
+        if "event" in campos:
+            eventos.append((campos["id"], campos["event"], json.loads(campos["data"])))
+    return eventos
+
+
+def _ultimo_id(client):
+    return client.get('/api/metricas').get_json()['feed_stock']['ultimo']
+
+
+#Los movimientos y las ediciones de stock confirmados llegan como eventos
+def test_eventos_de_stock(client):
+    inicio = _ultimo_id(client)
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 3})
+    client.post('/api/historial_inventario/lote', json=[{'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5},
+                                                        {'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 1}])
+    client.patch('/api/articulos/1', json={'nombre': 'Laptop ASUS', 'descripcion': 'Laptop gaming', 'categoria_id': 1,
+                                           'proveedor_id': 1, 'stock': 50, 'precio': 1500.0})
+    # Un egreso rechazado no publica nada
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 500})
+
+    response = client.get('/api/articulos/cambios', headers={'Last-Event-ID': inicio})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    eventos = _eventos(response.get_data(as_text=True))
+    assert [(evento, datos) for _, evento, datos in eventos] == [
+        ('stock', {'articulo_id': 1, 'stock': 7, 'movimiento_id': 1}),
+        ('stock', {'articulo_id': 1, 'stock': 13, 'movimiento_id': 3}),
+        ('stock', {'articulo_id': 1, 'stock': 50, 'movimiento_id': None})
+    ]
+
+    # Reanudar desde un evento intermedio devuelve sólo los siguientes
+    response = client.get(f'/api/articulos/cambios?last_event_id={eventos[1][0]}')
+    assert [datos['stock'] for _, _, datos in _eventos(response.get_data(as_text=True))] == [50]
+
+#Sin Last-Event-ID sólo llegan los eventos nuevos, aunque lleguen mientras espera
+def test_espera_eventos_nuevos(app, client):
+    client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 1})
+    otro_cliente = app.test_client()
+    temporizador = threading.Timer(0.05, lambda: otro_cliente.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 5}))
+    temporizador.start()
+    texto = client.get('/api/articulos/cambios').get_data(as_text=True)
+    temporizador.join()
+    assert [datos['stock'] for _, _, datos in _eventos(texto)] == [16]
+    assert ': latido' in texto
+
+#Los cambios confirmados por otro proceso llegan a las conexiones de éste, y
+#el Last-Event-ID de un proceso sirve en cualquier otro
+def test_entre_procesos(app, client, crear_app):
+    otro_cliente = crear_app(uri=app.config['SQLALCHEMY_DATABASE_URI'], **CONFIGURACION).test_client()
+    client.get('/api/articulos/cambios')
+    temporizador = threading.Timer(0.05, lambda: otro_cliente.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 2, 'cantidad': 4}))
+    temporizador.start()
+    eventos = _eventos(client.get('/api/articulos/cambios').get_data(as_text=True))
+    temporizador.join()
+    assert [datos['stock'] for _, _, datos in eventos] == [6]
+
+    otro_cliente.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 1})
+    texto = otro_cliente.get('/api/articulos/cambios', headers={'Last-Event-ID': eventos[0][0]}).get_data(as_text=True)
+    assert [(evento, datos['stock']) for _, evento, datos in _eventos(texto)] == [('stock', 7)]
+
+#Cada FEED_CAPACIDAD cambios se purgan los que ya no caben en ningún buffer
+def test_purga(crear_app):
+    client = _poblar(crear_app(en_disco=True, **CONFIGURACION, FEED_CAPACIDAD=3)).test_client()
+    for _ in range(7):
+        client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 1})
+    with client.application.app_context():
+        assert [cambio.id for cambio in CambioStock.query.order_by(CambioStock.id)] == [4, 5, 6, 7]
+    texto = client.get('/api/articulos/cambios', headers={'Last-Event-ID': '4'}).get_data(as_text=True)
+    assert [datos['stock'] for _, _, datos in _eventos(texto)] == [15, 16, 17]
+    assert [evento for _, evento, _ in _eventos(client.get('/api/articulos/cambios?last_event_id=2').get_data(as_text=True))] == ['reinicio']
+
+#Un Last-Event-ID no válido o fuera del buffer pide recargar
+@pytest.mark.parametrize('ultimo_id', ['otro.1', 'x', '-1'])
+def test_reinicio(client, ultimo_id):
+    texto = client.get('/api/articulos/cambios', headers={'Last-Event-ID': ultimo_id}).get_data(as_text=True)
+    assert [evento for _, evento, _ in _eventos(texto)] == ['reinicio']
+
+#Por encima del máximo de conexiones el feed responde 503 y libera al cerrar
+def test_conexiones_maximas(app, client):
+    feed = app.extensions['feed_stock']
+    feed.conexiones_maximas = 1
+    assert feed.abrir()
+    response = client.get('/api/articulos/cambios')
+    assert response.status_code == 503
+    feed.cerrar()
+
+    response = client.get('/api/articulos/cambios')
+    assert response.status_code == 200
+    assert feed.conexiones == 1
+    response.close()
+    assert feed.metricas()['conexiones'] == 0 and feed.metricas()['rechazadas'] == 1
+
+#El buffer es acotado y detecta a los clientes que se quedaron atrás
+def test_buffer_circular():
+    feed = FeedStock(capacidad=3)
+    feed.publicar([(i, {'articulo_id': i, 'stock': i, 'movimiento_id': None}) for i in range(1, 6)])
+    assert feed.metricas()['en_buffer'] == 3
+    assert [n for n, _ in feed.esperar(2, 0)] == [3, 4, 5]
+    assert feed.esperar(1, 0) is None
+    assert feed.posicion('1') is None
+    assert feed.posicion('4') == 4
+    # Un id que este proceso aún no ha leído se acepta
+    assert feed.posicion('9') == 9
+    assert feed.esperar(5, 0) == []
+
+#Un hueco en los ids retiene los siguientes hasta que llega la fila o vence
+def test_huecos(monkeypatch):
+    feed = FeedStock(capacidad=10)
+    evento = lambda n: (n, {'articulo_id': 1, 'stock': n, 'movimiento_id': None})
+    feed.publicar([evento(1), evento(3)])
+    assert [n for n, _ in feed.esperar(0, 0)] == [1]
+    feed.publicar([evento(2), evento(3)])
+    assert [n for n, _ in feed.esperar(1, 0)] == [2, 3]
+
+    feed.publicar([evento(5)])
+    monkeypatch.setattr('api.feed.ESPERA_HUECO_S', 0)
+    feed.publicar([evento(5)])
+    assert [n for n, _ in feed.esperar(3, 0)] == [5]
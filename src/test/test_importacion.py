@@ -0,0 +1,120 @@
+import io
+import time
+import pytest
+from api.models import db, Articulo, Categoria, Proveedor, SnapshotStock
+from api.importer import importar_articulos
+
+CABECERA = "nombre,descripcion,categoria,proveedor,stock,precio\n"
+
+
+@pytest.fixture(autouse=True)
+def datos(app):
+    db.session.add_all([Categoria(categoria='Electrónica'), Categoria(categoria='Hogar'),
+                        Proveedor(proveedor='Tech Supplier'), Proveedor(proveedor='Best Supplies')])
+    db.session.commit()
+
+
+#Altas y actualizaciones por (proveedor, nombre) con errores por fila
+def test_importar_csv(client):
+    csv = CABECERA + (
+        "Laptop ASUS,Laptop gaming,Electrónica,Tech Supplier,10,1500\n"
+        "Lámpara,\"Lámpara de mesa, LED\",Hogar,Best Supplies,3,40.5\n"
+        "Mouse,,Electrónica,Proveedor X,4,20\n"
+        "Teclado,,Electrónica,Tech Supplier,,30\n"
+        ",Sin nombre,Hogar,Best Supplies,1,1\n"
+        "Laptop ASUS,Repetido,Electrónica,Tech Supplier,1,1\n"
+    )
+    response = client.post('/api/articulos/importar', data=csv.encode(), content_type='text/csv')
+    print(f"Response JSON: {response.get_json()}")
+    assert response.status_code == 207
+    resumen = response.get_json()
+    assert (resumen['filas'], resumen['insertados'], resumen['actualizados'], resumen['con_error']) == (6, 2, 0, 4)
+    assert [error['fila'] for error in resumen['errores']] == [6, 4, 5, 7]
+    assert 'Proveedor X' in resumen['errores'][1]['mensaje']
+
+    articulos = client.get('/api/articulos').get_json()
+    assert [(a['nombre'], a['categoria_id'], a['proveedor_id'], a['stock']) for a in articulos] == [('Laptop ASUS', 1, 1, 10), ('Lámpara', 2, 2, 3)]
+    assert articulos[1]['descripcion'] == 'Lámpara de mesa, LED'
+
+    # Segunda importación: actualiza precios; stock vacío conserva el actual
+    csv = CABECERA + "Laptop ASUS,Laptop gaming,Electrónica,Tech Supplier,,1399.9\nLámpara,,Hogar,Best Supplies,8,45\n"
+    response = client.post('/api/articulos/importar', data={'archivo': (io.BytesIO(csv.encode()), 'precios.csv')}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.get_json()['actualizados'] == 2
+    assert client.post('/api/articulos/importar', data={'archivo': (io.BytesIO(csv.encode()), 'precios.csv')}, content_type='multipart/form-data').get_json()['sin_cambios'] == 2
+    articulos = client.get('/api/articulos').get_json()
+    assert [(a['stock'], a['precio']) for a in articulos] == [(10, 1399.9), (8, 45.0)]
+
+    # La búsqueda y los snapshots siguen al catálogo importado
+    assert [a['nombre'] for a in client.get('/api/articulos/buscar?q=lamp').get_json()] == ['Lámpara']
+    assert [(s.articulo_id, s.stock, s.motivo) for s in SnapshotStock.query.order_by(SnapshotStock.id)] == [(1, 10, 'alta'), (2, 3, 'alta'), (2, 8, 'edicion')]
+
+#Una fila con id actualiza ese artículo; la cabecera debe tener las columnas obligatorias
+def test_importar_por_id_y_cabecera(client):
+    client.post('/api/articulos/importar', data=(CABECERA + "Laptop ASUS,,Electrónica,Tech Supplier,10,1500\n").encode(), content_type='text/csv')
+    response = client.post('/api/articulos/importar', data="id,nombre,categoria,proveedor,precio\n1,Laptop ASUS ROG,Electrónica,Best Supplies,1800\n9,X,Hogar,Best Supplies,1\n".encode(), content_type='text/csv')
+    assert response.get_json()['actualizados'] == 1
+    assert response.get_json()['errores'] == [{'fila': 3, 'mensaje': 'Artículo no encontrado: 9'}]
+    assert client.get('/api/articulos/1').get_json() == {'id': 1, 'nombre': 'Laptop ASUS ROG', 'descripcion': None, 'categoria_id': 1, 'proveedor_id': 2, 'stock': 10, 'precio': 1800.0}
+
+    response = client.post('/api/articulos/importar', data=b"nombre,stock\nMouse,1\n", content_type='text/csv')
+    assert response.status_code == 400
+    assert 'categoria, proveedor, precio' in response.get_json()['message']
+
+#Precios no finitos (nan, inf) son error de la fila, no se guardan
+def test_importar_precio_no_finito(client):
+    csv = CABECERA + "Mouse,,Electrónica,Tech Supplier,1,nan\nTeclado,,Electrónica,Tech Supplier,1,inf\nMonitor,,Electrónica,Tech Supplier,1,-1e999\nCable,,Electrónica,Tech Supplier,1,2.5\n"
+    resumen = client.post('/api/articulos/importar', data=csv.encode(), content_type='text/csv').get_json()
+    assert (resumen['insertados'], resumen['con_error']) == (1, 3)
+    assert [error['fila'] for error in resumen['errores']] == [2, 3, 4]
+    assert all('finito' in error['mensaje'] for error in resumen['errores'])
+    assert [a['nombre'] for a in client.get('/api/articulos').get_json()] == ['Cable']
+
+#Filas que el lector CSV no acepta y caracteres nulos son error de la fila
+def test_importar_filas_no_validas(client):
+    csv = CABECERA + f"Mouse,{'x' * 140000},Electrónica,Tech Supplier,1,20\nTec\0lado,,Electrónica,Tech Supplier,1,30\nCable,,Electrónica,Tech Supplier,1,2.5\n"
+    response = client.post('/api/articulos/importar', data=csv.encode(), content_type='text/csv')
+    assert response.status_code == 207
+    resumen = response.get_json()
+    assert (resumen['filas'], resumen['insertados'], resumen['con_error']) == (3, 1, 2)
+    assert [error['fila'] for error in resumen['errores']] == [2, 3]
+    assert 'field larger than field limit' in resumen['errores'][0]['mensaje']
+    assert 'nulos' in resumen['errores'][1]['mensaje']
+    assert [a['nombre'] for a in client.get('/api/articulos').get_json()] == ['Cable']
+
+#Un fichero que deja de ser UTF-8 a medias devuelve lo ya confirmado
+def test_importar_utf8_cortado(client):
+    csv = (CABECERA + "".join(f"Articulo {i},,Hogar,Tech Supplier,1,1\n" for i in range(3000))).encode() + b"Mal\xff,,Hogar,Tech Supplier,1,1\n"
+    response = client.post('/api/articulos/importar', data=csv, content_type='text/csv')
+    assert response.status_code == 400
+    assert 'UTF-8' in response.get_json()['message']
+    resumen = response.get_json()['resumen']
+    # El primer bloque de 2000 filas ya estaba confirmado
+    assert resumen['confirmado_hasta'] == 2001
+    assert resumen['insertados'] == 2000 == Articulo.query.count()
+
+    response = client.post('/api/articulos/importar', data=CABECERA.encode() + b"Mal\xff,,Hogar,Tech Supplier,1,1\n", content_type='text/csv')
+    assert response.status_code == 400
+    assert 'resumen' not in response.get_json()
+
+#Importación de un catálogo grande en bloques
+def test_importar_volumen(app):
+    filas = 20000
+    lineas = [CABECERA] + [f"Articulo {i},Descripción {i},{'Hogar' if i % 2 else 'Electrónica'},Tech Supplier,{i % 50},{i % 1000}.5\n" for i in range(filas)]
+    inicio = time.perf_counter()
+    resumen = importar_articulos(lineas)
+    duracion = time.perf_counter() - inicio
+    print(f"{filas} filas en {duracion:.2f}s ({filas / duracion:.0f} filas/s)")
+    assert resumen['insertados'] == filas and resumen['con_error'] == 0
+    assert Articulo.query.count() == filas
+
+    # Nueva lista de precios: todas las filas cambian de precio
+    lineas = [linea.replace('.5\n', '.9\n') for linea in lineas]
+    inicio = time.perf_counter()
+    resumen = importar_articulos(lineas)
+    duracion = time.perf_counter() - inicio
+    print(f"{filas} actualizaciones en {duracion:.2f}s ({filas / duracion:.0f} filas/s)")
+    assert resumen['actualizados'] == filas
+
+    # Reimportar la misma lista no escribe nada
+    assert importar_articulos(lineas)['sin_cambios'] == filas
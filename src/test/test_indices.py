@@ -0,0 +1,68 @@
+import re
+from sqlalchemy import event
+import pytest
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento, HistorialInventario
+from api.pagination import codificar_cursor, Orden
+
+# Un SCAN sin índice sobre una de estas tablas es un recorrido completo
+SCAN_COMPLETO = re.compile(r"\bSCAN (articulos|historial_inventario|snapshots_stock)\b(?! USING (COVERING )?INDEX)")
+
+
+@pytest.fixture(autouse=True)
+def datos(app):
+    db.session.add_all([Categoria(categoria='Electrónica'), Categoria(categoria='Hogar'),
+                        Proveedor(proveedor='Tech Supplier'), Proveedor(proveedor='Global Electronics'),
+                        TipoMovimiento(tipo='Ingreso'), TipoMovimiento(tipo='Egreso')])
+    db.session.flush()
+    for i in range(1, 51):
+        db.session.add(Articulo(nombre=f'Articulo {i}', descripcion='', categoria_id=i % 2 + 1,
+                                proveedor_id=i % 2 + 1, stock=i, precio=10.0))
+    db.session.flush()
+    for i in range(200):
+        db.session.add(HistorialInventario(articulo_id=i % 50 + 1, tipo_movimiento_id=1, cantidad=1))
+    db.session.commit()
+
+
+def _cursor(nombre, columna, clave):
+    return codificar_cursor(Orden(nombre, columna, None), clave)
+
+
+# Consultas calientes de los controladores. Las listas se piden con cursor
+# para medir la página genérica (keyset), no sólo la primera.
+CONSULTAS = [
+    ("articulos por categoría", "get", "/api/articulos?categoria_id=1&cursor=" + _cursor("id", None, [10]), None),
+    ("articulos por proveedor", "get", "/api/articulos?proveedor_id=2&cursor=" + _cursor("id", None, [10]), None),
+    ("articulos por rango de stock", "get", "/api/articulos?stock_min=5&stock_max=9&sort=stock", None),
+    ("articulo por id", "get", "/api/articulos/7", None),
+    ("historial por artículo y fecha", "get", "/api/historial_inventario?articulo_id=3&sort=-fecha_movimiento", None),
+    ("historial por rango de fechas", "get", "/api/historial_inventario?desde=2000-01-01T00:00:00&hasta=2000-02-01T00:00:00&sort=fecha_movimiento", None),
+    ("historial por tipo de movimiento", "get", "/api/historial_inventario?tipo_movimiento_id=2", None),
+    ("exportar historial por fechas", "get", "/api/historial_inventario/exportar?desde=2000-01-01T00:00:00&hasta=2000-02-01T00:00:00", None),
+    ("stock a una fecha", "get", "/api/articulos/3/stock?fecha=2000-01-01T00:00:00", None),
+    ("registrar egreso", "post", "/api/historial_inventario", {'articulo_id': 5, 'tipo_movimiento_id': 2, 'cantidad': 1}),
+    ("borrar artículo con historial", "delete", "/api/articulos/4", None),
+    ("borrar movimiento", "delete", "/api/historial_inventario/5", None),
+]
+
+
+@pytest.mark.parametrize("descripcion,metodo,url,cuerpo", CONSULTAS, ids=[c[0] for c in CONSULTAS])
+def test_plan_sin_recorrido_completo(app, descripcion, metodo, url, cuerpo):
+    sentencias = []
+
+    def capturar(conn, cursor, sentencia, parametros, context, executemany):
+        if not executemany and sentencia.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            sentencias.append((sentencia, parametros))
+
+    event.listen(db.engine, "before_cursor_execute", capturar)
+    try:
+        response = getattr(app.test_client(), metodo)(url, json=cuerpo)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capturar)
+    assert response.status_code < 400, response.get_data(as_text=True)
+    assert sentencias
+
+    for sentencia, parametros in sentencias:
+        plan = db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + sentencia, parametros).all()
+        detalle = "\n".join(fila[-1] for fila in plan)
+        print(f"{sentencia}\n{detalle}\n")
+        assert not SCAN_COMPLETO.search(detalle), f"{descripcion}: recorrido completo\n{sentencia}\n{detalle}"
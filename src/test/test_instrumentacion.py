@@ -0,0 +1,81 @@
+import logging
+import pytest
+from sqlalchemy.exc import OperationalError
+from api.models import db, Articulo, Categoria
+
+
+# Aplicación propia: el umbral de sentencias repetidas y la cabecera
+# dependen de la configuración de cada prueba
+@pytest.fixture
+def app(app_configurada):
+    with app_configurada.app_context():
+        db.session.add(Categoria(categoria='Electrónica'))
+        db.session.add_all([Articulo(nombre=f'Articulo {i}', descripcion='', categoria_id=1, proveedor_id=1, stock=i, precio=1.0) for i in range(1, 21)])
+        db.session.commit()
+    return app_configurada
+
+
+def _server_timing(response):
+    metricas = {}
+    for entrada in response.headers['Server-Timing'].split(', '):
+        nombre, *atributos = entrada.split(';')
+        metricas[nombre] = dict(atributo.split('=', 1) for atributo in atributos)
+    return metricas
+
+
+#Cada respuesta lleva consultas y tiempos en la cabecera Server-Timing
+def test_cabecera_server_timing(client, crear_app):
+    response = client.get('/api/articulos')
+    print(response.headers['Server-Timing'])
+    metricas = _server_timing(response)
+    assert set(metricas) == {'db', 'ser', 'app'}
+    assert metricas['db']['desc'] == '"2 consultas"'
+    assert float(metricas['ser']['dur']) > 0
+    assert float(metricas['app']['dur']) >= float(metricas['db']['dur'])
+
+    # Un movimiento rechazado hace sus consultas y ninguna serialización
+    response = client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 1})
+    assert response.status_code == 404
+    assert float(_server_timing(response)['ser']['dur']) == 0
+
+    assert 'Server-Timing' not in crear_app(SERVER_TIMING=False).test_client().get('/api/articulos').headers
+
+#Una sentencia que falla no deja su marca de inicio en la conexión
+def test_consulta_fallida_no_deja_marca(app):
+    with app.app_context():
+        with db.engine.connect() as conexion:
+            with pytest.raises(OperationalError):
+                conexion.execute(db.text('SELECT * FROM no_existe'))
+            assert '_inicio_consulta' not in conexion.info
+            conexion.execute(db.text('SELECT 1'))
+            assert '_inicio_consulta' not in conexion.info
+
+#Las peticiones lentas y las sentencias repetidas se registran en el log
+@pytest.mark.parametrize('app_configurada', [{'UMBRAL_PETICION_LENTA_MS': 0, 'UMBRAL_SENTENCIAS_REPETIDAS': 5}], indirect=True)
+def test_log_peticion_lenta_y_n_mas_1(app, caplog):
+
+    @app.route('/prueba/n_mas_1')
+    def n_mas_1():
+        # Carga perezosa del historial de cada artículo: una consulta por fila
+        articulos = db.session.scalars(db.select(Articulo)).all()
+        return {'movimientos': sum(len(articulo.historial) for articulo in articulos)}
+
+    with caplog.at_level(logging.WARNING, logger='api.peticiones'):
+        app.test_client().get('/api/categorias')
+        app.test_client().get('/prueba/n_mas_1')
+    mensajes = [registro.getMessage() for registro in caplog.records]
+    print(mensajes)
+    assert any(m.startswith('Petición lenta: GET /api/categorias -> 200') for m in mensajes)
+    assert any(m.startswith('Posible N+1: GET /prueba/n_mas_1 ejecutó 20 veces') for m in mensajes)
+    assert not any('Posible N+1: GET /api/categorias' in m for m in mensajes)
+
+#Un lote de movimientos no repite sentencias por movimiento
+def test_lote_sin_n_mas_1(client, caplog):
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    with caplog.at_level(logging.WARNING, logger='api.peticiones'):
+        response = client.post('/api/historial_inventario/lote', json=[
+            {'articulo_id': 1 + i % 20, 'tipo_movimiento_id': 1, 'cantidad': 1} for i in range(100)])
+    assert response.status_code == 201
+    assert [r['historial']['id'] for r in response.get_json()['resultados']] == list(range(1, 101))
+    assert not any('Posible N+1' in registro.getMessage() for registro in caplog.records)
+    assert int(_server_timing(response)['db']['desc'].strip('"').split()[0]) < 20
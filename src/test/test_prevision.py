@@ -0,0 +1,87 @@
+from datetime import date, datetime, time, timedelta
+import pytest
+from api.models import db, Articulo, Categoria, Proveedor, TipoMovimiento, HistorialInventario
+from api.forecast import prevision_stock
+from api.rollups import sumar_movimientos
+
+
+def _hace(dias):
+    return datetime.combine(date.today() - timedelta(days=dias), time(12))
+
+
+@pytest.fixture(autouse=True)
+def datos(app):
+    db.session.add_all([Categoria(categoria='Electrónica'), Categoria(categoria='Hogar'),
+                        Proveedor(proveedor='Tech Supplier'),
+                        TipoMovimiento(tipo='Ingreso'), TipoMovimiento(tipo='Egreso')])
+    db.session.add_all([
+        Articulo(nombre='Laptop ASUS', descripcion='', categoria_id=1, proveedor_id=1, stock=20, precio=1500.0),
+        Articulo(nombre='Mouse', descripcion='', categoria_id=1, proveedor_id=1, stock=5, precio=20.0),
+        Articulo(nombre='Silla', descripcion='', categoria_id=2, proveedor_id=1, stock=8, precio=90.0)
+    ])
+    # Artículo 1: 2 unidades diarias durante 10 días, y un egreso antiguo
+    # fuera de la ventana. Artículo 2: 10 unidades en un solo día y un
+    # ingreso, que no cuenta. Artículo 3: sin egresos.
+    movimientos = [HistorialInventario(articulo_id=1, tipo_movimiento_id=2, cantidad=2, fecha_movimiento=_hace(dia)) for dia in range(10)]
+    movimientos += [
+        HistorialInventario(articulo_id=1, tipo_movimiento_id=2, cantidad=50, fecha_movimiento=_hace(40)),
+        HistorialInventario(articulo_id=2, tipo_movimiento_id=2, cantidad=10, fecha_movimiento=_hace(3)),
+        HistorialInventario(articulo_id=2, tipo_movimiento_id=1, cantidad=30, fecha_movimiento=_hace(2)),
+        HistorialInventario(articulo_id=3, tipo_movimiento_id=1, cantidad=5, fecha_movimiento=_hace(1))
+    ]
+    db.session.add_all(movimientos)
+    db.session.flush()
+    sumar_movimientos(movimientos)
+    db.session.commit()
+
+
+#Consumo, días hasta agotar, punto de pedido y cantidad sugerida por artículo
+@pytest.mark.parametrize('usar_numpy', [True, False])
+def test_prevision_stock(app, usar_numpy):
+    if usar_numpy:
+        pytest.importorskip('numpy')
+    previsiones = prevision_stock(ventana=10, plazo=7, cobertura=30, usar_numpy=usar_numpy)
+    assert [p['articulo_id'] for p in previsiones] == [1, 2, 3]
+    regular, puntual, sin_consumo = previsiones
+
+    assert regular['consumo_diario'] == 2.0
+    assert regular['desviacion_diaria'] == 0.0
+    assert regular['dias_hasta_agotar'] == 10.0
+    assert regular['punto_pedido'] == 14
+    assert regular['reponer'] is False and regular['cantidad_sugerida'] == 0
+
+    # 10 unidades en 1 de 10 días: media 1, desviación 3
+    assert puntual['consumo_diario'] == 1.0
+    assert puntual['desviacion_diaria'] == 3.0
+    assert puntual['dias_hasta_agotar'] == 5.0
+    assert puntual['punto_pedido'] == 21
+    assert puntual['reponer'] is True and puntual['cantidad_sugerida'] == 46
+
+    assert sin_consumo['consumo_diario'] == 0.0
+    assert sin_consumo['dias_hasta_agotar'] is None
+    assert sin_consumo['reponer'] is False
+
+#La previsión sale del resumen diario: sin él no hay consumo
+def test_prevision_lee_resumen(app):
+    db.session.execute(db.text('DELETE FROM resumen_movimientos'))
+    assert all(p['consumo_diario'] == 0.0 for p in prevision_stock(ventana=10))
+
+#El cálculo con numpy y el de Python dan el mismo resultado
+def test_prevision_numpy_y_python(app):
+    pytest.importorskip('numpy')
+    assert prevision_stock(ventana=30, usar_numpy=True) == prevision_stock(ventana=30, usar_numpy=False)
+
+#El endpoint ordena por días hasta agotar y admite filtros
+def test_prevision_endpoint(client):
+    response = client.get('/api/articulos/prevision?ventana=10')
+    assert response.status_code == 200
+    assert [p['articulo_id'] for p in response.get_json()] == [2, 1, 3]
+
+    response = client.get('/api/articulos/prevision?ventana=10&reponer=true')
+    assert [p['articulo_id'] for p in response.get_json()] == [2]
+
+    response = client.get('/api/articulos/prevision?ventana=10&categoria_id=2')
+    assert [p['articulo_id'] for p in response.get_json()] == [3]
+
+    assert client.get('/api/articulos/prevision?ventana=0').status_code == 400
+    assert client.get('/api/articulos/prevision?plazo=-1').status_code == 400
@@ -0,0 +1,106 @@
+import datetime
+import pytest
+from api.models import db, ResumenMovimientos
+from api.rollups import reconstruir_resumen
+
+
+def _resumen():
+    return sorted((r.articulo_id, r.tipo_movimiento_id, r.dia, r.cantidad, r.movimientos)
+                  for r in ResumenMovimientos.query.all())
+
+
+def _fecha(texto):
+    return datetime.datetime.fromisoformat(texto)
+
+
+@pytest.fixture
+def articulo(client, crear_articulo):
+    client.post('/api/tipos_movimiento', json={'tipo': 'Ingreso'})
+    client.post('/api/tipos_movimiento', json={'tipo': 'Egreso'})
+    return crear_articulo(stock=100)
+
+
+#Altas sueltas, en lote y bajas dejan el mismo resumen que una reconstrucción
+def test_resumen_incremental(client, articulo):
+    otro = client.post('/api/articulos', json={'nombre': 'Otro', 'descripcion': 'x', 'categoria_id': 1,
+                                                'proveedor_id': 1, 'stock': 5, 'precio': 1}).get_json()['id']
+    ids = [client.post('/api/historial_inventario', json={'articulo_id': articulo.id, 'tipo_movimiento_id': 1, 'cantidad': n}).get_json()['id']
+           for n in (3, 4)]
+    response = client.post('/api/historial_inventario/lote', json=[
+        {'articulo_id': articulo.id, 'tipo_movimiento_id': 2, 'cantidad': 5},
+        {'articulo_id': articulo.id, 'tipo_movimiento_id': 2, 'cantidad': 1},
+        {'articulo_id': otro, 'tipo_movimiento_id': 1, 'cantidad': 2},
+        {'articulo_id': otro, 'tipo_movimiento_id': 2, 'cantidad': 500}
+    ])
+    assert response.status_code == 207
+    hoy = datetime.date.today()
+    assert _resumen() == [(articulo.id, 1, hoy, 7, 2), (articulo.id, 2, hoy, 6, 2), (otro, 1, hoy, 2, 1)]
+
+    client.delete(f'/api/historial_inventario/{ids[0]}')
+    esperado = [(articulo.id, 1, hoy, 4, 1), (articulo.id, 2, hoy, 6, 2), (otro, 1, hoy, 2, 1)]
+    assert _resumen() == esperado
+    # La fila del día desaparece con su último movimiento
+    client.delete(f'/api/historial_inventario/{ids[1]}')
+    esperado = esperado[1:]
+    assert _resumen() == esperado
+
+    reconstruir_resumen()
+    db.session.commit()
+    assert _resumen() == esperado
+    # Borrar el artículo borra su resumen
+    client.delete(f'/api/articulos/{otro}')
+    assert _resumen() == esperado[:1]
+
+#La serie agrupa los días en semanas ISO y meses naturales
+def test_serie_por_periodo(client, articulo, crear_movimiento):
+    for fecha, tipo, cantidad in [('2026-03-30', 'Ingreso', 10), ('2026-04-02', 'Ingreso', 5),
+                                  ('2026-04-06', 'Egreso', 4), ('2026-04-06', 'Ingreso', 1), ('2026-05-01', 'Egreso', 2)]:
+        crear_movimiento(articulo, tipo=tipo, cantidad=cantidad, fecha=_fecha(fecha))
+
+    url = '/api/historial_inventario/resumen?desde=2026-03-01&hasta=2026-05-31'
+    datos = client.get(url).get_json()
+    assert datos['granularidad'] == 'dia'
+    assert [(s['periodo'], s['tipo_movimiento_id'], s['cantidad']) for s in datos['serie']] == [
+        ('2026-03-30', 1, 10), ('2026-04-02', 1, 5), ('2026-04-06', 1, 1), ('2026-04-06', 2, 4), ('2026-05-01', 2, 2)]
+
+    serie = client.get(url + '&granularidad=semana').get_json()['serie']
+    assert [(s['periodo'], s['tipo_movimiento_id'], s['cantidad'], s['movimientos']) for s in serie] == [
+        ('2026-03-30', 1, 15, 2), ('2026-04-06', 1, 1, 1), ('2026-04-06', 2, 4, 1), ('2026-04-27', 2, 2, 1)]
+
+    serie = client.get(url + '&granularidad=mes&tipo_movimiento_id=1').get_json()['serie']
+    assert [(s['periodo'], s['cantidad']) for s in serie] == [('2026-03-01', 10), ('2026-04-01', 6)]
+
+    # El rango se amplía al periodo completo
+    serie = client.get('/api/historial_inventario/resumen?granularidad=mes&desde=2026-04-15&hasta=2026-04-15').get_json()['serie']
+    assert [(s['periodo'], s['cantidad']) for s in serie] == [('2026-04-01', 6), ('2026-04-01', 4)]
+    assert client.get(f'/api/historial_inventario/resumen?desde=2026-01-01&hasta=2026-12-31&articulo_id={articulo.id + 1}').status_code == 404
+
+#Por defecto los últimos 30 días; parámetros fuera de rango dan 400
+def test_serie_parametros(client, articulo, crear_movimiento):
+    crear_movimiento(articulo, cantidad=2)
+    crear_movimiento(articulo, cantidad=3, fecha=datetime.datetime.now() - datetime.timedelta(days=40))
+    datos = client.get('/api/historial_inventario/resumen').get_json()
+    assert datos['hasta'] == datetime.date.today().isoformat()
+    assert [s['cantidad'] for s in datos['serie']] == [2]
+    assert len(client.get('/api/historial_inventario/resumen?granularidad=mes').get_json()['serie']) == 2
+
+    assert client.get('/api/historial_inventario/resumen?granularidad=hora').status_code == 400
+    assert client.get('/api/historial_inventario/resumen?desde=2026-05-01&hasta=2026-04-01').status_code == 400
+    assert client.get('/api/historial_inventario/resumen?desde=2020-01-01&hasta=2026-01-01').status_code == 400
+    assert client.get('/api/historial_inventario/resumen?granularidad=semana&desde=2020-01-01&hasta=2026-01-01').status_code == 200
+
+#La reconstrucción por rango no toca los días de fuera ni los ya archivados
+def test_reconstruir_por_rango(app, articulo, crear_movimiento):
+    viejo = crear_movimiento(articulo, cantidad=7, fecha=_fecha('2026-01-10 12:00'))
+    crear_movimiento(articulo, cantidad=1, fecha=_fecha('2026-02-10 12:00'))
+    crear_movimiento(articulo, cantidad=2, fecha=_fecha('2026-02-11 23:59:59'))
+    # Como hace el archivo: el movimiento sale del historial sin tocar el resumen
+    db.session.delete(viejo)
+    db.session.execute(db.delete(ResumenMovimientos).where(ResumenMovimientos.dia == datetime.date(2026, 2, 10)))
+    db.session.commit()
+
+    assert reconstruir_resumen(datetime.date(2026, 2, 11), datetime.date(2026, 2, 11)) == 1
+    assert [r[2:] for r in _resumen()] == [(datetime.date(2026, 1, 10), 7, 1), (datetime.date(2026, 2, 11), 2, 1)]
+    assert reconstruir_resumen() == 2
+    assert [r[2:] for r in _resumen()] == [(datetime.date(2026, 1, 10), 7, 1), (datetime.date(2026, 2, 10), 1, 1),
+                                           (datetime.date(2026, 2, 11), 2, 1)]
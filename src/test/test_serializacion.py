@@ -0,0 +1,46 @@
+import datetime
+from json import dumps
+from types import SimpleNamespace
+from flask_restful import fields, marshal
+import pytest
+from api.controllers import articulo_fields, categoria_fields, historial_inventario_fields
+from api.models import Articulo
+from api.serializers import compilar, serializar
+
+FECHA = datetime.datetime(2024, 11, 27, 15, 30, 12, 123456)
+
+CASOS = [
+    (articulo_fields, Articulo(id=1, nombre='Laptop ASUS', descripcion='Electrónica ñ', categoria_id=1, proveedor_id=2, stock=10, precio=1500.0)),
+    (articulo_fields, Articulo(id=2, nombre='Sin descripción', descripcion=None, categoria_id=1, proveedor_id=1, stock=0, precio=3)),
+    (articulo_fields, {"message": "Artículo eliminado"}),
+    (articulo_fields, None),
+    (categoria_fields, SimpleNamespace(id="7", categoria=12)),
+    (historial_inventario_fields, SimpleNamespace(id=1, articulo_id=1, tipo_movimiento_id=2, cantidad=5, fecha_movimiento=FECHA)),
+    (historial_inventario_fields, {"id": 1, "articulo_id": 1, "tipo_movimiento_id": 2, "cantidad": None, "fecha_movimiento": None}),
+    ({"fecha": fields.DateTime(dt_format='iso8601'), "total": fields.Integer(default=-1)}, {"fecha": FECHA}),
+    ({"fecha": fields.DateTime}, {"fecha": datetime.datetime(1999, 2, 3, 4, 5, 6)}),
+    ({"fecha": fields.DateTime}, {"fecha": datetime.datetime(2024, 1, 1, 1, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=3)))}),
+    ({"id": fields.Integer, "categoria": fields.Nested(categoria_fields), "activo": fields.Boolean},
+     {"id": 3, "categoria": {"id": 1, "categoria": "Hogar"}, "activo": 1}),
+    ({"categoria": fields.Nested(categoria_fields)}, {"categoria": None}),
+    ({"categoria": fields.Nested(categoria_fields, allow_null=True)}, {"categoria": None}),
+    ({"historial": fields.List(fields.Nested(historial_inventario_fields))},
+     SimpleNamespace(historial=[SimpleNamespace(id=1, articulo_id=1, tipo_movimiento_id=2, cantidad=5, fecha_movimiento=FECHA)])),
+    ({"historial": fields.List(fields.Nested(historial_inventario_fields))}, {"historial": []}),
+    ({"historial": fields.List(fields.Nested(historial_inventario_fields))}, {"historial": None}),
+]
+
+
+#El serializador compilado produce exactamente la misma salida que marshal
+@pytest.mark.parametrize("campos,obj", CASOS)
+def test_serializar_igual_que_marshal(campos, obj):
+    esperado = marshal(obj, campos)
+    obtenido = compilar(campos)(obj)
+    assert dumps(obtenido) == dumps(esperado)
+    assert list(obtenido) == list(esperado)
+
+
+#Listas y tuplas se serializan elemento a elemento
+def test_serializar_lista():
+    filas = [SimpleNamespace(id=i, categoria=f'Categoria {i}') for i in range(3)]
+    assert serializar(filas, categoria_fields) == [dict(marshal(f, categoria_fields)) for f in filas]
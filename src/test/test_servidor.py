@@ -0,0 +1,67 @@
+import pytest
+from api.models import db, Categoria, TipoMovimiento
+from api.cache import cache_categorias
+from api.versions import registrar_cambio
+from api.warmup import calentar, tras_fork, al_salir
+import servidor
+
+
+@pytest.fixture
+def app(app_configurada):
+    with app_configurada.app_context():
+        db.session.add_all([Categoria(categoria='Electrónica'), TipoMovimiento(tipo='Ingreso')])
+        db.session.commit()
+    return app_configurada
+
+
+#El calentamiento deja las cachés de referencia llenas antes del fork
+def test_calentar(app):
+    estados = calentar(app)
+    assert estados['/api/categorias'] == 200
+    assert estados['/api/articulos/1'] == 404
+    assert all(estado in (200, 404) for estado in estados.values())
+    fallos = cache_categorias.metricas()['fallos']
+    app.test_client().get('/api/categorias')
+    assert cache_categorias.metricas()['fallos'] == fallos
+
+#Cada worker tiene conexiones propias y su propio feed
+@pytest.mark.parametrize('app_configurada', [{'en_disco': True, 'MOVIMIENTOS_GROUP_COMMIT': True}], indirect=True)
+def test_tras_fork(app):
+    feed = app.extensions['feed_stock']
+    tras_fork(app)
+    assert app.extensions['feed_stock'] is not feed
+    client = app.test_client()
+    assert client.get('/api/categorias').get_json() == [{'id': 1, 'categoria': 'Electrónica'}]
+    response = client.post('/api/historial_inventario', json={'articulo_id': 1, 'tipo_movimiento_id': 1, 'cantidad': 1})
+    assert response.status_code == 404
+    al_salir(app, 5)
+
+#Un cambio hecho por otro proceso vacía las cachés de referencia de este
+@pytest.mark.parametrize('app_configurada', [{'CACHE_SINCRONIZACION_S': 0}], indirect=True)
+def test_sincronizacion_entre_procesos(app):
+    client = app.test_client()
+    assert client.get('/api/categorias/1').get_json()['categoria'] == 'Electrónica'
+    with app.app_context():
+        # Lo que haría otro worker: escribir sin invalidar la caché de éste
+        db.session.execute(db.update(Categoria).where(Categoria.id == 1).values(categoria='Hogar'))
+        registrar_cambio('categorias', 1)
+        db.session.commit()
+    assert client.get('/api/categorias/1').get_json()['categoria'] == 'Hogar'
+    assert client.get('/api/categorias').get_json()[0]['categoria'] == 'Hogar'
+
+#servidor.py: configuración de gunicorn y base compartida entre workers
+def test_configuracion_servidor(monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    opciones = servidor.argumentos(['--workers', '3', '--max-requests', '1000', '--conexiones-sse', '10'])
+    assert opciones.workers == 3
+    configuracion = servidor.configuracion(opciones, None)
+    assert configuracion['preload_app'] and configuracion['worker_class'] == 'gthread'
+    # Hilos propios para las conexiones SSE además de los de las peticiones
+    assert configuracion['threads'] == 4 + 10
+    assert configuracion['max_requests_jitter'] == 100
+    assert servidor.argumentos([]).workers == servidor.nucleos()
+
+def test_servidor_sin_base_en_memoria(monkeypatch):
+    monkeypatch.setenv('FLASK_SQLALCHEMY_DATABASE_URI', 'sqlite:///:memory:')
+    with pytest.raises(SystemExit):
+        servidor.preparar(servidor.argumentos(['--workers', '2']))